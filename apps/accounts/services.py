@@ -0,0 +1,153 @@
+import hashlib
+import hmac
+import logging
+import secrets
+import time
+from datetime import timedelta
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from accounts.models import LoginOTP
+
+logger = logging.getLogger(__name__)
+
+OTP_BUCKET_KEY = "otp:bucket:{scope}:{purpose}:{value}"
+
+
+class OTPRateLimited(Exception):
+    """
+    درخواست OTP بیش از سقف مجاز؛ retry_after ثانیه تا آزاد شدن توکن بعدی است.
+    """
+
+    def __init__(self, scope: str, retry_after: int):
+        super().__init__(f"OTP rate limited by {scope}")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+def _make_otp_code(length: int = 6) -> str:
+    # فقط عددی
+    return "".join(secrets.choice("0123456789") for _ in range(length))
+
+
+def _hash_code(code: str, salt: str) -> str:
+    # sha256(code + ":" + salt)
+    return hashlib.sha256(f"{code}:{salt}".encode("utf-8")).hexdigest()
+
+
+def verify_otp_code(otp: LoginOTP, code: str) -> bool:
+    """
+    مقایسه کد واردشده با هش ذخیره‌شده OTP در زمان ثابت؛ شمارش تلاش‌ها با فراخواننده است.
+    """
+    return hmac.compare_digest(_hash_code(str(code), otp.salt), otp.code_hash)
+
+
+def _bucket_limits(scope: str) -> Tuple[int, int]:
+    """
+    (ظرفیت، ثانیه لازم برای پر شدن یک توکن) برای هر دامنه.
+    """
+    if scope == "phone":
+        return (
+            int(getattr(settings, "OTP_PHONE_BURST", 3)),
+            int(getattr(settings, "OTP_PHONE_REFILL_SECONDS", 60)),
+        )
+    return (
+        int(getattr(settings, "OTP_IP_BURST", 20)),
+        int(getattr(settings, "OTP_IP_REFILL_SECONDS", 15)),
+    )
+
+
+def _take_token(scope: str, purpose: str, value: str, now: float) -> int:
+    """
+    یک توکن از سطل (scope, purpose, value) در کش برمی‌دارد. صفر یعنی مجاز، در غیر این صورت
+    ثانیه‌های لازم تا توکن بعدی. سطل در کش مشترک همه workerهاست (CACHES، بررسی core.E001)؛
+    با کش درون‌پروسه‌ای سقف در تعداد workerها ضرب می‌شد. خواندن و نوشتن اتمیک نیست؛ در رقابت
+    هم‌زمان حداکثر چند درخواست اضافه رد نمی‌شوند که برای این محدودکننده قابل قبول است.
+    """
+    capacity, refill_seconds = _bucket_limits(scope)
+    key = OTP_BUCKET_KEY.format(scope=scope, purpose=purpose, value=value)
+    tokens, updated_at = cache.get(key) or (capacity, now)
+    tokens = min(capacity, tokens + (now - updated_at) / refill_seconds)
+    if tokens < 1:
+        return max(1, int((1 - tokens) * refill_seconds + 0.999))
+    cache.set(key, (tokens - 1, now), capacity * refill_seconds)
+    return 0
+
+
+def _db_retry_after(scope: str, purpose: str, value: str) -> int:
+    """
+    جایگزین کم‌دقت‌تر وقتی backend کش مشترک (Redis یا جدول کش) خطا می‌دهد: برای شماره، حداقل فاصله بین دو صدور؛
+    برای IP، تعداد صدورها در بازه پر شدن کامل سطل.
+    """
+    capacity, refill_seconds = _bucket_limits(scope)
+    now = timezone.now()
+    otps = LoginOTP.objects.filter(purpose=purpose)
+    if scope == "phone":
+        last = otps.filter(phone=value).order_by("-created_at").values_list("created_at", flat=True).first()
+        if last and (now - last).total_seconds() < refill_seconds:
+            return max(1, int(refill_seconds - (now - last).total_seconds()))
+        return 0
+    window_start = now - timedelta(seconds=capacity * refill_seconds)
+    if otps.filter(ip=value, created_at__gte=window_start).count() >= capacity:
+        return refill_seconds
+    return 0
+
+
+def check_otp_rate(phone: str, purpose: str, ip: Optional[str] = None) -> None:
+    """
+    محدودکننده token bucket برای صدور OTP به ازای (شماره، هدف) و (IP، هدف).
+    باید قبل از هر insert یا ارسال پیامک صدا زده شود؛ در صورت عبور از سقف OTPRateLimited می‌دهد.
+    """
+    checks = [("phone", phone)]
+    if ip:
+        checks.append(("ip", ip))
+    now = time.time()
+    for scope, value in checks:
+        try:
+            retry_after = _take_token(scope, purpose, value, now)
+        except Exception:
+            logger.warning("OTP limiter cache unavailable; falling back to DB for %s", scope, exc_info=True)
+            retry_after = _db_retry_after(scope, purpose, value)
+        if retry_after:
+            raise OTPRateLimited(scope, retry_after)
+
+
+def issue_login_otp(
+    phone: str, purpose: str, ip: Optional[str] = None, user_agent: str = ""
+) -> Tuple[LoginOTP, str]:
+    """
+    صدور OTP پس از عبور از محدودکننده. اگر OTP معتبر و مصرف‌نشده‌ای برای همین شماره و هدف
+    وجود داشته باشد، همان ردیف با کد تازه به‌روز می‌شود (کد فقط هش‌شده ذخیره شده و قابل ارسال
+    دوباره نیست) و ردیف جدیدی ساخته نمی‌شود. خروجی: (ردیف، کد خام برای پیامک).
+    """
+    check_otp_rate(phone, purpose, ip)
+
+    now = timezone.now()
+    ttl_seconds = int(getattr(settings, "LOGIN_OTP_TTL_SECONDS", 120))
+    raw_code = _make_otp_code(length=6)
+    salt = secrets.token_hex(8)
+    fields = {
+        "code_hash": _hash_code(raw_code, salt),
+        "salt": salt,
+        "created_at": now,
+        "expires_at": now + timedelta(seconds=ttl_seconds),
+        "ip": ip,
+        "user_agent": (user_agent or "")[:240],
+    }
+
+    otp = (
+        LoginOTP.objects.filter(phone=phone, purpose=purpose, is_used=False, expires_at__gt=now)
+        .order_by("-created_at")
+        .first()
+    )
+    if otp is not None and otp.attempts < otp.max_attempts:
+        for name, value in fields.items():
+            setattr(otp, name, value)
+        otp.save(update_fields=list(fields))
+        return otp, raw_code
+
+    otp = LoginOTP.objects.create(phone=phone, purpose=purpose, **fields)
+    return otp, raw_code
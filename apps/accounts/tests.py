@@ -1,3 +1,50 @@
-from django.test import TestCase
+from unittest.mock import patch
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from accounts.models import LoginOTP
+from accounts.services import OTPRateLimited, check_otp_rate, issue_login_otp, verify_otp_code
+
+
+@override_settings(SMS_MODE="mock", OTP_PHONE_BURST=2, OTP_PHONE_REFILL_SECONDS=60, OTP_IP_BURST=3)
+class LoginOTPRateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("accounts:loginotp-list")
+
+    @patch("accounts.views.sms.send_otp")
+    def test_reuses_valid_otp_and_rejects_excess_before_insert_or_sms(self, send_otp):
+        first = self.client.post(self.url, {"phone": "09120000001"})
+        second = self.client.post(self.url, {"phone": "09120000001"})
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertEqual(first.data["id"], second.data["id"])
+        self.assertEqual(LoginOTP.objects.count(), 1)
+        self.assertNotEqual(first.data["debug_code"], second.data["debug_code"])
+        self.assertEqual(send_otp.call_count, 2)
+
+        third = self.client.post(self.url, {"phone": "09120000001"})
+        self.assertEqual(third.status_code, 429)
+        self.assertGreater(int(third["Retry-After"]), 0)
+        self.assertEqual(send_otp.call_count, 2)
+        self.assertEqual(LoginOTP.objects.count(), 1)
+
+        # سقف IP مستقل از شماره: درخواست چهارم از همان IP با شماره دیگر هم رد می‌شود
+        self.assertEqual(self.client.post(self.url, {"phone": "09120000002"}).status_code, 201)
+        self.assertEqual(self.client.post(self.url, {"phone": "09120000003"}).status_code, 429)
+
+    def test_falls_back_to_db_when_cache_is_down(self):
+        LoginOTP.objects.create(
+            phone="09120000009", purpose="LOGIN", code_hash="x", salt="y", expires_at="2999-01-01T00:00:00Z"
+        )
+        with patch("accounts.services.cache.get", side_effect=ConnectionError("cache down")):
+            with self.assertRaises(OTPRateLimited) as ctx:
+                check_otp_rate("09120000009", "LOGIN")
+            self.assertEqual(ctx.exception.scope, "phone")
+            check_otp_rate("09120000010", "LOGIN")
+
+    def test_verify_otp_code_checks_the_salted_hash(self):
+        otp, code = issue_login_otp("09120000011", "LOGIN")
+        self.assertTrue(verify_otp_code(otp, code))
+        self.assertFalse(verify_otp_code(otp, "x" + code[1:]))
@@ -1,13 +1,11 @@
-import hashlib
-import secrets
 from django.contrib.auth import get_user_model
 from rest_framework import serializers, status, viewsets
 from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.utils import timezone
-from datetime import timedelta
 from accounts.models import LoginOTP, TelegramUser, UserDevice
+from accounts.services import OTPRateLimited, _hash_code, issue_login_otp, verify_otp_code
 from orders.models import Order
 from orders.services import ACTIVE_ORDER_STATUSES
 from integrations.services import sms
@@ -141,16 +139,6 @@ class TelegramUserViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAdminUser]
 
 
-def _make_otp_code(length: int = 6) -> str:
-    # فقط عددی
-    return "".join(secrets.choice("0123456789") for _ in range(length))
-
-
-def _hash_code(code: str, salt: str) -> str:
-    # sha256(code + ":" + salt)
-    return hashlib.sha256(f"{code}:{salt}".encode("utf-8")).hexdigest()
-
-
 class LoginOTPViewSet(viewsets.ModelViewSet):
     queryset = LoginOTP.objects.all().order_by("-created_at")
     serializer_class = LoginOTPSerializer
@@ -168,29 +156,19 @@ class LoginOTPViewSet(viewsets.ModelViewSet):
         if not phone:
             return Response({"ok": False, "error": "phone is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # TTL از تنظیمات یا پیش‌فرض
-        ttl_seconds = int(getattr(settings, "LOGIN_OTP_TTL_SECONDS", 120))
-        expires_at = timezone.now() + timedelta(seconds=ttl_seconds)
-
-        # تولید کد و هش
-        raw_code = _make_otp_code(length=6)
-        salt = secrets.token_hex(8)
-        code_hash = _hash_code(raw_code, salt)
-
         # IP و UA
         ip = request.META.get("HTTP_CF_CONNECTING_IP") or request.META.get("REMOTE_ADDR")
-        user_agent = request.META.get("HTTP_USER_AGENT", "")[:500]
-
-        # ایجاد رکورد (فرانت نباید code_hash/salt/expires_at بدهد؛ اینجا ساخته می‌شود)
-        otp = LoginOTP.objects.create(
-            phone=phone,
-            purpose=purpose,
-            code_hash=code_hash,
-            salt=salt,
-            expires_at=expires_at,
-            ip=ip,
-            user_agent=user_agent,
-        )
+        user_agent = request.META.get("HTTP_USER_AGENT", "")
+
+        # محدودکننده قبل از هر insert/پیامک؛ OTP معتبر قبلی با کد تازه دوباره استفاده می‌شود
+        try:
+            otp, raw_code = issue_login_otp(phone=phone, purpose=purpose, ip=ip, user_agent=user_agent)
+        except OTPRateLimited as exc:
+            return Response(
+                {"ok": False, "error": "too_many_requests", "retry_after": exc.retry_after},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(exc.retry_after)},
+            )
 
         # ارسال پیامک (real یا mock)
         try:
@@ -251,7 +229,7 @@ class VerifyLoginView(APIView):
         if now > otp.expires_at:
             return Response({"ok": False, "error": "otp_expired"}, status=status.HTTP_400_BAD_REQUEST)
 
-        if _hash_code(code, otp.salt) != otp.code_hash:
+        if not verify_otp_code(otp, code):
             otp.attempts += 1
             otp.save(update_fields=["attempts"])
             return Response({"ok": False, "error": "invalid_code"}, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,188 @@
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterable, Optional
+
+import requests
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from catalog.models import ProductImage
+from core.models import MediaAsset
+
+logger = logging.getLogger(__name__)
+
+# عرض حداکثر هر نسخه (ارتفاع با حفظ نسبت). تصویر کوچک‌تر از این بزرگ نمی‌شود.
+IMAGE_VARIANTS = {
+    "thumb": 160,
+    "card": 480,
+    "full": 1280,
+}
+IMAGE_FORMATS = {
+    "webp": {"format": "WEBP", "ext": "webp", "options": {"quality": 80, "method": 4}},
+    "jpeg": {"format": "JPEG", "ext": "jpg", "options": {"quality": 82, "optimize": True, "progressive": True}},
+}
+DEFAULT_FORMAT = "webp"
+VARIANT_STORAGE_PREFIX = "images/variants"
+MAX_SOURCE_BYTES = 20 * 1024 * 1024
+
+
+def render_variants(source: bytes) -> Dict[str, Dict[str, dict]]:
+    """
+    ساخت نسخه‌های thumb/card/full با فرمت webp و jpeg از تصویر اصلی.
+    در process pool اجرا می‌شود؛ ورودی و خروجی فقط bytes/dict هستند.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(source)) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ("RGB", "RGBA"):
+            original = original.convert("RGBA" if "transparency" in original.info else "RGB")
+
+        rendered: Dict[str, Dict[str, dict]] = {}
+        for variant, max_width in IMAGE_VARIANTS.items():
+            image = original.copy()
+            if image.width > max_width:
+                height = max(1, round(image.height * max_width / image.width))
+                image = image.resize((max_width, height), Image.LANCZOS)
+
+            rendered[variant] = {}
+            for fmt, spec in IMAGE_FORMATS.items():
+                frame = image.convert("RGB") if spec["format"] == "JPEG" and image.mode != "RGB" else image
+                buffer = io.BytesIO()
+                frame.save(buffer, spec["format"], **spec["options"])
+                rendered[variant][fmt] = {"content": buffer.getvalue(), "width": image.width, "height": image.height}
+    return rendered
+
+
+def _content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()[:20]
+
+
+def _absolute_url(url: str) -> str:
+    if url.startswith(("http://", "https://")):
+        return url
+    base_url = getattr(settings, "SITE_BASE_URL", "") or ""
+    return f"{base_url.rstrip('/')}/{url.lstrip('/')}" if base_url else url
+
+
+def _store_variant(content: bytes, ext: str) -> dict:
+    """
+    فایل با هش محتوا نام‌گذاری می‌شود؛ آدرس هر نسخه تغییرناپذیر است و می‌توان آن را طولانی‌مدت کش کرد.
+    """
+    content_hash = _content_hash(content)
+    name = f"{VARIANT_STORAGE_PREFIX}/{content_hash[:2]}/{content_hash}.{ext}"
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(content))
+    return {"url": _absolute_url(default_storage.url(name)), "hash": content_hash, "bytes": len(content)}
+
+
+def _download(url: str) -> Optional[bytes]:
+    try:
+        response = requests.get(url, timeout=15, stream=True)
+        response.raise_for_status()
+        content = response.raw.read(MAX_SOURCE_BYTES + 1, decode_content=True)
+    except Exception as exc:  # pragma: no cover - network side-effect
+        logger.warning("Failed to download product image %s: %s", url, exc)
+        return None
+    if len(content) > MAX_SOURCE_BYTES:
+        logger.warning("Product image %s is larger than %s bytes; skipped", url, MAX_SOURCE_BYTES)
+        return None
+    return content
+
+
+def _save_variants(product_image: ProductImage, source: bytes, rendered: Dict[str, Dict[str, dict]]) -> MediaAsset:
+    variants = {}
+    for variant, formats in rendered.items():
+        variants[variant] = {}
+        for fmt, data in formats.items():
+            stored = _store_variant(data["content"], IMAGE_FORMATS[fmt]["ext"])
+            variants[variant][fmt] = {**stored, "width": data["width"], "height": data["height"]}
+
+    asset = product_image.media_asset or MediaAsset(asset_type=MediaAsset.ASSET_IMAGE)
+    asset.title = asset.title or (product_image.alt_text or f"product:{product_image.product_id}")[:160]
+    asset.url = product_image.image_url
+    asset.meta = {
+        **(asset.meta or {}),
+        "source": "product_image",
+        "product_image_id": product_image.id,
+        "original_hash": _content_hash(source),
+        "variants": variants,
+    }
+    asset.save()
+    if product_image.media_asset_id != asset.id:
+        product_image.media_asset = asset
+        product_image.save(update_fields=["media_asset"])
+    return asset
+
+
+def build_product_image_variants(
+    images: Iterable[ProductImage], max_workers: Optional[int] = None, force: bool = False
+) -> dict:
+    """
+    دانلود تصاویر اصلی در همین پروسه و ساخت نسخه‌ها در ProcessPoolExecutor.
+    تصاویری که هش تصویر اصلی‌شان تغییر نکرده دوباره پردازش نمی‌شوند (مگر با force).
+    حداکثر دو برابر تعداد workerها تصویر در جریان است تا تصاویر دانلودشده همه با هم در حافظه نمانند.
+    """
+    stats = {"processed": 0, "unchanged": 0, "failed": 0}
+    max_workers = max_workers or getattr(settings, "IMAGE_VARIANT_WORKERS", None) or os.cpu_count() or 1
+    max_in_flight = max_workers * 2
+
+    def collect(done) -> None:
+        for future in done:
+            product_image, source = in_flight.pop(future)
+            try:
+                _save_variants(product_image, source, future.result())
+                stats["processed"] += 1
+            except Exception as exc:
+                logger.warning("Failed to build variants for product image %s: %s", product_image.id, exc)
+                stats["failed"] += 1
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = {}
+        for product_image in images:
+            source = _download(product_image.image_url)
+            if source is None:
+                stats["failed"] += 1
+                continue
+            meta = product_image.media_asset.meta if product_image.media_asset else None
+            if not force and isinstance(meta, dict) and meta.get("original_hash") == _content_hash(source) and meta.get("variants"):
+                stats["unchanged"] += 1
+                continue
+            in_flight[pool.submit(render_variants, source)] = (product_image, source)
+            if len(in_flight) >= max_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(list(in_flight))
+    return stats
+
+
+def image_variants(product_image: Optional[ProductImage]) -> dict:
+    asset = getattr(product_image, "media_asset", None) if product_image else None
+    meta = asset.meta if asset else None
+    variants = meta.get("variants") if isinstance(meta, dict) else None
+    return variants if isinstance(variants, dict) else {}
+
+
+def variant_url(product_image: Optional[ProductImage], variant: str = "card", fmt: str = DEFAULT_FORMAT) -> str:
+    """
+    آدرس نسخه مناسب یک تصویر؛ اگر نسخه‌ها هنوز ساخته نشده باشند، آدرس اصلی برمی‌گردد.
+    """
+    if not product_image:
+        return ""
+    entry = image_variants(product_image).get(variant) or {}
+    data = entry.get(fmt) or entry.get(DEFAULT_FORMAT) or {}
+    return data.get("url") or product_image.image_url
+
+
+def primary_image(product) -> Optional[ProductImage]:
+    """
+    تصویر اصلی محصول از images پیش‌بارگذاری‌شده (prefetch) بدون کوئری اضافه.
+    """
+    images = list(product.images.all())
+    if not images:
+        return None
+    return min(images, key=lambda image: (not image.is_primary, image.sort_order, image.id))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.images import build_product_image_variants
+from catalog.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = (
+        "Build resized WebP/JPEG variants (thumb/card/full) for product images and record them on MediaAsset.meta. "
+        "Images whose original content hash is unchanged are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--vendor",
+            dest="vendors",
+            action="append",
+            default=[],
+            help="Vendor slug to process (repeatable). Processes all vendors when omitted.",
+        )
+        parser.add_argument("--force", action="store_true", help="Rebuild variants even when the original image is unchanged.")
+        parser.add_argument("--workers", type=int, default=None, help="Process pool size (default: IMAGE_VARIANT_WORKERS or CPU count).")
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.select_related("media_asset").order_by("id")
+        if options["vendors"]:
+            images = images.filter(product__vendor__slug__in=options["vendors"])
+        if options["workers"] is not None and options["workers"] < 1:
+            raise CommandError("--workers must be at least 1.")
+
+        stats = build_product_image_variants(images.iterator(), max_workers=options["workers"], force=options["force"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed {stats['processed']} image(s), unchanged {stats['unchanged']}, failed {stats['failed']}."
+            )
+        )
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.transfer import iter_vendor_records, write_records
+from vendors.models import Vendor
+
+
+class Command(BaseCommand):
+    help = "Stream a vendor catalog (categories, products, variants, option groups/items, links) as CSV or JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--vendor",
+            dest="vendors",
+            action="append",
+            default=[],
+            help="Vendor slug to export (repeatable). Exports all vendors when omitted.",
+        )
+        parser.add_argument("--format", dest="fmt", choices=["csv", "json"], default="csv")
+        parser.add_argument("--output", dest="output", default="-", help="Output file path, or - for stdout.")
+        parser.add_argument("--chunk-size", dest="chunk_size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        vendors = Vendor.objects.order_by("id")
+        if options["vendors"]:
+            vendors = vendors.filter(slug__in=options["vendors"])
+            missing = set(options["vendors"]) - set(vendors.values_list("slug", flat=True))
+            if missing:
+                raise CommandError(f"Unknown vendor slug(s): {', '.join(sorted(missing))}")
+
+        def records():
+            for vendor in vendors.iterator():
+                yield from iter_vendor_records(vendor, chunk_size=options["chunk_size"])
+
+        output = options["output"]
+        if output == "-":
+            count = write_records(records(), self.stdout, options["fmt"])
+        else:
+            with open(output, "w", encoding="utf-8", newline="") as stream:
+                count = write_records(records(), stream, options["fmt"])
+        self.stderr.write(self.style.SUCCESS(f"Exported {count} catalog record(s)."))
@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.transfer import RECORD_TYPES, CatalogTransferError, import_records, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Upsert vendor catalogs from a CSV or JSON Lines file produced by catalog_export. "
+        "Each vendor is imported in its own transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Input file path, or - for stdin.")
+        parser.add_argument("--format", dest="fmt", choices=["csv", "json"], help="Defaults to the file extension.")
+        parser.add_argument("--dry-run", action="store_true", help="Print the diff without writing anything.")
+        parser.add_argument("--chunk-size", dest="chunk_size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["fmt"] or ("json" if path.endswith((".json", ".jsonl")) else "csv")
+        dry_run = options["dry_run"]
+
+        stream = sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+        try:
+            for result in import_records(read_records(stream, fmt), dry_run=dry_run, chunk_size=options["chunk_size"]):
+                if dry_run:
+                    for line in result.diff:
+                        self.stdout.write(line)
+                summary = ", ".join(
+                    f"{record_type}: +{counts['created']} ~{counts['updated']} ={counts['unchanged']}"
+                    for record_type, counts in ((t, result.counts[t]) for t in RECORD_TYPES)
+                    if any(counts.values())
+                )
+                self.stdout.write(self.style.SUCCESS(f"[{result.vendor.slug}] {summary or 'no records'}"))
+        except CatalogTransferError as exc:
+            raise CommandError(str(exc)) from exc
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING("Dry run: no changes were written."))
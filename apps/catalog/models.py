@@ -84,12 +84,19 @@ class Product(models.Model):
 class ProductImage(models.Model):
     """
     تصویر محصول.
-    - MVP: فقط url
-    - Later: ذخیره فایل روی S3/MinIO + thumbnail
+    - image_url: آدرس تصویر اصلی
+    - media_asset: نسخه‌های کوچک‌شده (thumb/card/full) که build_image_variants در meta ثبت می‌کند
     """
 
     product = models.ForeignKey("catalog.Product", on_delete=models.CASCADE, related_name="images")
     image_url = models.URLField(max_length=500)
+    media_asset = models.ForeignKey(
+        "core.MediaAsset",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="product_images",
+    )
     alt_text = models.CharField(max_length=180, blank=True, default="")
     sort_order = models.PositiveIntegerField(default=0)
     is_primary = models.BooleanField(default=False)
@@ -0,0 +1,36 @@
+import time
+
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = "catalog:version:{vendor_id}"
+
+
+def _version_key(vendor_id) -> str:
+    return CATALOG_VERSION_KEY.format(vendor_id=vendor_id)
+
+
+def get_catalog_version(vendor_id) -> int:
+    """
+    نسخه فعلی کاتالوگ یک وندور. کش‌های منو/گزینه‌ها با این نسخه کلید می‌خورند.
+    مقدار اولیه از زمان ساخته می‌شود تا بعد از پاک شدن کش، نسخه تکراری (و داده کهنه) برنگردد.
+    """
+    key = _version_key(vendor_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_catalog_version(vendor_id) -> int:
+    """
+    نسخه کاتالوگ را یک واحد بالا می‌برد؛ برای هر دسته تغییر فقط یک بار صدا زده شود.
+    """
+    key = _version_key(vendor_id)
+    get_catalog_version(vendor_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = int(time.time() * 1000)
+        cache.set(key, version, timeout=None)
+        return version
@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from catalog.models import OptionGroup, OptionItem, Product, ProductOptionGroup
+from catalog.services import bump_catalog_version
+
+
+def _bump_on_commit(vendor_id) -> None:
+    # بعد از commit اجرا می‌شود تا کش با داده قدیمی و نسخه جدید پر نشود
+    if vendor_id:
+        transaction.on_commit(lambda: bump_catalog_version(vendor_id))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def bump_vendor_catalog_version(sender, instance, **kwargs):
+    """
+    هر تغییر محصول (موجودی، قیمت، ترتیب، نام) نسخه کاتالوگ وندور را بالا می‌برد تا کش منوها باطل شود.
+    تغییرات گروهی (queryset.update / bulk_create) خودشان bump_catalog_version را صدا می‌زنند.
+    """
+    _bump_on_commit(instance.vendor_id)
+
+
+@receiver(post_save, sender=OptionGroup)
+@receiver(post_delete, sender=OptionGroup)
+def bump_catalog_version_for_option_group(sender, instance, **kwargs):
+    """
+    قواعد و قیمت گزینه‌ها در قیمت سبد اثر دارند؛ کش قیمت‌گذاری هم با نسخه کاتالوگ کلید می‌خورد.
+    """
+    _bump_on_commit(instance.vendor_id)
+
+
+@receiver(post_save, sender=OptionItem)
+@receiver(post_delete, sender=OptionItem)
+def bump_catalog_version_for_option_item(sender, instance, **kwargs):
+    vendor_id = OptionGroup.objects.filter(pk=instance.group_id).values_list("vendor_id", flat=True).first()
+    _bump_on_commit(vendor_id)
+
+
+@receiver(post_save, sender=ProductOptionGroup)
+@receiver(post_delete, sender=ProductOptionGroup)
+def bump_catalog_version_for_product_option_group(sender, instance, **kwargs):
+    vendor_id = Product.objects.filter(pk=instance.product_id).values_list("vendor_id", flat=True).first()
+    _bump_on_commit(vendor_id)
@@ -1,3 +1,167 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from catalog.images import variant_url
+from catalog.models import OptionGroup, OptionItem, Product, ProductImage, ProductOptionGroup, ProductVariant
+from catalog.services import get_catalog_version
+from vendors.models import Vendor, VendorStaff
+
+# شمارش کوئری‌ها فقط کوئری‌های کاتالوگ را بسنجد، نه خواندن از جدول کش
+LOCAL_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class CatalogTransferCommandTests(TestCase):
+    def setUp(self):
+        self.vendor = Vendor.objects.create(name="Kitchen", slug="kitchen")
+        self.product = Product.objects.create(vendor=self.vendor, name_fa="ساندویچ مرغ", base_price=100000)
+        ProductVariant.objects.create(product=self.product, code="L", name="Large", price_amount=120000)
+        group = OptionGroup.objects.create(vendor=self.vendor, name="سس", max_select=1)
+        OptionItem.objects.create(group=group, name="تهران", price_delta_amount=5000)
+        ProductOptionGroup.objects.create(product=self.product, group=group)
+
+    def _export(self, fmt):
+        out = io.StringIO()
+        call_command("catalog_export", "--vendor", "kitchen", "--format", fmt, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def _import(self, path, *args):
+        out = io.StringIO()
+        call_command("catalog_import", path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_round_trip_is_idempotent_and_dry_run_reports_diff(self):
+        tmp_dir = tempfile.mkdtemp()
+        for fmt, suffix in (("csv", ".csv"), ("json", ".jsonl")):
+            exported = self._export(fmt)
+            path = os.path.join(tmp_dir, f"catalog{suffix}")
+            with open(path, "w", encoding="utf-8") as stream:
+                stream.write(exported.replace("100000", "110000"))
+            try:
+                report = self._import(path, "--dry-run")
+                self.assertIn("~ product ساندویچ مرغ: base_price: 100000 -> 110000", report)
+                self.product.refresh_from_db()
+                self.assertEqual(self.product.base_price, 100000)
+
+                self._import(path)
+                self.product.refresh_from_db()
+                self.assertEqual(self.product.base_price, 110000)
+                self.assertIn("product: +0 ~0 =1", self._import(path))
+            finally:
+                Product.objects.filter(pk=self.product.pk).update(base_price=100000)
+                os.remove(path)
+        os.rmdir(tmp_dir)
+
+        self.assertEqual(ProductVariant.objects.count(), 1)
+        self.assertEqual(OptionItem.objects.count(), 1)
+
+    def test_rejects_duplicate_keys_within_one_file(self):
+        lines = self._export("json").splitlines()
+        product_line = next(index for index, line in enumerate(lines, start=1) if '"type": "product"' in line)
+        lines.append(lines[product_line - 1].replace("100000", "110000"))
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", encoding="utf-8", delete=False) as stream:
+            stream.write("\n".join(lines) + "\n")
+        self.addCleanup(os.remove, stream.name)
+
+        with self.assertRaisesMessage(
+            CommandError, f"line {len(lines)}: duplicate product ساندویچ مرغ (first seen on line {product_line})"
+        ):
+            self._import(stream.name)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.base_price, 100000)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ProductBulkUpdateTests(TestCase):
+    def setUp(self):
+        self.vendor = Vendor.objects.create(name="Kitchen", slug="kitchen")
+        other_vendor = Vendor.objects.create(name="Other", slug="other")
+        self.first = Product.objects.create(vendor=self.vendor, name_fa="اول", base_price=1000)
+        self.second = Product.objects.create(vendor=self.vendor, name_fa="دوم", base_price=2000)
+        self.foreign = Product.objects.create(vendor=other_vendor, name_fa="سوم", base_price=3000)
+        user = User.objects.create_user(phone="09120000000")
+        VendorStaff.objects.create(vendor=self.vendor, user=user)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        self.url = "/api/catalog/products/bulk-update/"
+
+    def test_applies_changes_in_one_update_and_bumps_version_once(self):
+        version = get_catalog_version(self.vendor.id)
+        payload = {
+            "items": [
+                {"id": self.first.id, "is_available": False},
+                {"id": self.second.id, "base_price": 2500},
+            ]
+        }
+        with self.assertNumQueries(3):  # staff lookup, ownership check, UPDATE
+            response = self.client.post(self.url, payload, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["updated"], 2)
+        self.assertEqual(response.data["catalog_version"], version + 1)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertFalse(self.first.is_available)
+        self.assertEqual(self.first.base_price, 1000)
+        self.assertTrue(self.second.is_available)
+        self.assertEqual(self.second.base_price, 2500)
+
+    def test_rejects_products_of_other_vendors(self):
+        response = self.client.post(
+            self.url, {"items": [{"id": self.foreign.id, "is_available": False}]}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["missing_ids"], [self.foreign.id])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), MEDIA_URL="/media/", SITE_BASE_URL="https://cdn.example.com/")
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (2000, 1000), (200, 80, 40)).save(buffer, "PNG")
+        self.source = buffer.getvalue()
+        vendor = Vendor.objects.create(name="Kitchen", slug="kitchen")
+        product = Product.objects.create(vendor=vendor, name_fa="پیتزا", base_price=1000)
+        self.image = ProductImage.objects.create(product=product, image_url="https://img.example.com/pizza.png")
+
+    def _build(self, *args):
+        with mock.patch("catalog.images._download", return_value=self.source):
+            out = io.StringIO()
+            call_command("build_image_variants", "--workers", "1", *args, stdout=out)
+            return out.getvalue()
+
+    def test_builds_content_hashed_variants(self):
+        self.assertIn("Processed 1 image(s)", self._build())
+        self.image.refresh_from_db()
+        variants = self.image.media_asset.meta["variants"]
+
+        self.assertEqual(set(variants), {"thumb", "card", "full"})
+        self.assertEqual((variants["card"]["webp"]["width"], variants["card"]["webp"]["height"]), (480, 240))
+        self.assertEqual(variants["full"]["jpeg"]["width"], 1280)
+        card_url = variant_url(self.image, "card")
+        self.assertTrue(card_url.startswith("https://cdn.example.com/media/images/variants/"))
+        self.assertIn(variants["card"]["webp"]["hash"], card_url)
+
+        self.assertIn("Processed 0 image(s), unchanged 1", self._build())
+        self.assertIn("Processed 1 image(s)", self._build("--force"))
+        self.image.refresh_from_db()
+        self.assertEqual(variant_url(self.image, "card"), card_url)
+
+        # عکس جدید روی همان آدرس: هش تغییر کرده و نسخه‌ها دوباره ساخته می‌شوند
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (2000, 1000), (10, 120, 200)).save(buffer, "PNG")
+        self.source = buffer.getvalue()
+        self.assertIn("Processed 1 image(s)", self._build())
+        self.image.refresh_from_db()
+        self.assertNotEqual(variant_url(self.image, "card"), card_url)
@@ -0,0 +1,444 @@
+import csv
+import json
+from decimal import Decimal
+from itertools import groupby
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+
+from catalog.models import Category, OptionGroup, OptionItem, Product, ProductOptionGroup, ProductVariant
+from catalog.services import bump_catalog_version
+from vendors.models import Vendor
+
+# ترتیب رکوردها مهم است: هر نوع فقط به انواع قبل از خودش ارجاع می‌دهد.
+RECORD_TYPES = ("category", "option_group", "product", "variant", "option_item", "product_option_group")
+
+# ستون فایل -> فیلد مدل. ستون‌های ارجاعی (category/product/group) با نام طبیعی پر می‌شوند، نه id.
+RECORD_FIELDS: Dict[str, List[Tuple[str, str]]] = {
+    "category": [
+        ("name", "name"),
+        ("slug", "slug"),
+        ("description", "description"),
+        ("sort_order", "sort_order"),
+        ("is_active", "is_active"),
+    ],
+    "option_group": [
+        ("name", "name"),
+        ("description", "description"),
+        ("is_required", "is_required"),
+        ("min_select", "min_select"),
+        ("max_select", "max_select"),
+        ("sort_order", "sort_order"),
+        ("is_active", "is_active"),
+    ],
+    "product": [
+        ("name", "name_fa"),
+        ("name_en", "name_en"),
+        ("slug", "slug"),
+        ("category", "category"),
+        ("short_description", "short_description"),
+        ("description", "description"),
+        ("price", "base_price"),
+        ("sort_order", "sort_order"),
+        ("is_active", "is_active"),
+        ("is_available", "is_available"),
+        ("is_available_today", "is_available_today"),
+        ("min_qty", "min_qty"),
+        ("max_qty", "max_qty"),
+        ("calories", "calories"),
+        ("protein_g", "protein_g"),
+        ("carbs_g", "carbs_g"),
+        ("fat_g", "fat_g"),
+    ],
+    "variant": [
+        ("product", "product"),
+        ("code", "code"),
+        ("name", "name"),
+        ("price", "price_amount"),
+        ("sort_order", "sort_order"),
+        ("is_active", "is_active"),
+    ],
+    "option_item": [
+        ("group", "group"),
+        ("name", "name"),
+        ("description", "description"),
+        ("price", "price_delta_amount"),
+        ("sort_order", "sort_order"),
+        ("is_active", "is_active"),
+    ],
+    "product_option_group": [
+        ("product", "product"),
+        ("group", "group"),
+        ("is_required", "is_required"),
+        ("min_select", "min_select"),
+        ("max_select", "max_select"),
+        ("sort_order", "sort_order"),
+        ("is_active", "is_active"),
+    ],
+}
+
+RECORD_MODELS = {
+    "category": Category,
+    "option_group": OptionGroup,
+    "product": Product,
+    "variant": ProductVariant,
+    "option_item": OptionItem,
+    "product_option_group": ProductOptionGroup,
+}
+
+# کلید طبیعی هر نوع، منطبق با unique_together مدل.
+RECORD_KEYS = {
+    "category": ("name",),
+    "option_group": ("name",),
+    "product": ("name_fa",),
+    "variant": ("product", "code"),
+    "option_item": ("group", "name"),
+    "product_option_group": ("product", "group"),
+}
+
+UNIQUE_FIELDS = {
+    "category": ["vendor", "name"],
+    "option_group": ["vendor", "name"],
+    "product": ["vendor", "name_fa"],
+    "variant": ["product", "code"],
+    "option_item": ["group", "name"],
+    "product_option_group": ["product", "group"],
+}
+
+# ستون‌هایی که به رکورد دیگری اشاره می‌کنند: فیلد -> نوع رکورد مقصد
+REFERENCE_FIELDS = {"category": "category", "product": "product", "group": "option_group"}
+
+CSV_COLUMNS = ["type", "vendor"]
+for _fields in RECORD_FIELDS.values():
+    for _column, _ in _fields:
+        if _column not in CSV_COLUMNS:
+            CSV_COLUMNS.append(_column)
+
+
+class CatalogTransferError(Exception):
+    pass
+
+
+# -------------------------
+# Export
+# -------------------------
+
+def _export_querysets(vendor: Vendor):
+    yield "category", Category.objects.filter(vendor=vendor).order_by("sort_order", "id").values(*_value_fields("category"))
+    yield "option_group", (
+        OptionGroup.objects.filter(vendor=vendor).order_by("sort_order", "id").values(*_value_fields("option_group"))
+    )
+    yield "product", (
+        Product.objects.filter(vendor=vendor).order_by("sort_order", "id").values(*_value_fields("product"), "category__name")
+    )
+    yield "variant", (
+        ProductVariant.objects.filter(product__vendor=vendor)
+        .order_by("product_id", "sort_order", "id")
+        .values(*_value_fields("variant"), "product__name_fa")
+    )
+    yield "option_item", (
+        OptionItem.objects.filter(group__vendor=vendor)
+        .order_by("group_id", "sort_order", "id")
+        .values(*_value_fields("option_item"), "group__name")
+    )
+    yield "product_option_group", (
+        ProductOptionGroup.objects.filter(product__vendor=vendor)
+        .order_by("product_id", "sort_order", "id")
+        .values(*_value_fields("product_option_group"), "product__name_fa", "group__name")
+    )
+
+
+def _value_fields(record_type: str) -> List[str]:
+    return [field for _, field in RECORD_FIELDS[record_type] if field not in REFERENCE_FIELDS]
+
+
+def _reference_value(row: dict, field: str) -> Optional[str]:
+    if field == "category":
+        return row.get("category__name")
+    if field == "product":
+        return row.get("product__name_fa")
+    if field == "group":
+        return row.get("group__name")
+    return None
+
+
+def iter_vendor_records(vendor: Vendor, chunk_size: int = 500) -> Iterator[dict]:
+    """
+    رکوردهای کاتالوگ یک وندور را به‌صورت جریانی (با iterator) برمی‌گرداند تا مصرف حافظه ثابت بماند.
+    """
+    for record_type, queryset in _export_querysets(vendor):
+        for row in queryset.iterator(chunk_size=chunk_size):
+            record = {"type": record_type, "vendor": vendor.slug}
+            for column, field in RECORD_FIELDS[record_type]:
+                if field in REFERENCE_FIELDS:
+                    record[column] = _reference_value(row, field)
+                else:
+                    record[column] = row.get(field)
+            yield record
+
+
+def _csv_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def write_records(records: Iterable[dict], stream, fmt: str) -> int:
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(stream, fieldnames=CSV_COLUMNS, lineterminator="\n")
+        writer.writeheader()
+        for record in records:
+            writer.writerow({column: _csv_value(record.get(column)) for column in CSV_COLUMNS})
+            count += 1
+        return count
+
+    for record in records:
+        stream.write(json.dumps({k: _json_value(v) for k, v in record.items()}, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+# -------------------------
+# Import
+# -------------------------
+
+def read_records(stream, fmt: str) -> Iterator[Tuple[int, dict]]:
+    """
+    خواندن جریانی فایل ورودی. خروجی: (شماره خط، رکورد)
+    json به‌صورت JSON Lines (هر خط یک رکورد) خوانده می‌شود.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for line_no, row in enumerate(reader, start=2):
+            yield line_no, row
+        return
+
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            raise CatalogTransferError(f"line {line_no}: invalid JSON ({exc})") from exc
+        if not isinstance(row, dict):
+            raise CatalogTransferError(f"line {line_no}: each line must be a JSON object")
+        yield line_no, row
+
+
+def _clean_record(line_no: int, row: dict) -> dict:
+    record_type = (row.get("type") or "").strip()
+    if record_type not in RECORD_FIELDS:
+        raise CatalogTransferError(f"line {line_no}: unknown record type {record_type!r}")
+
+    model = RECORD_MODELS[record_type]
+    values: Dict[str, Any] = {}
+    for column, field_name in RECORD_FIELDS[record_type]:
+        if column not in row:
+            continue
+        raw = row.get(column)
+        if isinstance(raw, str):
+            raw = raw.strip()
+        if field_name in REFERENCE_FIELDS:
+            values[field_name] = raw or None
+            continue
+
+        field = model._meta.get_field(field_name)
+        if raw in ("", None):
+            values[field_name] = None if field.null else field.get_default()
+            continue
+        if isinstance(raw, str) and isinstance(field, models.BooleanField):
+            raw = raw.lower() in {"1", "true", "t", "yes", "y"}
+        try:
+            values[field_name] = field.to_python(raw)
+        except ValidationError as exc:
+            raise CatalogTransferError(f"line {line_no}: invalid {column}: {'; '.join(exc.messages)}") from exc
+
+    for key_field in RECORD_KEYS[record_type]:
+        if not values.get(key_field):
+            raise CatalogTransferError(f"line {line_no}: {record_type} requires {key_field}")
+
+    return {"type": record_type, "line": line_no, "values": values}
+
+
+def _existing_rows(record_type: str, vendor: Vendor) -> Dict[tuple, dict]:
+    """
+    رکوردهای فعلی را بر اساس کلید طبیعی برمی‌گرداند (یک کوئری برای هر نوع).
+    """
+    rows = {}
+    model = RECORD_MODELS[record_type]
+    fields = ["id"] + _value_fields(record_type)
+    refs = {
+        "category": "category__name",
+        "product": "product__name_fa",
+        "group": "group__name",
+    }
+    ref_fields = [field for _, field in RECORD_FIELDS[record_type] if field in REFERENCE_FIELDS]
+    lookup = {"vendor": vendor} if hasattr(model, "vendor") else {}
+    if record_type in {"variant", "product_option_group"}:
+        lookup = {"product__vendor": vendor}
+    elif record_type == "option_item":
+        lookup = {"group__vendor": vendor}
+
+    for row in model.objects.filter(**lookup).values(*fields, *[refs[f] for f in ref_fields]):
+        current = {field: row[field] for field in fields}
+        for ref in ref_fields:
+            current[ref] = row[refs[ref]]
+        key = tuple(current[field] for field in RECORD_KEYS[record_type])
+        rows[key] = current
+    return rows
+
+
+class VendorImportResult:
+    def __init__(self, vendor: Vendor):
+        self.vendor = vendor
+        self.counts = {record_type: {"created": 0, "updated": 0, "unchanged": 0} for record_type in RECORD_TYPES}
+        self.diff: List[str] = []
+
+
+def _id_maps(vendor: Vendor) -> Dict[str, Dict[str, int]]:
+    return {
+        "category": dict(Category.objects.filter(vendor=vendor).values_list("name", "id")),
+        "product": dict(Product.objects.filter(vendor=vendor).values_list("name_fa", "id")),
+        "option_group": dict(OptionGroup.objects.filter(vendor=vendor).values_list("name", "id")),
+    }
+
+
+def import_vendor_records(vendor: Vendor, records: List[dict], *, dry_run: bool = False, chunk_size: int = 500):
+    """
+    upsert رکوردهای یک وندور با bulk_create(update_conflicts=True) بر اساس unique_together هر مدل.
+    رکوردهای بدون تغییر نوشته نمی‌شوند. در حالت dry_run فقط diff ساخته می‌شود.
+    """
+    result = VendorImportResult(vendor)
+    by_type: Dict[str, List[dict]] = {record_type: [] for record_type in RECORD_TYPES}
+    for record in records:
+        by_type[record["type"]].append(record)
+
+    with transaction.atomic():
+        id_maps = _id_maps(vendor)
+        # نام‌هایی که در همین فایل ساخته می‌شوند (برای ارجاع در dry-run)
+        pending_names: Dict[str, set] = {"category": set(), "product": set(), "option_group": set()}
+
+        for record_type in RECORD_TYPES:
+            typed_records = by_type[record_type]
+            if not typed_records:
+                continue
+            model = RECORD_MODELS[record_type]
+            existing = _existing_rows(record_type, vendor)
+            to_write = []
+            update_fields = set()
+            # کلید تکراری در یک فایل، bulk_create با update_conflicts را در Postgres می‌شکند
+            # (ON CONFLICT نمی‌تواند یک ردیف را دو بار به‌روز کند)
+            key_lines: Dict[tuple, int] = {}
+
+            for record in typed_records:
+                values = dict(record["values"])
+                key = tuple(values[field] for field in RECORD_KEYS[record_type])
+                if key in key_lines:
+                    raise CatalogTransferError(
+                        f"line {record['line']}: duplicate {record_type} {' / '.join(str(k) for k in key)} "
+                        f"(first seen on line {key_lines[key]})"
+                    )
+                key_lines[key] = record["line"]
+                current = existing.get(key)
+                if current is not None:
+                    # ستون‌هایی که در فایل نیامده‌اند مقدار فعلی را حفظ می‌کنند.
+                    values = {**{k: v for k, v in current.items() if k != "id"}, **values}
+
+                if current is None:
+                    result.counts[record_type]["created"] += 1
+                    result.diff.append(f"+ {record_type} {' / '.join(str(k) for k in key)}")
+                    changed = None
+                else:
+                    changed = {
+                        field: (current.get(field), value)
+                        for field, value in values.items()
+                        if current.get(field) != value
+                    }
+                    if not changed:
+                        result.counts[record_type]["unchanged"] += 1
+                        continue
+                    result.counts[record_type]["updated"] += 1
+                    details = ", ".join(f"{field}: {old!r} -> {new!r}" for field, (old, new) in changed.items())
+                    result.diff.append(f"~ {record_type} {' / '.join(str(k) for k in key)}: {details}")
+                    update_fields.update(changed.keys())
+
+                if record_type in pending_names:
+                    pending_names[record_type].add(values[RECORD_KEYS[record_type][0]])
+                if dry_run:
+                    continue
+
+                for field, target_type in REFERENCE_FIELDS.items():
+                    if field not in values:
+                        continue
+                    name = values.pop(field)
+                    if name is None:
+                        values[f"{field}_id"] = None
+                        continue
+                    ref_id = id_maps[target_type].get(name)
+                    if ref_id is None:
+                        raise CatalogTransferError(
+                            f"line {record['line']}: {target_type} {name!r} not found for vendor {vendor.slug}"
+                        )
+                    values[f"{field}_id"] = ref_id
+                if hasattr(model, "vendor"):
+                    values["vendor"] = vendor
+                to_write.append(model(**values))
+
+            if dry_run:
+                for record in typed_records:
+                    for field, target_type in REFERENCE_FIELDS.items():
+                        name = record["values"].get(field)
+                        if name and name not in id_maps[target_type] and name not in pending_names[target_type]:
+                            raise CatalogTransferError(
+                                f"line {record['line']}: {target_type} {name!r} not found for vendor {vendor.slug}"
+                            )
+                continue
+
+            if to_write:
+                unique_fields = UNIQUE_FIELDS[record_type]
+                writable = {
+                    field.name
+                    for field in model._meta.concrete_fields
+                    if not field.primary_key and field.name not in unique_fields and field.name != "created_at"
+                }
+                fields_to_update = sorted((update_fields | {"updated_at"}) & writable) or sorted(writable)
+                model.objects.bulk_create(
+                    to_write,
+                    batch_size=chunk_size,
+                    update_conflicts=True,
+                    unique_fields=unique_fields,
+                    update_fields=fields_to_update,
+                )
+                if record_type in id_maps:
+                    id_maps = _id_maps(vendor)
+
+    if not dry_run and result.diff:
+        bump_catalog_version(vendor.id)
+    return result
+
+
+def import_records(rows: Iterable[Tuple[int, dict]], *, dry_run: bool = False, chunk_size: int = 500):
+    """
+    رکوردها را بر اساس وندور گروه‌بندی می‌کند (رکوردهای هر وندور باید پشت سر هم باشند، مثل خروجی export)
+    و برای هر وندور یک تراکنش جدا اجرا می‌کند.
+    """
+    cleaned = (((row.get("vendor") or "").strip(), _clean_record(line_no, row)) for line_no, row in rows)
+    for vendor_slug, group in groupby(cleaned, key=lambda pair: pair[0]):
+        if not vendor_slug:
+            raise CatalogTransferError("every record needs a vendor slug")
+        vendor = Vendor.objects.filter(slug=vendor_slug).first()
+        if not vendor:
+            raise CatalogTransferError(f"vendor {vendor_slug!r} not found")
+        records = [record for _, record in group]
+        yield import_vendor_records(vendor, records, dry_run=dry_run, chunk_size=chunk_size)
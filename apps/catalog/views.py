@@ -1,5 +1,9 @@
-from rest_framework import serializers, viewsets
-from rest_framework.permissions import SAFE_METHODS, BasePermission
+from django.db.models import BigIntegerField, BooleanField, Case, Value, When
+from django.utils import timezone
+from rest_framework import serializers, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import SAFE_METHODS, BasePermission, IsAuthenticated
+from rest_framework.response import Response
 
 from catalog.models import (
     Category,
@@ -11,6 +15,16 @@ from catalog.models import (
     ProductOptionGroup,
     ProductVariant,
 )
+from catalog.images import DEFAULT_FORMAT, IMAGE_VARIANTS, image_variants, variant_url
+from catalog.services import bump_catalog_version
+from vendors.services import get_active_vendor_staff
+
+# فیلدهایی که در به‌روزرسانی گروهی قابل تغییرند: فیلد -> نوع خروجی Case
+BULK_UPDATE_FIELDS = {
+    "is_available": BooleanField(),
+    "is_available_today": BooleanField(),
+    "base_price": BigIntegerField(),
+}
 
 
 class IsAdminOrReadOnly(BasePermission):
@@ -69,13 +83,48 @@ class ProductSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "created_at", "updated_at"]
 
 
+class ProductBulkItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    is_available = serializers.BooleanField(required=False)
+    is_available_today = serializers.BooleanField(required=False)
+    base_price = serializers.IntegerField(required=False, min_value=0)
+
+    def validate(self, attrs):
+        if not any(field in attrs for field in BULK_UPDATE_FIELDS):
+            raise serializers.ValidationError("حداقل یکی از فیلدهای موجودی یا قیمت لازم است.")
+        return attrs
+
+
+class ProductBulkUpdateSerializer(serializers.Serializer):
+    vendor = serializers.IntegerField(required=False)
+    items = ProductBulkItemSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        if len(items) > 500:
+            raise serializers.ValidationError("حداکثر ۵۰۰ محصول در هر درخواست.")
+        ids = [item["id"] for item in items]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("شناسه محصول تکراری است.")
+        return items
+
+
 class ProductImageSerializer(serializers.ModelSerializer):
+    """
+    - variants: همه نسخه‌های ساخته‌شده (thumb/card/full × webp/jpeg)
+    - display_url: نسخه مناسب این درخواست؛ ?image_variant=thumb|card|full و ?image_format=webp|jpeg
+    """
+
+    variants = serializers.SerializerMethodField()
+    display_url = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
         fields = [
             "id",
             "product",
             "image_url",
+            "display_url",
+            "variants",
             "alt_text",
             "sort_order",
             "is_primary",
@@ -83,6 +132,24 @@ class ProductImageSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["id", "created_at"]
 
+    def _requested_variant(self):
+        variant = self.context.get("image_variant")
+        fmt = self.context.get("image_format")
+        request = self.context.get("request")
+        if request is not None:
+            variant = request.query_params.get("image_variant") or variant
+            fmt = request.query_params.get("image_format") or fmt
+        if variant not in IMAGE_VARIANTS:
+            variant = "full"
+        return variant, fmt or DEFAULT_FORMAT
+
+    def get_variants(self, obj):
+        return image_variants(obj)
+
+    def get_display_url(self, obj):
+        variant, fmt = self._requested_variant()
+        return variant_url(obj, variant, fmt)
+
 
 class ProductVariantSerializer(serializers.ModelSerializer):
     vendor = serializers.PrimaryKeyRelatedField(source="product.vendor", read_only=True)
@@ -233,9 +300,47 @@ class ProductViewSet(viewsets.ModelViewSet):
 
         return qs
 
+    @action(detail=False, methods=["post"], url_path="bulk-update", permission_classes=[IsAuthenticated])
+    def bulk_update(self, request, *args, **kwargs):
+        """
+        تغییر گروهی موجودی/قیمت محصولات یک وندور با یک UPDATE ... WHERE id IN.
+        کارکنان وندور فقط محصولات وندور خودشان را تغییر می‌دهند؛ ادمین باید vendor را مشخص کند.
+        """
+        serializer = ProductBulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data["items"]
+
+        staff = get_active_vendor_staff(request.user)
+        if staff:
+            vendor_id = staff.vendor_id
+        elif request.user.is_staff and serializer.validated_data.get("vendor"):
+            vendor_id = serializer.validated_data["vendor"]
+        else:
+            return Response({"detail": "دسترسی فروشنده تایید نشد."}, status=status.HTTP_403_FORBIDDEN)
+
+        ids = [item["id"] for item in items]
+        found_ids = set(Product.objects.filter(vendor_id=vendor_id, id__in=ids).values_list("id", flat=True))
+        missing = [product_id for product_id in ids if product_id not in found_ids]
+        if missing:
+            return Response(
+                {"detail": "برخی محصولات متعلق به این فروشنده نیستند.", "missing_ids": missing},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        updates = {}
+        for field, output_field in BULK_UPDATE_FIELDS.items():
+            whens = [When(id=item["id"], then=Value(item[field])) for item in items if field in item]
+            if whens:
+                # محصولاتی که این فیلد را نفرستاده‌اند مقدار فعلی را نگه می‌دارند.
+                updates[field] = Case(*whens, default=field, output_field=output_field)
+
+        updated = Product.objects.filter(vendor_id=vendor_id, id__in=ids).update(**updates, updated_at=timezone.now())
+        catalog_version = bump_catalog_version(vendor_id)
+        return Response({"updated": updated, "catalog_version": catalog_version}, status=status.HTTP_200_OK)
+
 
 class ProductImageViewSet(viewsets.ModelViewSet):
-    queryset = ProductImage.objects.all().order_by("-created_at")
+    queryset = ProductImage.objects.select_related("media_asset").order_by("-created_at")
     serializer_class = ProductImageSerializer
     permission_classes = [IsAdminOrReadOnly]
 
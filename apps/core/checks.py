@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core import checks
+
+# backendهایی که داده را فقط در حافظه همان پروسه نگه می‌دارند
+PROCESS_LOCAL_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+def cache_is_shared(alias: str = "default") -> bool:
+    return settings.CACHES.get(alias, {}).get("BACKEND") not in PROCESS_LOCAL_CACHES
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs=None, **kwargs):
+    """
+    نسخه کاتالوگ، نسخه تنظیمات وندورها، قفل callback پرداخت و محدودکننده OTP فقط با کش
+    مشترک بین پروسه‌ها درست کار می‌کنند.
+    """
+    if settings.DEBUG or cache_is_shared():
+        return []
+    return [
+        checks.Error(
+            "The default cache is process-local; cache-based invalidation, payment callback locks and OTP "
+            "rate limits would not be shared between workers.",
+            hint="Set REDIS_URL or use django.core.cache.backends.db.DatabaseCache (manage.py createcachetable).",
+            id="core.E001",
+        )
+    ]
@@ -5,6 +5,8 @@ from .models import (
     VendorIntegrationConfig,
     ExternalRequestLog,
     ProviderHealthCheck,
+    TelegramConversation,
+    TelegramUpdate,
 )
 
 
@@ -54,3 +56,16 @@ class ProviderHealthCheckAdmin(admin.ModelAdmin):
     list_filter = ("status", "checked_at", "provider")
     readonly_fields = ("checked_at",)
 
+
+@admin.register(TelegramUpdate)
+class TelegramUpdateAdmin(admin.ModelAdmin):
+    list_display = ("id", "update_id", "chat_id", "status", "attempts", "received_at", "processed_at")
+    list_filter = ("status",)
+    search_fields = ("update_id", "chat_id")
+
+
+@admin.register(TelegramConversation)
+class TelegramConversationAdmin(admin.ModelAdmin):
+    list_display = ("telegram_user", "version", "otp_verified", "vendor_id", "address_id", "updated_at")
+    list_filter = ("otp_verified",)
+    search_fields = ("telegram_user__telegram_user_id",)
@@ -0,0 +1 @@
+"""سرورهای جعلی محلی برای سرویس‌های بیرونی (تست، load run و اجرای staging بدون اینترنت)."""
@@ -0,0 +1,166 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+FAULT_OPTIONS = ("latency", "jitter", "error_rate", "rate_limit_rate", "retry_after")
+
+
+class FakeServer:
+    """
+    سرور HTTP محلی در یک thread پس‌زمینه که درخواست‌ها را ثبت می‌کند.
+    زیرکلاس‌ها handle(method, path, body) را پیاده می‌کنند و (status, body) برمی‌گردانند.
+    latency تاخیر مصنوعی هر پاسخ (ثانیه) و jitter بازه تصادفی اضافه بر آن است.
+    error_rate و rate_limit_rate احتمال پاسخ 503 و 429 (با Retry-After) پیش از رسیدن به handle
+    هستند؛ seed خطاها را تکرارپذیر می‌کند. configure() همین‌ها را وسط اجرا عوض می‌کند.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: int = 1,
+        seed: Optional[int] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.faults: Counter = Counter()
+        self.calls: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        if not self._server:
+            raise RuntimeError("Fake server is not running")
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeServer":
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _dispatch(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                parsed = urlparse(self.path)
+                body = fake.parse_body(raw, self.headers.get("Content-Type") or "")
+                if parsed.query:
+                    body = {**{k: v[0] for k, v in parse_qs(parsed.query).items()}, **body}
+                delay = fake.delay()
+                if delay:
+                    time.sleep(delay)
+                fault = fake.pick_fault()
+                if fault:
+                    status_code, response = fault, fake.fault_response(fault)
+                else:
+                    status_code, response = fake.handle(self.command, parsed.path, body)
+                data = json.dumps(response, ensure_ascii=False).encode() if not isinstance(response, bytes) else response
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                if status_code == 429:
+                    self.send_header("Retry-After", str(fake.retry_after))
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = _dispatch
+            do_POST = _dispatch
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name=self.__class__.__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @staticmethod
+    def parse_body(raw: bytes, content_type: str) -> Dict[str, Any]:
+        if not raw:
+            return {}
+        text = raw.decode("utf-8", errors="replace")
+        if "json" in content_type:
+            try:
+                data = json.loads(text)
+            except ValueError:
+                return {}
+            return data if isinstance(data, dict) else {"_body": data}
+        if "x-www-form-urlencoded" in content_type:
+            return {k: v[0] for k, v in parse_qs(text).items()}
+        return {"_body": text}
+
+    def configure(self, **options) -> None:
+        """
+        تغییر latency/jitter/error_rate/rate_limit_rate/retry_after روی سرور در حال اجرا.
+        """
+        for name, value in options.items():
+            if name not in FAULT_OPTIONS:
+                raise TypeError(f"Unknown fake server option: {name}")
+            setattr(self, name, value)
+
+    def delay(self) -> float:
+        if not self.jitter:
+            return self.latency
+        with self.lock:
+            return self.latency + self.random.uniform(0, self.jitter)
+
+    def pick_fault(self) -> Optional[int]:
+        if not self.error_rate and not self.rate_limit_rate:
+            return None
+        with self.lock:
+            roll = self.random.random()
+            if roll < self.rate_limit_rate:
+                fault = 429
+            elif roll < self.rate_limit_rate + self.error_rate:
+                fault = 503
+            else:
+                return None
+            self.faults[fault] += 1
+            return fault
+
+    def fault_response(self, status_code: int) -> Any:
+        """
+        بدنه پاسخ خطای تزریقی؛ زیرکلاس‌ها قالب خطای همان سرویس را برمی‌گردانند.
+        """
+        return {"error": "Too Many Requests" if status_code == 429 else "Service Unavailable"}
+
+    def record(self, **call) -> None:
+        with self.lock:
+            self.calls.append({**call, "at": time.monotonic()})
+
+    def reset(self) -> None:
+        with self.lock:
+            self.calls.clear()
+            self.faults.clear()
+
+    def handle(self, method: str, path: str, body: Dict[str, Any]) -> Tuple[int, Any]:
+        raise NotImplementedError
@@ -0,0 +1,58 @@
+import itertools
+from typing import Any, Dict, List, Tuple
+
+from integrations.fakes.base import FakeServer
+
+SEND_PATHS = {"/api/SendSMS/BaseServiceNumber", "/api/SendSMS/SendSMS"}
+CREDIT_PATH = "/api/SendSMS/GetCredit"
+
+
+def _ret(value: Any, status: int = 1, label: str = "Ok") -> Dict[str, Any]:
+    return {"Value": str(value), "RetStatus": status, "StrRetStatus": label}
+
+
+class FakeSmsPanel(FakeServer):
+    """
+    وب‌سرویس REST جعلی ملی‌پیامک: BaseServiceNumber (پترنی)، SendSMS و GetCredit.
+    هر پیامک موفق یک واحد از credit کم می‌کند؛ با اعتبار صفر پاسخ RetStatus غیر از ۱ است
+    تا مسیر رد شدن توسط پنل هم قابل آزمایش باشد.
+    """
+
+    def __init__(self, *args, credit: float = 10_000, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.credit = credit
+        self.rec_ids = itertools.count(5_000_000_001)
+
+    def handle(self, method: str, path: str, body: Dict[str, Any]) -> Tuple[int, Any]:
+        if path == CREDIT_PATH:
+            if not body.get("username") or not body.get("password"):
+                return 200, _ret(0, 0, "InvalidUserPass")
+            with self.lock:
+                return 200, _ret(self.credit)
+        if path not in SEND_PATHS:
+            return 404, {"Message": "No HTTP resource was found that matches the request URI."}
+
+        if not body.get("username") or not body.get("password"):
+            return 200, _ret(0, 0, "InvalidUserPass")
+        if not body.get("to"):
+            return 200, _ret(0, 35, "InvalidRecipient")
+        with self.lock:
+            if self.credit < 1:
+                return 200, _ret(0, 11, "NotEnoughCredit")
+            self.credit -= 1
+            rec_id = next(self.rec_ids)
+        self.record(
+            method=path.rsplit("/", 1)[-1],
+            mobile=str(body.get("to")),
+            body_id=str(body.get("bodyId") or ""),
+            text=str(body.get("text") or ""),
+            rec_id=rec_id,
+        )
+        return 200, _ret(rec_id)
+
+    def fault_response(self, status_code: int) -> Any:
+        return {"Message": "Too many requests" if status_code == 429 else "Service Unavailable"}
+
+    def messages_to(self, mobile: str) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [call for call in self.calls if call["mobile"] == str(mobile)]
@@ -0,0 +1,81 @@
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from django.test.utils import override_settings
+
+from integrations.fakes.base import FakeServer
+from integrations.fakes.sms import FakeSmsPanel
+from integrations.fakes.telegram import FakeBotAPI
+from integrations.fakes.zibal import FakeZibal
+
+
+class FakeProviderSuite:
+    """
+    هر سه سرور جعلی (Bot API، پنل پیامک، زیبال) با هم؛ برای تست، load run و staging آفلاین.
+
+        with FakeProviderSuite(latency=0.05, error_rate=0.01) as fakes, fakes.activate():
+            ...  # کد واقعی integrations با HTTP واقعی به سرورهای محلی
+
+    گزینه‌های خطا و تاخیر (latency، jitter، error_rate، rate_limit_rate، retry_after، seed) به هر سه
+    سرور داده می‌شوند و با configure() وسط اجرا قابل تغییرند.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", ports: Optional[Dict[str, int]] = None, **options):
+        ports = ports or {}
+        self.telegram = FakeBotAPI(host, ports.get("telegram", 0), **options)
+        self.sms = FakeSmsPanel(host, ports.get("sms", 0), **options)
+        self.zibal = FakeZibal(host, ports.get("zibal", 0), **options)
+
+    @property
+    def servers(self) -> List[FakeServer]:
+        return [self.telegram, self.sms, self.zibal]
+
+    def start(self) -> "FakeProviderSuite":
+        for server in self.servers:
+            server.start()
+        return self
+
+    def stop(self) -> None:
+        for server in self.servers:
+            server.stop()
+
+    def __enter__(self) -> "FakeProviderSuite":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def configure(self, **options) -> None:
+        for server in self.servers:
+            server.configure(**options)
+
+    def reset(self) -> None:
+        for server in self.servers:
+            server.reset()
+
+    def settings_overrides(self) -> Dict[str, Any]:
+        return {
+            "TELEGRAM_API_BASE_URL": self.telegram.url,
+            "SMS_REST_BASE_URL": self.sms.url,
+            "SMS_MODE": "real",
+            "PAYMENT_GATEWAY_BASE_URL": self.zibal.url,
+        }
+
+    @contextmanager
+    def activate(self, **extra_settings) -> Iterator["FakeProviderSuite"]:
+        """
+        تنظیمات base URL را به سرورهای جعلی می‌برد و کلاینت‌های مشترک (HTTP، تلگرام، مسیریاب پیامک)
+        را در ورود و خروج از نو می‌سازد تا آدرس قبلی در آن‌ها نماند.
+        """
+        from integrations.services import http_client, sms_router, telegram_client
+
+        with override_settings(**self.settings_overrides(), **extra_settings):
+            http_client.reset_client()
+            telegram_client.reset_client()
+            sms_router.reset_router()
+            try:
+                yield self
+            finally:
+                http_client.reset_client()
+                telegram_client.reset_client()
+                sms_router.reset_router()
@@ -0,0 +1,119 @@
+import itertools
+import re
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from integrations.fakes.base import FakeServer
+
+BOT_PATH = re.compile(r"^/bot(?P<token>[^/]+)/(?P<method>\w+)$")
+MESSAGE_METHODS = {"sendMessage", "editMessageText", "editMessageReplyMarkup"}
+
+
+class FakeBotAPI(FakeServer):
+    """
+    Bot API جعلی: همه فراخوانی‌ها را با chat_id ثبت می‌کند و پاسخ ok برمی‌گرداند.
+    آخرین کیبورد و message_id هر چت نگه داشته می‌شود تا سناریوها بتوانند دکمه بعدی را انتخاب کنند.
+    getUpdates از صفی که با push_update پر می‌شود پاسخ می‌دهد (برای telegram_poll).
+    setWebhook آدرس را نگه می‌دارد و getMe/getWebhookInfo مثل Bot API واقعی جواب می‌دهند.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.message_ids = itertools.count(1)
+        self.keyboards: Dict[str, Dict[str, Any]] = {}
+        self.last_message_ids: Dict[str, int] = {}
+        self.updates: deque = deque()
+        self.webhook_url = ""
+
+    @staticmethod
+    def callback_chat_id(callback_query_id: str) -> str:
+        # شبیه‌ساز loadtest شناسه callback را به صورت "<chat_id>:<seq>" می‌سازد
+        return str(callback_query_id).split(":", 1)[0]
+
+    def handle(self, method: str, path: str, body: Dict[str, Any]) -> Tuple[int, Any]:
+        match = BOT_PATH.match(path)
+        if not match:
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+        api_method = match.group("method")
+
+        if api_method == "getUpdates":
+            return 200, {"ok": True, "result": self._pop_updates(body)}
+        if api_method == "getMe":
+            return 200, {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}}
+        if api_method == "getWebhookInfo":
+            return 200, {"ok": True, "result": {"url": self.webhook_url, "pending_update_count": len(self.updates)}}
+
+        chat_id = body.get("chat_id")
+        if chat_id is None and api_method == "answerCallbackQuery":
+            chat_id = self.callback_chat_id(body.get("callback_query_id", ""))
+        chat_key = str(chat_id) if chat_id is not None else ""
+        self.record(method=api_method, chat_id=chat_key, payload=body)
+
+        result: Any = True
+        if api_method == "setWebhook":
+            with self.lock:
+                self.webhook_url = str(body.get("url") or "")
+        elif api_method == "deleteWebhook":
+            with self.lock:
+                self.webhook_url = ""
+        if api_method in MESSAGE_METHODS:
+            with self.lock:
+                if api_method == "sendMessage":
+                    message_id = next(self.message_ids)
+                    self.last_message_ids[chat_key] = message_id
+                else:
+                    message_id = int(body.get("message_id") or 0)
+                markup = body.get("reply_markup")
+                if isinstance(markup, dict) and "inline_keyboard" in markup:
+                    self.keyboards[chat_key] = markup
+            result = {"message_id": message_id, "chat": {"id": chat_id}, "text": body.get("text", "")}
+        return 200, {"ok": True, "result": result}
+
+    def fault_response(self, status_code: int) -> Any:
+        if status_code == 429:
+            return {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+        return {"ok": False, "error_code": status_code, "description": "Service Unavailable"}
+
+    def _pop_updates(self, body: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(body.get("offset") or 0)
+        limit = int(body.get("limit") or 100)
+        with self.lock:
+            while self.updates and int(self.updates[0]["update_id"]) < offset:
+                self.updates.popleft()
+            return list(itertools.islice(self.updates, 0, limit))
+
+    def push_update(self, update: Dict[str, Any]) -> None:
+        with self.lock:
+            self.updates.append(update)
+
+    def calls_for(self, chat_id) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [call for call in self.calls if call["chat_id"] == str(chat_id)]
+
+    def count_for(self, chat_id) -> int:
+        return len(self.calls_for(chat_id))
+
+    def last_keyboard(self, chat_id) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            return self.keyboards.get(str(chat_id))
+
+    def last_message_id(self, chat_id) -> Optional[int]:
+        with self.lock:
+            return self.last_message_ids.get(str(chat_id))
+
+    def find_button(self, chat_id, prefix: str) -> Optional[str]:
+        """
+        callback_data اولین دکمه آخرین کیبورد inline چت که با prefix شروع می‌شود.
+        """
+        keyboard = self.last_keyboard(chat_id) or {}
+        for row in keyboard.get("inline_keyboard") or []:
+            for button in row:
+                data = button.get("callback_data") or ""
+                if data.startswith(prefix):
+                    return data
+        return None
@@ -0,0 +1,129 @@
+import itertools
+import re
+from typing import Any, Dict, Optional, Tuple
+
+from django.utils import timezone
+
+from integrations.fakes.base import FakeServer
+
+START_PATH = re.compile(r"^/start/(?P<track_id>\d+)$")
+MIN_AMOUNT = 1000
+
+# وضعیت تراکنش مثل استعلام زیبال: 1 پرداخت و تایید، 2 پرداخت بدون تایید، -1 در انتظار، 3 لغو توسط کاربر
+PAID_VERIFIED = 1
+PAID_UNVERIFIED = 2
+WAITING = -1
+CANCELLED = 3
+
+
+class FakeZibal(FakeServer):
+    """
+    درگاه جعلی زیبال: /v1/request، /v1/verify و /v1/inquiry با همان کدهای result.
+    پرداخت کاربر با pay(track_id) یا GET /start/<trackId> (همان آدرس payment_url) شبیه‌سازی می‌شود؛
+    ?status=3 پرداخت لغوشده را شبیه‌سازی می‌کند.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.track_ids = itertools.count(3_000_000_001)
+        self.ref_numbers = itertools.count(100_001)
+        self.transactions: Dict[int, Dict[str, Any]] = {}
+
+    def handle(self, method: str, path: str, body: Dict[str, Any]) -> Tuple[int, Any]:
+        start = START_PATH.match(path)
+        if start:
+            track_id = int(start.group("track_id"))
+            status = int(body.get("status") or PAID_UNVERIFIED)
+            if not self.pay(track_id, status):
+                return 404, {"result": 203, "message": "trackId is invalid"}
+            return 200, {"trackId": track_id, "success": 1 if status == PAID_UNVERIFIED else 0, "status": status}
+
+        if path == "/v1/request":
+            return 200, self._request(body)
+        if path in {"/v1/verify", "/v1/inquiry"}:
+            if not body.get("merchant"):
+                return 200, {"result": 102, "message": "merchant not found"}
+            try:
+                track_id = int(body.get("trackId"))
+            except (TypeError, ValueError):
+                return 200, {"result": 203, "message": "trackId is invalid"}
+            self.record(method=path.rsplit("/", 1)[-1], track_id=track_id, payload=body)
+            if path == "/v1/verify":
+                return 200, self._verify(track_id)
+            return 200, self._inquiry(track_id)
+        return 404, {"result": 404, "message": "not found"}
+
+    def _request(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        if not body.get("merchant"):
+            return {"result": 102, "message": "merchant not found"}
+        try:
+            amount = int(body.get("amount") or 0)
+        except (TypeError, ValueError):
+            amount = 0
+        if amount < MIN_AMOUNT:
+            return {"result": 105, "message": "amount must be at least 1000 rials"}
+        with self.lock:
+            track_id = next(self.track_ids)
+            self.transactions[track_id] = {
+                "status": WAITING,
+                "amount": amount,
+                "orderId": body.get("orderId"),
+                "callbackUrl": body.get("callbackUrl"),
+                "refNumber": None,
+                "paidAt": None,
+            }
+        self.record(method="request", track_id=track_id, payload=body)
+        return {"result": 100, "trackId": track_id, "message": "success"}
+
+    def _verify(self, track_id: int) -> Dict[str, Any]:
+        with self.lock:
+            transaction = self.transactions.get(track_id)
+            if transaction is None:
+                return {"result": 203, "message": "trackId is invalid"}
+            if transaction["status"] == PAID_VERIFIED:
+                return {"result": 201, "message": "already verified", **self._details(track_id, transaction)}
+            if transaction["status"] != PAID_UNVERIFIED:
+                return {"result": 202, "message": "order not paid", "status": transaction["status"]}
+            transaction["status"] = PAID_VERIFIED
+            return {"result": 100, "message": "success", **self._details(track_id, transaction)}
+
+    def _inquiry(self, track_id: int) -> Dict[str, Any]:
+        with self.lock:
+            transaction = self.transactions.get(track_id)
+            if transaction is None:
+                return {"result": 203, "message": "trackId is invalid"}
+            return {"result": 100, "message": "success", **self._details(track_id, transaction)}
+
+    @staticmethod
+    def _details(track_id: int, transaction: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "trackId": track_id,
+            "status": transaction["status"],
+            "amount": transaction["amount"],
+            "orderId": transaction["orderId"],
+            "refNumber": transaction["refNumber"],
+            "paidAt": transaction["paidAt"],
+        }
+
+    def pay(self, track_id: int, status: int = PAID_UNVERIFIED) -> bool:
+        """
+        پرداخت (یا با status=CANCELLED لغو) تراکنش در صفحه درگاه؛ False اگر trackId ناشناخته باشد.
+        """
+        with self.lock:
+            transaction = self.transactions.get(int(track_id))
+            if transaction is None:
+                return False
+            if transaction["status"] == WAITING:
+                transaction["status"] = status
+                if status == PAID_UNVERIFIED:
+                    transaction["refNumber"] = next(self.ref_numbers)
+                    transaction["paidAt"] = timezone.now().isoformat()
+            return True
+
+    def fault_response(self, status_code: int) -> Any:
+        return {"result": status_code, "message": "Too Many Requests" if status_code == 429 else "Service Unavailable"}
+
+    def transaction(self, track_id: int) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            transaction = self.transactions.get(int(track_id))
+            return dict(transaction) if transaction else None
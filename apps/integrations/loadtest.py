@@ -0,0 +1,308 @@
+"""
+بازپخش آپدیت‌های تلگرام روی webhook برای سنجش رفتار ربات زیر بار.
+پاسخ‌های ربات به FakeBotAPI محلی می‌روند؛ گزارش شامل تاخیر p50/p95/p99، تعداد کوئری و تعداد فراخوانی خروجی هر آپدیت است.
+"""
+import itertools
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from catalog.models import OptionGroup, OptionItem, Product, ProductOptionGroup
+from integrations.fakes.telegram import FakeBotAPI
+from integrations.fakes.zibal import FakeZibal
+from integrations.models import TelegramUpdate
+from integrations.services import request_log, sms_batch, telegram_client, telegram_dedup
+from vendors.models import Vendor
+
+LOADTEST_TOKEN = "loadtest"
+CHAT_ID_BASE = 7_000_000_000
+
+# سناریوی پیش‌فرض یک سفارش کامل. tap با prefix، اولین دکمه منطبق از آخرین کیبورد چت را می‌زند؛
+# اگر دکمه‌ای نبود، خود مقدار به عنوان callback_data فرستاده می‌شود.
+DEFAULT_SCENARIO: List[Dict[str, Any]] = [
+    {"text": "/start"},
+    {"contact": True},
+    {"location": [35.7, 51.4]},
+    {"text": "خانه\nتهران، خیابان آزمایشی، پلاک ۱"},
+    {"tap": "product:"},
+    {"tap": "option:pick:", "optional": True},
+    {"tap": "option:next", "optional": True},
+    {"tap": "cart:review"},
+    {"tap": "cart:checkout"},
+]
+
+
+def _percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))], 2)
+
+
+def _summary(values: List[float]) -> Dict[str, Any]:
+    return {
+        "mean": round(sum(values) / len(values), 2) if values else None,
+        "p50": _percentile(values, 0.5),
+        "p95": _percentile(values, 0.95),
+        "p99": _percentile(values, 0.99),
+        "max": round(max(values), 2) if values else None,
+    }
+
+
+class SimulatedChat:
+    """
+    یک کاربر شبیه‌سازی‌شده: آپدیت‌های سناریو را با شناسه‌های خودش می‌سازد.
+    """
+
+    def __init__(self, chat_id: int, update_ids, fake: FakeBotAPI):
+        self.chat_id = chat_id
+        self.update_ids = update_ids
+        self.fake = fake
+        self.callback_seq = itertools.count(1)
+        self.user = {"id": chat_id, "is_bot": False, "first_name": f"Load {chat_id}"}
+        self.chat = {"id": chat_id, "type": "private", "first_name": self.user["first_name"]}
+
+    @property
+    def phone(self) -> str:
+        return f"09{self.chat_id % 10**9:09d}"
+
+    def _message(self, **fields) -> Dict[str, Any]:
+        message = {"message_id": next(self.callback_seq), "date": int(time.time()), "chat": self.chat, "from": self.user}
+        message.update(fields)
+        return {"update_id": next(self.update_ids), "message": message}
+
+    def build(self, step: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if "text" in step:
+            return self._message(text=step["text"])
+        if step.get("contact"):
+            return self._message(contact={"phone_number": self.phone, "user_id": self.chat_id, "first_name": "Load"})
+        if "location" in step:
+            latitude, longitude = step["location"]
+            return self._message(location={"latitude": latitude, "longitude": longitude})
+        if "tap" in step:
+            data = self.fake.find_button(self.chat_id, step["tap"])
+            if data is None:
+                if step.get("optional"):
+                    return None
+                data = step["tap"]
+            return {
+                "update_id": next(self.update_ids),
+                "callback_query": {
+                    "id": f"{self.chat_id}:{next(self.callback_seq)}",
+                    "from": self.user,
+                    "data": data,
+                    "message": {
+                        "message_id": self.fake.last_message_id(self.chat_id) or 1,
+                        "chat": self.chat,
+                        "from": {"id": 0, "is_bot": True},
+                    },
+                },
+            }
+        raise ValueError(f"Unknown scenario step: {step}")
+
+
+def seed_loadtest_catalog() -> Vendor:
+    """
+    وندور و منوی نمونه (یک محصول با گروه گزینه و چند محصول ساده) برای سناریوی پیش‌فرض.
+    """
+    vendor, _ = Vendor.objects.get_or_create(slug="loadtest-kitchen", defaults={"name": "Loadtest Kitchen"})
+    sauce, _ = OptionGroup.objects.get_or_create(vendor=vendor, name="سس", defaults={"max_select": 2})
+    for index, name in enumerate(("کچاپ", "مایونز")):
+        OptionItem.objects.get_or_create(group=sauce, name=name, defaults={"price_delta_amount": 5000, "sort_order": index})
+    sandwich, _ = Product.objects.get_or_create(
+        vendor=vendor, name_fa="ساندویچ آزمایشی", defaults={"base_price": 100000, "sort_order": 0}
+    )
+    ProductOptionGroup.objects.get_or_create(product=sandwich, group=sauce)
+    for index in range(1, 12):
+        Product.objects.get_or_create(
+            vendor=vendor, name_fa=f"غذای آزمایشی {index}", defaults={"base_price": 50000 + index * 1000, "sort_order": index}
+        )
+    return vendor
+
+
+def step_kind(update: Dict[str, Any]) -> str:
+    callback_query = update.get("callback_query")
+    if callback_query:
+        data = callback_query.get("data") or ""
+        return "tap:" + ":".join(data.split(":")[:2])
+    message = update.get("message") or {}
+    for key in ("contact", "location"):
+        if key in message:
+            return key
+    text = message.get("text") or ""
+    return "command" if text.startswith("/") else "text"
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as corpus:
+        return [json.loads(line) for line in corpus if line.strip()]
+
+
+def export_corpus(path: str, limit: int = 1000) -> int:
+    """
+    ذخیره آخرین آپدیت‌های صف (TelegramUpdate) به صورت JSONL برای بازپخش.
+    """
+    updates = list(TelegramUpdate.objects.order_by("-id").values_list("payload", flat=True)[:limit])
+    with open(path, "w", encoding="utf-8") as corpus:
+        for payload in reversed(updates):
+            corpus.write(json.dumps(payload, ensure_ascii=False) + "\n")
+    return len(updates)
+
+
+def _remap_chat(update: Dict[str, Any], chat_id: int, update_id: int) -> Dict[str, Any]:
+    """
+    کپی یک آپدیت ضبط‌شده با chat_id و update_id جدید (برای اجرای یک corpus روی چند چت شبیه‌سازی‌شده).
+    """
+    raw = json.dumps(update)
+    original = update.get("callback_query", {}).get("message", {}).get("chat", {}).get("id") or (
+        update.get("message") or {}
+    ).get("chat", {}).get("id")
+    if original is not None:
+        raw = raw.replace(f'"id": {original}', f'"id": {chat_id}')
+    remapped = json.loads(raw)
+    remapped["update_id"] = update_id
+    callback_query = remapped.get("callback_query")
+    if callback_query:
+        callback_query["id"] = f"{chat_id}:{update_id}"
+    return remapped
+
+
+class LoadTestRunner:
+    def __init__(
+        self,
+        fake: FakeBotAPI,
+        chats: int = 10,
+        concurrency: int = 10,
+        scenario: Optional[List[Dict[str, Any]]] = None,
+        corpus: Optional[List[Dict[str, Any]]] = None,
+    ):
+        self.fake = fake
+        self.chats = chats
+        self.concurrency = max(1, concurrency)
+        self.scenario = scenario or DEFAULT_SCENARIO
+        self.corpus = corpus
+        self.update_ids = itertools.count(int(time.time()) * 1000)
+        self.lock = threading.Lock()
+        self.samples: List[Dict[str, Any]] = []
+        self.webhook_path = reverse("integrations:telegram-webhook", kwargs={"secret": settings.TELEGRAM_WEBHOOK_SECRET or "-"})
+
+    def _post(self, client: Client, chat_id: int, update: Dict[str, Any]) -> None:
+        outbound_before = self.fake.count_for(chat_id)
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(self.webhook_path, data=update, content_type="application/json")
+        latency_ms = (time.perf_counter() - started) * 1000
+        sample = {
+            "kind": step_kind(update),
+            "status": response.status_code,
+            "latency_ms": latency_ms,
+            "queries": len(queries),
+            "outbound": self.fake.count_for(chat_id) - outbound_before,
+        }
+        with self.lock:
+            self.samples.append(sample)
+
+    def _run_chat(self, index: int) -> None:
+        chat_id = CHAT_ID_BASE + index
+        client = Client()
+        try:
+            if self.corpus is not None:
+                for update in self.corpus:
+                    self._post(client, chat_id, _remap_chat(update, chat_id, next(self.update_ids)))
+                return
+            chat = SimulatedChat(chat_id, self.update_ids, self.fake)
+            for step in self.scenario:
+                update = chat.build(step)
+                if update is not None:
+                    self._post(client, chat_id, update)
+        finally:
+            if self.concurrency > 1:
+                connection.close()
+
+    def run(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        if self.concurrency == 1:
+            # همان thread و همان اتصال دیتابیس (برای اجرا داخل TestCase)
+            for index in range(self.chats):
+                self._run_chat(index)
+        else:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                list(executor.map(self._run_chat, range(self.chats)))
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        by_kind: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for sample in self.samples:
+            by_kind[sample["kind"]].append(sample)
+
+        def block(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+            return {
+                "updates": len(samples),
+                "errors": sum(1 for s in samples if s["status"] != 200),
+                "latency_ms": _summary([s["latency_ms"] for s in samples]),
+                "queries_per_update": _summary([s["queries"] for s in samples]),
+                "outbound_per_update": _summary([s["outbound"] for s in samples]),
+            }
+
+        return {
+            "chats": self.chats,
+            "concurrency": self.concurrency,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_per_s": round(len(self.samples) / elapsed, 1) if elapsed else None,
+            **block(self.samples),
+            "outbound_by_method": dict(Counter(call["method"] for call in self.fake.calls)),
+            "by_kind": {kind: block(samples) for kind, samples in sorted(by_kind.items())},
+        }
+
+
+def run_loadtest(
+    chats: int = 10,
+    concurrency: int = 10,
+    scenario: Optional[Iterable[Dict[str, Any]]] = None,
+    corpus: Optional[List[Dict[str, Any]]] = None,
+    fake_latency: float = 0.0,
+    throttle: bool = False,
+) -> Dict[str, Any]:
+    """
+    اجرای بار روی telegram_webhook (حالت inline تا پردازش کامل اندازه‌گیری شود).
+    پرداخت به سرور جعلی و پیامک به حالت mock هدایت می‌شوند تا هیچ درخواست واقعی بیرون نرود.
+    throttle=False انتظار محدودکننده نرخ کلاینت را حذف می‌کند تا فقط هزینه سمت سرور دیده شود.
+    """
+    with FakeBotAPI(latency=fake_latency) as fake, FakeZibal(latency=fake_latency) as gateway:
+        overrides = {
+            "TELEGRAM_BOT_TOKEN": LOADTEST_TOKEN,
+            "TELEGRAM_API_BASE_URL": fake.url,
+            "TELEGRAM_WEBHOOK_INLINE": True,
+            "PAYMENT_GATEWAY_BASE_URL": gateway.url,
+            "SMS_MODE": "mock",
+            # لاگ درخواست‌های بیرونی در همین thread و پایان اجرا ذخیره می‌شود (نه در thread پس‌زمینه)
+            "EXTERNAL_REQUEST_LOG_FLUSH_SECONDS": 0,
+            # Client درخواست‌ها را با Host=testserver می‌فرستد
+            "ALLOWED_HOSTS": [*settings.ALLOWED_HOSTS, "testserver"],
+        }
+        with override_settings(**overrides):
+            client_options = {"token": LOADTEST_TOKEN, "base_url": fake.url}
+            if not throttle:
+                client_options["sleep"] = lambda seconds: None
+            telegram_client.configure_client(**client_options)
+            telegram_dedup.deduplicator.clear()
+            try:
+                runner = LoadTestRunner(
+                    fake, chats=chats, concurrency=concurrency, scenario=list(scenario or []) or None, corpus=corpus
+                )
+                report = runner.run()
+                report["external_request_logs"] = request_log.recorder.flush()
+                return report
+            finally:
+                # پیامک‌های داخل پنجره batch هنوز زیر SMS_MODE=mock فرستاده شوند
+                sms_batch.get_batcher().flush()
+                telegram_client.reset_client()
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from integrations.services.health import ProviderProber
+
+
+class Command(BaseCommand):
+    help = (
+        "Probe active integration providers (Telegram getMe, SMS credit, payment inquiry) on a schedule, "
+        "record ProviderHealthCheck rows and publish the current status for routing code."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=60, help="Seconds between probe rounds.")
+        parser.add_argument("--workers", type=int, default=4, help="Providers probed in parallel.")
+        parser.add_argument("--timeout", type=float, default=5, help="Per-probe HTTP timeout in seconds.")
+        parser.add_argument("--once", action="store_true", help="Run a single round and exit.")
+
+    def handle(self, *args, **options):
+        prober = ProviderProber(workers=options["workers"], timeout=options["timeout"])
+        try:
+            while True:
+                started = time.monotonic()
+                checks = prober.run_once()
+                summary = ", ".join(
+                    f"{check.provider.code}={check.status}"
+                    + (f" ({check.latency_ms} ms)" if check.latency_ms is not None else "")
+                    for check in checks
+                )
+                self.stdout.write(summary or "No active providers with a probe.")
+                if options["once"]:
+                    return
+                close_old_connections()
+                time.sleep(max(0.0, options["interval"] - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped.")
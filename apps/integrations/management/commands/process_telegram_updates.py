@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from integrations.services import telegram_updates
+
+
+class Command(BaseCommand):
+    help = "Process queued Telegram updates: ordered per chat_id, parallel across chats."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Thread pool size (default: TELEGRAM_UPDATE_WORKERS). 1 processes inline.",
+        )
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--poll-interval", type=float, default=0.5, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--stats-interval", type=float, default=60.0, help="Seconds between queue-lag log lines.")
+        parser.add_argument("--once", action="store_true", help="Drain the queue and exit.")
+        parser.add_argument(
+            "--shard",
+            default="0/1",
+            help="Process only chats where chat_id %% N == I, given as I/N (for running several processes).",
+        )
+
+    def handle(self, *args, **options):
+        from integrations.views import handle_telegram_update
+
+        try:
+            shard, shards = (int(part) for part in options["shard"].split("/"))
+        except ValueError:
+            raise CommandError("--shard must look like I/N, e.g. 0/2.")
+        if shards < 1 or not 0 <= shard < shards:
+            raise CommandError("--shard index must be between 0 and N-1.")
+
+        workers = options["workers"] or getattr(settings, "TELEGRAM_UPDATE_WORKERS", 8)
+        stats = telegram_updates.run_worker(
+            handle_telegram_update,
+            workers=workers,
+            poll_interval=options["poll_interval"],
+            batch_size=options["batch_size"],
+            stats_interval=options["stats_interval"],
+            once=options["once"],
+            shard=shard,
+            shards=shards,
+        )
+        metrics = telegram_updates.queue_metrics()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed {stats['done']} update(s), failed {stats['failed']}. "
+                f"Pending {metrics['pending']}, lag p95 {metrics['lag_p95_ms']} ms."
+            )
+        )
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from integrations.fakes.suite import FakeProviderSuite
+
+
+class Command(BaseCommand):
+    help = (
+        "Run local fake Telegram Bot API, SMS panel and Zibal gateway servers with configurable latency, "
+        "error rate and 429s. Point TELEGRAM_API_BASE_URL, SMS_REST_BASE_URL and PAYMENT_GATEWAY_BASE_URL at them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--telegram-port", type=int, default=8081)
+        parser.add_argument("--sms-port", type=int, default=8082)
+        parser.add_argument("--zibal-port", type=int, default=8083)
+        parser.add_argument("--latency", type=float, default=0.0, help="Fixed delay per response in seconds.")
+        parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay up to this many seconds.")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503.")
+        parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with 429.")
+        parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429 responses.")
+        parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible faults.")
+
+    def handle(self, *args, **options):
+        suite = FakeProviderSuite(
+            host=options["host"],
+            ports={"telegram": options["telegram_port"], "sms": options["sms_port"], "zibal": options["zibal_port"]},
+            latency=options["latency"],
+            jitter=options["jitter"],
+            error_rate=options["error_rate"],
+            rate_limit_rate=options["rate_limit_rate"],
+            retry_after=options["retry_after"],
+            seed=options["seed"],
+        )
+        with suite:
+            for name, value in suite.settings_overrides().items():
+                self.stdout.write(f"{name}={value}")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                faults = {server.__class__.__name__: dict(server.faults) for server in suite.servers}
+                calls = {server.__class__.__name__: len(server.calls) for server in suite.servers}
+                self.stdout.write(f"Stopped. calls={calls} injected_faults={faults}")
@@ -0,0 +1,92 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+
+from integrations import loadtest
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay scripted or recorded Telegram updates from many simulated chats against the webhook, "
+        "with a local fake Bot API, and report latency, SQL queries and outbound calls per update."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chats", type=int, default=20, help="Number of simulated chats.")
+        parser.add_argument("--concurrency", type=int, default=10, help="Chats replayed in parallel.")
+        parser.add_argument("--corpus", help="JSONL file of recorded updates, replayed once per simulated chat.")
+        parser.add_argument("--scenario", help="JSON file with a list of scenario steps (default: full order flow).")
+        parser.add_argument(
+            "--export-corpus",
+            metavar="PATH",
+            help="Write the latest queued updates (TelegramUpdate) to PATH as JSONL and exit.",
+        )
+        parser.add_argument("--limit", type=int, default=1000, help="Number of updates for --export-corpus.")
+        parser.add_argument("--fake-latency", type=float, default=0.0, help="Artificial Bot API latency in seconds.")
+        parser.add_argument("--throttle", action="store_true", help="Honour the client rate limiter waits.")
+        parser.add_argument(
+            "--use-current-db",
+            action="store_true",
+            help="Run against the configured database instead of a throwaway test database.",
+        )
+        parser.add_argument("--json", action="store_true", help="Print the full report as JSON.")
+
+    def handle(self, *args, **options):
+        if options["export_corpus"]:
+            count = loadtest.export_corpus(options["export_corpus"], limit=options["limit"])
+            self.stdout.write(self.style.SUCCESS(f"Exported {count} update(s) to {options['export_corpus']}."))
+            return
+
+        corpus = loadtest.load_corpus(options["corpus"]) if options["corpus"] else None
+        scenario = None
+        if options["scenario"]:
+            with open(options["scenario"], encoding="utf-8") as scenario_file:
+                scenario = json.load(scenario_file)
+            if not isinstance(scenario, list):
+                raise CommandError("--scenario must contain a JSON list of steps.")
+
+        old_config = None
+        if not options["use_current_db"]:
+            old_config = setup_databases(verbosity=0, interactive=False)
+            if connection.vendor == "sqlite" and options["concurrency"] > 1:
+                self.stderr.write(self.style.WARNING("SQLite test database: running chats one at a time."))
+                options["concurrency"] = 1
+        try:
+            if old_config is not None:
+                loadtest.seed_loadtest_catalog()
+            report = loadtest.run_loadtest(
+                chats=options["chats"],
+                concurrency=options["concurrency"],
+                scenario=scenario,
+                corpus=corpus,
+                fake_latency=options["fake_latency"],
+                throttle=options["throttle"],
+            )
+        finally:
+            if old_config is not None:
+                teardown_databases(old_config, verbosity=0)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+        self._print_report(report)
+
+    def _print_report(self, report):
+        latency = report["latency_ms"]
+        self.stdout.write(
+            f"{report['updates']} update(s) from {report['chats']} chat(s) in {report['elapsed_s']}s "
+            f"({report['throughput_per_s']}/s), errors: {report['errors']}"
+        )
+        self.stdout.write(f"latency ms  p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+        self.stdout.write(
+            f"queries/update mean {report['queries_per_update']['mean']}  p95 {report['queries_per_update']['p95']}; "
+            f"outbound/update mean {report['outbound_per_update']['mean']}"
+        )
+        self.stdout.write(f"outbound by method: {report['outbound_by_method']}")
+        for kind, block in report["by_kind"].items():
+            self.stdout.write(
+                f"  {kind:<24} n={block['updates']:<5} p95 {block['latency_ms']['p95']} ms  "
+                f"queries {block['queries_per_update']['mean']}  outbound {block['outbound_per_update']['mean']}"
+            )
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from integrations.services import telegram_client, telegram_polling
+
+
+class Command(BaseCommand):
+    help = "Consume Telegram updates with getUpdates long polling (alternative to the webhook, e.g. behind NAT)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Thread pool size (default: TELEGRAM_UPDATE_WORKERS). 1 processes inline.",
+        )
+        parser.add_argument("--batch-size", type=int, default=telegram_polling.MAX_BATCH_SIZE)
+        parser.add_argument("--timeout", type=int, default=25, help="Long-poll timeout in seconds.")
+        parser.add_argument(
+            "--base-url",
+            default=None,
+            help="Bot API base URL (default: TELEGRAM_API_BASE_URL), e.g. a local fake server.",
+        )
+        parser.add_argument(
+            "--delete-webhook",
+            action="store_true",
+            help="Remove the registered webhook first; Telegram refuses getUpdates while one is set.",
+        )
+        parser.add_argument("--once", action="store_true", help="Consume what is waiting, process it and exit.")
+
+    def handle(self, *args, **options):
+        from integrations.views import handle_telegram_update
+
+        if options["base_url"]:
+            client = telegram_client.configure_client(base_url=options["base_url"])
+        else:
+            client = telegram_client.get_client()
+
+        if options["delete_webhook"] and client.call("deleteWebhook", {"drop_pending_updates": False}) is None:
+            raise CommandError("deleteWebhook failed; check the bot token and base URL.")
+
+        workers = options["workers"] or getattr(settings, "TELEGRAM_UPDATE_WORKERS", 8)
+        stats = telegram_polling.run_polling(
+            handle_telegram_update,
+            client=client,
+            workers=workers,
+            batch_size=options["batch_size"],
+            long_poll_timeout=options["timeout"],
+            once=options["once"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Received {stats['received']} update(s) in {stats['polls']} poll(s); "
+                f"processed {stats['done']}, failed {stats['failed']}."
+            )
+        )
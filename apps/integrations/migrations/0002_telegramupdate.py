@@ -0,0 +1,46 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("integrations", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TelegramUpdate",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("update_id", models.BigIntegerField(blank=True, db_index=True, null=True)),
+                ("chat_id", models.BigIntegerField(blank=True, null=True)),
+                ("payload", models.JSONField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "PENDING"),
+                            ("PROCESSING", "PROCESSING"),
+                            ("DONE", "DONE"),
+                            ("FAILED", "FAILED"),
+                        ],
+                        default="PENDING",
+                        max_length=16,
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("error_message", models.CharField(blank=True, default="", max_length=500)),
+                ("received_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["status", "id"], name="integration_status_f85df7_idx"),
+                    models.Index(fields=["chat_id", "status"], name="integration_chat_id_514d09_idx"),
+                    models.Index(fields=["processed_at"], name="integration_process_e8609e_idx"),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("integrations", "0002_telegramupdate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TelegramUpdateReceipt",
+            fields=[
+                ("update_id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("received_at", models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
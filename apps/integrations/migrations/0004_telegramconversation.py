@@ -0,0 +1,44 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0002_telegramuser_state"),
+        ("integrations", "0003_telegramupdatereceipt"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TelegramConversation",
+            fields=[
+                (
+                    "telegram_user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="conversation",
+                        serialize=False,
+                        to="accounts.telegramuser",
+                    ),
+                ),
+                ("version", models.PositiveIntegerField(default=0)),
+                ("otp_verified", models.BooleanField(default=False)),
+                ("awaiting_otp", models.BooleanField(default=False)),
+                ("pending_phone", models.CharField(blank=True, default="", max_length=20)),
+                ("awaiting_address_details", models.BooleanField(default=False)),
+                ("pending_address", models.JSONField(blank=True, null=True)),
+                ("address_id", models.BigIntegerField(blank=True, null=True)),
+                ("vendor_id", models.BigIntegerField(blank=True, null=True)),
+                ("delivery_type", models.CharField(blank=True, default="", max_length=32)),
+                ("delivery_fee", models.BigIntegerField(default=0)),
+                ("latitude", models.FloatField(blank=True, null=True)),
+                ("longitude", models.FloatField(blank=True, null=True)),
+                ("cart", models.JSONField(blank=True, default=list)),
+                ("option_flow", models.JSONField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
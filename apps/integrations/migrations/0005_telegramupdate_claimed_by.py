@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("integrations", "0004_telegramconversation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="telegramupdate",
+            name="claimed_by",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+    ]
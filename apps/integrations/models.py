@@ -222,3 +222,103 @@ class ProviderHealthCheck(models.Model):
     def __str__(self):
         return f"{self.provider.code} {self.status} @ {self.checked_at}"
 
+
+
+class TelegramUpdate(models.Model):
+    """
+    صف آپدیت‌های خام تلگرام.
+    وبهوک فقط آپدیت را ذخیره می‌کند و فوراً 200 برمی‌گرداند؛ process_telegram_updates آن را پردازش می‌کند.
+    ترتیب پردازش برای هر chat_id حفظ می‌شود و چت‌های مختلف موازی پردازش می‌شوند.
+    """
+
+    STATUS_PENDING = "PENDING"
+    STATUS_PROCESSING = "PROCESSING"
+    STATUS_DONE = "DONE"
+    STATUS_FAILED = "FAILED"
+
+    update_id = models.BigIntegerField(null=True, blank=True, db_index=True)
+    chat_id = models.BigIntegerField(null=True, blank=True)
+    payload = models.JSONField()
+
+    status = models.CharField(
+        max_length=16,
+        default=STATUS_PENDING,
+        choices=[
+            (STATUS_PENDING, STATUS_PENDING),
+            (STATUS_PROCESSING, STATUS_PROCESSING),
+            (STATUS_DONE, STATUS_DONE),
+            (STATUS_FAILED, STATUS_FAILED),
+        ],
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error_message = models.CharField(max_length=500, blank=True, default="")
+    # توکن هر claim؛ worker فقط ردیف‌هایی را پردازش می‌کند که UPDATE شرطی به نام خودش زده است
+    claimed_by = models.CharField(max_length=64, blank=True, default="")
+
+    received_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "id"]),
+            models.Index(fields=["chat_id", "status"]),
+            models.Index(fields=["processed_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.update_id} chat={self.chat_id} {self.status}"
+
+
+class TelegramUpdateReceipt(models.Model):
+    """
+    update_idهای دریافت‌شده اخیر برای رد کردن آپدیت‌های تکراری (retry تلگرام).
+    جدول فشرده است و ردیف‌های قدیمی‌تر از TELEGRAM_UPDATE_DEDUP_TTL پاک می‌شوند.
+    """
+
+    update_id = models.BigIntegerField(primary_key=True)
+    received_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return str(self.update_id)
+
+
+class TelegramConversation(models.Model):
+    """
+    وضعیت گفتگوی بات برای هر کاربر تلگرام با فیلدهای تایپ‌شده (جایگزین بازنویسی کامل TelegramUser.state).
+    - version: قفل خوش‌بینانه؛ هر نوشتن فقط اگر نسخه تغییر نکرده باشد اعمال می‌شود
+    - cart / option_flow: فقط بخش‌هایی که ساختار تو در تو دارند JSON هستند
+    """
+
+    telegram_user = models.OneToOneField(
+        "accounts.TelegramUser",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="conversation",
+    )
+    version = models.PositiveIntegerField(default=0)
+
+    # احراز هویت
+    otp_verified = models.BooleanField(default=False)
+    awaiting_otp = models.BooleanField(default=False)
+    pending_phone = models.CharField(max_length=20, blank=True, default="")
+
+    # آدرس در حال ثبت (بعد از ارسال لوکیشن)
+    awaiting_address_details = models.BooleanField(default=False)
+    pending_address = models.JSONField(null=True, blank=True)
+
+    # زمینه سفارش جاری
+    address_id = models.BigIntegerField(null=True, blank=True)
+    vendor_id = models.BigIntegerField(null=True, blank=True)
+    delivery_type = models.CharField(max_length=32, blank=True, default="")
+    delivery_fee = models.BigIntegerField(default=0)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+
+    cart = models.JSONField(default=list, blank=True)
+    option_flow = models.JSONField(null=True, blank=True)
+
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"conversation:{self.telegram_user_id} v{self.version}"
@@ -0,0 +1,315 @@
+import copy
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from accounts.models import TelegramUser
+from integrations.models import TelegramConversation
+
+logger = logging.getLogger(__name__)
+
+AUTH_FIELDS = ("otp_verified", "awaiting_otp", "pending_phone")
+ORDER_FIELDS = (
+    "awaiting_address_details",
+    "pending_address",
+    "address_id",
+    "vendor_id",
+    "delivery_type",
+    "delivery_fee",
+    "latitude",
+    "longitude",
+    "cart",
+    "option_flow",
+)
+MAX_FLUSH_ATTEMPTS = 5
+
+_local = threading.local()
+
+
+class ConversationConflict(Exception):
+    pass
+
+
+def _field_default(field_name: str) -> Any:
+    field = TelegramConversation._meta.get_field(field_name)
+    return field.get_default()
+
+
+class Conversation:
+    """
+    نمای وضعیت گفتگو با عملیات جزئی (append سبد، افزایش گزینه، ...).
+    عملیات‌ها ثبت می‌شوند تا اگر نوشتن به خاطر تغییر نسخه رد شد، روی آخرین نسخه دوباره اعمال شوند.
+    """
+
+    def __init__(self, record: TelegramConversation, autoflush: bool = False):
+        self.record = record
+        self.autoflush = autoflush
+        self._ops: List[tuple] = []
+
+    # --- خواندن ---
+
+    def __getattr__(self, name):
+        if name in AUTH_FIELDS or name in ORDER_FIELDS:
+            return getattr(self.record, name)
+        raise AttributeError(name)
+
+    @property
+    def coords(self) -> Optional[Dict[str, float]]:
+        if self.record.latitude is None or self.record.longitude is None:
+            return None
+        return {"latitude": self.record.latitude, "longitude": self.record.longitude}
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._ops)
+
+    # --- عملیات جزئی ---
+
+    def _apply(self, op: str, *args) -> None:
+        getattr(self, f"_op_{op}")(self.record, *args)
+        self._ops.append((op, args))
+        if self.autoflush:
+            self.flush()
+
+    def set(self, **values) -> None:
+        if "coords" in values:
+            coords = values.pop("coords") or {}
+            values["latitude"] = coords.get("latitude")
+            values["longitude"] = coords.get("longitude")
+        for key in ("pending_phone", "delivery_type"):
+            if key in values and values[key] is None:
+                values[key] = ""
+        if "delivery_fee" in values:
+            values["delivery_fee"] = values["delivery_fee"] or 0
+        self._apply("set", values)
+
+    def reset(self, **values) -> None:
+        """
+        پاک کردن زمینه سفارش (فیلدهای احراز هویت حفظ می‌شوند) و تنظیم مقادیر جدید.
+        """
+        self._apply("reset")
+        if values:
+            self.set(**values)
+
+    def cart_append(self, item: Dict[str, Any]) -> None:
+        self._apply("cart_append", item)
+
+    def start_option_flow(self, product_id: int, group_ids: Iterable[int]) -> None:
+        self._apply("start_option_flow", product_id, list(group_ids))
+
+    def option_increment(self, group_id: int, item_id: int, drop_item_ids: Iterable[int] = ()) -> None:
+        self._apply("option_increment", str(group_id), str(item_id), [str(i) for i in drop_item_ids])
+
+    def option_set_group(self, group_id: int, selections: Dict[int, int]) -> None:
+        self._apply("option_set_group", str(group_id), {str(k): int(v) for k, v in selections.items()})
+
+    def option_advance(self) -> None:
+        self._apply("option_advance")
+
+    def clear_option_flow(self) -> None:
+        self._apply("set", {"option_flow": None})
+
+    @staticmethod
+    def _op_set(record, values):
+        for key, value in values.items():
+            setattr(record, key, value)
+
+    @staticmethod
+    def _op_reset(record):
+        for field_name in ORDER_FIELDS:
+            setattr(record, field_name, _field_default(field_name))
+
+    @staticmethod
+    def _op_cart_append(record, item):
+        record.cart = list(record.cart or []) + [copy.deepcopy(item)]
+
+    @staticmethod
+    def _op_start_option_flow(record, product_id, group_ids):
+        record.option_flow = {"product_id": product_id, "group_ids": group_ids, "group_index": 0, "selections": {}}
+
+    @staticmethod
+    def _op_option_increment(record, group_id, item_id, drop_item_ids):
+        if not record.option_flow:
+            return
+        flow = copy.deepcopy(record.option_flow)
+        group = flow.setdefault("selections", {}).setdefault(group_id, {})
+        for drop_id in drop_item_ids:
+            group.pop(drop_id, None)
+        group[item_id] = int(group.get(item_id, 0)) + 1
+        record.option_flow = flow
+
+    @staticmethod
+    def _op_option_set_group(record, group_id, selections):
+        if not record.option_flow:
+            return
+        flow = copy.deepcopy(record.option_flow)
+        flow.setdefault("selections", {})[group_id] = selections
+        record.option_flow = flow
+
+    @staticmethod
+    def _op_option_advance(record):
+        if not record.option_flow:
+            return
+        flow = copy.deepcopy(record.option_flow)
+        flow["group_index"] = int(flow.get("group_index") or 0) + 1
+        record.option_flow = flow
+
+    def option_selections(self, group_id) -> Dict[int, int]:
+        flow = self.record.option_flow or {}
+        group = (flow.get("selections") or {}).get(str(group_id)) or {}
+        return {int(k): int(v) for k, v in group.items()}
+
+    # --- نوشتن ---
+
+    def _touched_fields(self) -> List[str]:
+        fields = set()
+        for op, args in self._ops:
+            if op == "set":
+                fields.update(args[0].keys())
+            elif op == "reset":
+                fields.update(ORDER_FIELDS)
+            elif op == "cart_append":
+                fields.add("cart")
+            else:
+                fields.add("option_flow")
+        return sorted(fields)
+
+    def flush(self) -> bool:
+        """
+        حداکثر یک UPDATE با شرط version. در صورت تعارض آخرین نسخه را می‌خواند و عملیات‌ها را دوباره اعمال می‌کند.
+        """
+        if not self._ops:
+            return False
+        fields = self._touched_fields()
+        for _ in range(MAX_FLUSH_ATTEMPTS):
+            values = {field: getattr(self.record, field) for field in fields}
+            now = timezone.now()
+            updated = TelegramConversation.objects.filter(
+                pk=self.record.pk, version=self.record.version
+            ).update(**values, version=F("version") + 1, updated_at=now)
+            if updated:
+                self.record.version += 1
+                self.record.updated_at = now
+                self._ops = []
+                return True
+
+            ops = self._ops
+            self.record = TelegramConversation.objects.get(pk=self.record.pk)
+            for op, args in ops:
+                getattr(self, f"_op_{op}")(self.record, *args)
+        raise ConversationConflict(f"Conversation {self.record.pk} kept changing; gave up after {MAX_FLUSH_ATTEMPTS} attempts")
+
+
+def _seed_from_legacy_state(tg_user: TelegramUser) -> TelegramConversation:
+    """
+    ساخت وضعیت تایپ‌شده از JSON قدیمی TelegramUser.state (فقط بار اول).
+    """
+    state = tg_user.state if isinstance(tg_user.state, dict) else {}
+    coords = state.get("coords") if isinstance(state.get("coords"), dict) else {}
+    values = {
+        "otp_verified": bool(state.get("otp_verified")),
+        "awaiting_otp": bool(state.get("awaiting_otp")),
+        "pending_phone": state.get("pending_phone") or "",
+        "awaiting_address_details": bool(state.get("awaiting_address_details")),
+        "pending_address": state.get("pending_address") or None,
+        "address_id": state.get("address_id") or None,
+        "vendor_id": state.get("vendor_id") or None,
+        "delivery_type": state.get("delivery_type") or "",
+        "delivery_fee": state.get("delivery_fee") or 0,
+        "latitude": coords.get("latitude"),
+        "longitude": coords.get("longitude"),
+        "cart": state.get("cart") or [],
+        "option_flow": state.get("option_flow") or None,
+    }
+    try:
+        with transaction.atomic():
+            return TelegramConversation.objects.create(telegram_user=tg_user, **values)
+    except IntegrityError:
+        return TelegramConversation.objects.get(pk=tg_user.pk)
+
+
+def _current_scope() -> Optional[Dict[str, dict]]:
+    stack = getattr(_local, "scopes", None)
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def conversation_scope():
+    """
+    محدوده پردازش یک آپدیت: هر گفتگو یک بار خوانده و در پایان حداکثر یک بار نوشته می‌شود.
+    تغییرات حتی اگر پردازش با خطا تمام شود نوشته می‌شوند: ممکن است قدم قبل از خطا اثر بیرونی
+    داشته باشد (مثلاً checkout سفارش ساخته و سبد را خالی کرده) و گفتگو نباید به حالت قبل برگردد.
+    """
+    scope = {"conversations": {}, "telegram_users": {}}
+    stack = getattr(_local, "scopes", None)
+    if stack is None:
+        stack = _local.scopes = []
+    stack.append(scope)
+    failed = True
+    try:
+        yield scope
+        failed = False
+    finally:
+        try:
+            for conversation in scope["conversations"].values():
+                try:
+                    conversation.flush()
+                except Exception:
+                    if not failed:
+                        raise
+                    # خطای اصلی پردازش را پنهان نکند
+                    logger.exception("Flushing conversation %s after a failed update failed", conversation.record.pk)
+        finally:
+            stack.pop()
+
+
+def get_telegram_user(chat_id) -> Optional[TelegramUser]:
+    """
+    TelegramUser همراه user و conversation در یک کوئری؛ داخل scope فقط یک بار خوانده می‌شود.
+    """
+    scope = _current_scope()
+    key = str(chat_id)
+    if scope is not None and key in scope["telegram_users"]:
+        return scope["telegram_users"][key]
+    tg_user = (
+        TelegramUser.objects.filter(telegram_user_id=chat_id).select_related("user", "conversation").first()
+        if chat_id
+        else None
+    )
+    if scope is not None and tg_user is not None:
+        scope["telegram_users"][key] = tg_user
+    return tg_user
+
+
+def forget_telegram_user(chat_id) -> None:
+    scope = _current_scope()
+    if scope is not None:
+        scope["telegram_users"].pop(str(chat_id), None)
+
+
+def load_conversation(tg_user: TelegramUser) -> Conversation:
+    """
+    وضعیت گفتگوی کاربر (read-through). بیرون از scope هر تغییر بلافاصله نوشته می‌شود.
+    """
+    scope = _current_scope()
+    if scope is not None and tg_user.pk in scope["conversations"]:
+        return scope["conversations"][tg_user.pk]
+
+    descriptor = TelegramUser.conversation
+    if descriptor.is_cached(tg_user):
+        # select_related("conversation") در get_telegram_user؛ None یعنی هنوز ردیفی ساخته نشده
+        record = descriptor.related.get_cached_value(tg_user)
+    else:
+        record = TelegramConversation.objects.filter(pk=tg_user.pk).first()
+    if record is None:
+        record = _seed_from_legacy_state(tg_user)
+
+    conversation = Conversation(record, autoflush=scope is None)
+    if scope is not None:
+        scope["conversations"][tg_user.pk] = conversation
+    return conversation
@@ -0,0 +1,231 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from integrations.models import IntegrationProvider, ProviderHealthCheck
+from integrations.services.sms import _rest_base_url
+
+logger = logging.getLogger(__name__)
+
+STATUS_RANK = {"UP": 0, "DEGRADED": 1, "DOWN": 2}
+# هیسترزیس: برای بدتر شدن وضعیت FALL_AFTER و برای بهتر شدن RISE_AFTER مشاهده پشت سر هم لازم است
+FALL_AFTER = 2
+RISE_AFTER = 3
+DEGRADED_LATENCY_MS = 1500
+PROVIDER_STATUS_KEY = "integrations:health:{code}"
+# مقدار منتشرشده در کش مشترک بعد از این مدت بی‌اعتبار می‌شود (daemon متوقف شده باشد)
+PROVIDER_STATUS_TTL = 5 * 60
+LOCAL_STATUS_TTL = 5
+# details["source"] ردیف‌های ProviderHealthCheck نوشته‌شده با probe_providers (با هیسترزیس)؛
+# نمونه‌های SmsRouter (source=sms_router) در وضعیت ارائه‌دهنده حساب نمی‌شوند
+PROBE_SOURCE = "probe"
+
+ProbeResult = Tuple[str, Optional[int], Dict[str, Any]]
+
+_local_status: Dict[str, Tuple[float, Optional[Dict[str, Any]]]] = {}
+_local_lock = threading.Lock()
+
+
+def _env_credential(provider: IntegrationProvider, name: str, default: str = "") -> str:
+    env = (provider.credentials_ref or {}).get("env") or {}
+    return os.getenv(env[name], "") if env.get(name) else default
+
+
+def _timed_post(session: requests.Session, url: str, timeout: float, **kwargs) -> Tuple[Optional[Any], int, str]:
+    started = time.perf_counter()
+    try:
+        response = session.post(url, timeout=timeout, **kwargs)
+    except requests.RequestException as exc:
+        return None, int((time.perf_counter() - started) * 1000), str(exc)[:200]
+    latency_ms = int((time.perf_counter() - started) * 1000)
+    try:
+        return response.json(), latency_ms, "" if response.status_code < 500 else f"HTTP {response.status_code}"
+    except ValueError:
+        return None, latency_ms, f"HTTP {response.status_code} non-JSON"
+
+
+def _latency_status(latency_ms: int) -> str:
+    return "DEGRADED" if latency_ms > DEGRADED_LATENCY_MS else "UP"
+
+
+def probe_telegram(provider: IntegrationProvider, session: requests.Session, timeout: float) -> ProbeResult:
+    token = _env_credential(provider, "token", settings.TELEGRAM_BOT_TOKEN)
+    base_url = (provider.base_url or getattr(settings, "TELEGRAM_API_BASE_URL", "") or "https://api.telegram.org").rstrip("/")
+    data, latency_ms, error = _timed_post(session, f"{base_url}/bot{token}/getMe", timeout)
+    if error or not isinstance(data, dict) or not data.get("ok"):
+        return "DOWN", latency_ms, {"probe": "getMe", "error": error or (data or {}).get("description", "not ok")}
+    return _latency_status(latency_ms), latency_ms, {"probe": "getMe"}
+
+
+def probe_sms(provider: IntegrationProvider, session: requests.Session, timeout: float) -> ProbeResult:
+    base_url = (provider.base_url or _rest_base_url()).rstrip("/")
+    payload = {
+        "username": _env_credential(provider, "username", getattr(settings, "SMS_USERNAME", "")),
+        "password": _env_credential(provider, "password", getattr(settings, "SMS_PASSWORD", "")),
+    }
+    data, latency_ms, error = _timed_post(session, f"{base_url}/api/SendSMS/GetCredit", timeout, data=payload)
+    if error or not isinstance(data, dict) or str(data.get("RetStatus")) != "1":
+        return "DOWN", latency_ms, {"probe": "GetCredit", "error": error or str((data or {}).get("StrRetStatus"))}
+    try:
+        credit = float(data.get("Value") or 0)
+    except (TypeError, ValueError):
+        credit = None
+    details = {"probe": "GetCredit", "credit": credit}
+    low_credit = getattr(settings, "SMS_LOW_CREDIT_THRESHOLD", 0)
+    if credit is not None and credit < low_credit:
+        return "DEGRADED", latency_ms, {**details, "error": "low credit"}
+    return _latency_status(latency_ms), latency_ms, details
+
+
+def probe_payment(provider: IntegrationProvider, session: requests.Session, timeout: float) -> ProbeResult:
+    base_url = (provider.base_url or settings.PAYMENT_GATEWAY_BASE_URL or "https://gateway.zibal.ir").rstrip("/")
+    if not base_url.endswith("/v1"):
+        base_url = f"{base_url}/v1"
+    merchant = _env_credential(provider, "merchant", settings.PAYMENT_MERCHANT_ID)
+    # trackId ساختگی: هر پاسخ JSON دارای result یعنی درگاه بالا است (نتیجه خود استعلام مهم نیست)
+    data, latency_ms, error = _timed_post(session, f"{base_url}/inquiry", timeout, json={"merchant": merchant, "trackId": 0})
+    if error or not isinstance(data, dict) or "result" not in data:
+        return "DOWN", latency_ms, {"probe": "inquiry", "error": error or "unexpected response"}
+    return _latency_status(latency_ms), latency_ms, {"probe": "inquiry", "result": data.get("result")}
+
+
+PROBES: Dict[str, Callable[[IntegrationProvider, requests.Session, float], ProbeResult]] = {
+    "TELEGRAM": probe_telegram,
+    "SMS": probe_sms,
+    "PAYMENT": probe_payment,
+}
+
+
+class HealthState:
+    """
+    وضعیت منتشرشده یک ارائه‌دهنده با هیسترزیس؛ یک مشاهده خراب یا سالم تنها وضعیت را عوض نمی‌کند.
+    """
+
+    def __init__(self, status: Optional[str] = None):
+        self.status = status
+        self.candidate: Optional[str] = None
+        self.streak = 0
+
+    def observe(self, raw_status: str) -> str:
+        if self.status is None:
+            self.status = raw_status
+        elif raw_status == self.status:
+            self.candidate, self.streak = None, 0
+        else:
+            if raw_status == self.candidate:
+                self.streak += 1
+            else:
+                self.candidate, self.streak = raw_status, 1
+            needed = FALL_AFTER if STATUS_RANK[raw_status] > STATUS_RANK[self.status] else RISE_AFTER
+            if self.streak >= needed:
+                self.status, self.candidate, self.streak = raw_status, None, 0
+        return self.status
+
+
+def publish_status(code: str, status: Dict[str, Any]) -> None:
+    with _local_lock:
+        _local_status[code] = (time.monotonic(), status)
+    cache.set(PROVIDER_STATUS_KEY.format(code=code), status, PROVIDER_STATUS_TTL)
+
+
+def _latest_check_status(code: str) -> Optional[Dict[str, Any]]:
+    check = (
+        ProviderHealthCheck.objects.filter(
+            provider__code=code,
+            details__source=PROBE_SOURCE,
+            checked_at__gte=timezone.now() - timedelta(seconds=PROVIDER_STATUS_TTL),
+        )
+        .order_by("-checked_at", "-id")
+        .only("status", "latency_ms", "details", "checked_at")
+        .first()
+    )
+    if check is None:
+        return None
+    details = check.details if isinstance(check.details, dict) else {}
+    return {
+        "status": check.status,
+        "observed": details.get("observed", check.status),
+        "latency_ms": check.latency_ms,
+        "checked_at": check.checked_at.isoformat(),
+    }
+
+
+def get_provider_status(code: str) -> Optional[Dict[str, Any]]:
+    """
+    آخرین وضعیت منتشرشده ({"status", "latency_ms", "checked_at", ...}). اول کش مشترک و اگر
+    daemon در آن ننوشته باشد (یا کش خالی شده باشد) آخرین ProviderHealthCheck خود probe_providers
+    تازه‌تر از PROVIDER_STATUS_TTL؛ cooldownهای کوتاه SmsRouter ارائه‌دهنده را DOWN نمی‌کنند. نتیجه چند ثانیه در پروسه نگه داشته می‌شود تا مسیر داغ (routing)
+    هر بار به کش یا دیتابیس نرود.
+    """
+    now = time.monotonic()
+    with _local_lock:
+        entry = _local_status.get(code)
+    if entry and now - entry[0] < LOCAL_STATUS_TTL:
+        return entry[1]
+    status = cache.get(PROVIDER_STATUS_KEY.format(code=code))
+    if status is None:
+        status = _latest_check_status(code)
+    with _local_lock:
+        _local_status[code] = (now, status)
+    return status
+
+
+def is_provider_down(code: str) -> bool:
+    status = get_provider_status(code)
+    return bool(status) and status.get("status") == "DOWN"
+
+
+class ProviderProber:
+    """
+    یک دور probe هم‌زمان روی همه IntegrationProviderهای فعالی که probe دارند،
+    اعمال هیسترزیس، انتشار وضعیت و ذخیره ProviderHealthCheck با یک bulk_create.
+    """
+
+    def __init__(self, workers: int = 4, timeout: float = 5, session: Optional[requests.Session] = None):
+        self.workers = workers
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.states: Dict[int, HealthState] = {}
+
+    def _probe(self, provider: IntegrationProvider) -> ProbeResult:
+        try:
+            return PROBES[provider.kind](provider, self.session, self.timeout)
+        except Exception as exc:
+            logger.exception("Probe for %s crashed", provider.code)
+            return "DOWN", None, {"error": str(exc)[:200]}
+
+    def run_once(self) -> List[ProviderHealthCheck]:
+        providers = list(IntegrationProvider.objects.filter(is_active=True, kind__in=PROBES).order_by("id"))
+        if not providers:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(providers)))) as pool:
+            results = list(pool.map(self._probe, providers))
+
+        checked_at = timezone.now()
+        checks = []
+        for provider, (raw_status, latency_ms, details) in zip(providers, results):
+            state = self.states.setdefault(provider.id, HealthState())
+            status = state.observe(raw_status)
+            details = {**details, "source": PROBE_SOURCE}
+            if status != raw_status:
+                details["observed"] = raw_status
+            checks.append(
+                ProviderHealthCheck(
+                    provider=provider, status=status, latency_ms=latency_ms, details=details, checked_at=checked_at
+                )
+            )
+            publish_status(
+                provider.code,
+                {"status": status, "observed": raw_status, "latency_ms": latency_ms, "checked_at": checked_at.isoformat()},
+            )
+        ProviderHealthCheck.objects.bulk_create(checks)
+        return checks
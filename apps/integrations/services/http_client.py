@@ -0,0 +1,359 @@
+import functools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections
+from requests.adapters import HTTPAdapter
+
+from integrations.models import IntegrationEndpoint
+from integrations.services import request_log
+
+logger = logging.getLogger(__name__)
+
+# پیش‌فرض هر endpoint وقتی ردیف IntegrationEndpoint برایش تعریف نشده:
+# (method، path نسبت به base_url سرویس، read timeout، تعداد تکرار)
+# فقط درخواست‌های idempotent تکرار می‌شوند؛ ساخت تراکنش و ارسال پیامک تکرار نمی‌شود.
+ENDPOINT_DEFAULTS: Dict[Tuple[str, str], Tuple[str, str, float, int]] = {
+    ("PAYMENT", "create_payment"): ("POST", "/request", 15, 0),
+    ("PAYMENT", "verify_payment"): ("POST", "/verify", 15, 2),
+    ("PAYMENT", "inquire_payment"): ("POST", "/inquiry", 15, 2),
+    ("SMS", "send_sms"): ("POST", "/messages", 10, 0),
+    ("SMS", "send_pattern"): ("POST", "/api/SendSMS/BaseServiceNumber", 3, 0),
+}
+# endpointهای تلگرام همان نام متد Bot API هستند (sendMessage، getUpdates، ...)؛ TelegramClient
+# تکرار کامل را فقط برای متدهای idempotent (IDEMPOTENT_METHOD_PREFIXES) انجام می‌دهد
+KIND_DEFAULTS: Dict[str, Tuple[str, str, float, int]] = {
+    "TELEGRAM": ("POST", "", 10, 3),
+}
+FALLBACK_DEFAULT = ("POST", "", 15, 0)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """
+    میزبان بعد از چند خطای پشت سر هم موقتاً کنار گذاشته شده و درخواست اصلاً فرستاده نشد.
+    زیرکلاس RequestException است تا مسیرهای خطای شبکه فعلی همین را هم پوشش دهند.
+    """
+
+
+class CircuitBreaker:
+    """
+    قطع‌کننده مدار برای یک میزبان: بعد از failure_threshold خطای پشت سر هم (خطای شبکه یا 5xx)
+    باز می‌شود و تا reset_seconds درخواستی نمی‌گذرد؛ بعد یک درخواست آزمایشی (half-open)
+    اجازه می‌گیرد که موفقیتش مدار را می‌بندد و خطایش دوباره بازش می‌کند.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            if self.opened_at is None:
+                return "CLOSED"
+            if self.probing or self.clock() - self.opened_at >= self.reset_seconds:
+                return "HALF_OPEN"
+            return "OPEN"
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or self.clock() - self.opened_at < self.reset_seconds:
+                return False
+            self.probing = True
+            return True
+
+    def record(self, ok: bool) -> None:
+        with self.lock:
+            self.probing = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+
+
+class ResolvedEndpoint:
+    def __init__(
+        self,
+        kind: str,
+        code: str,
+        url: str,
+        method: str,
+        connect_timeout: float,
+        read_timeout: float,
+        retries: int,
+        provider_id: Optional[int] = None,
+    ):
+        self.kind = kind
+        self.code = code
+        self.url = url
+        self.method = method
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.provider_id = provider_id
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        return (self.connect_timeout, self.read_timeout)
+
+
+def _host(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def _join(base_url: str, path: str) -> str:
+    if path.startswith(("http://", "https://")):
+        return path
+    if not path:
+        return base_url.rstrip("/")
+    return f"{base_url.rstrip('/')}/{path.lstrip('/')}"
+
+
+class OutboundClient:
+    """
+    لایه مشترک درخواست‌های بیرونی (پرداخت، پیامک، تلگرام):
+
+    - یک Session با pool اتصال برای هر میزبان (keep-alive بین درخواست‌ها و threadها)؛
+    - resolve(kind, code): آدرس، متد و timeout از IntegrationEndpoint فعال (با base_url ارائه‌دهنده)
+      و در نبود آن از ENDPOINT_DEFAULTS و base_url خود سرویس. ردیف‌ها یک کوئری در هر
+      OUTBOUND_CONFIG_TTL_SECONDS خوانده و در حافظه نگه داشته می‌شوند؛
+    - request(): تکرار با backoff برای endpointهای idempotent، قطع‌کننده مدار برای هر میزبان
+      و ثبت ExternalRequestLog برای هر تلاش.
+    """
+
+    def __init__(
+        self,
+        pool_size: Optional[int] = None,
+        connect_timeout: Optional[float] = None,
+        config_ttl: Optional[float] = None,
+        failure_threshold: Optional[int] = None,
+        reset_seconds: Optional[float] = None,
+        backoff_base: Optional[float] = None,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.pool_size = pool_size or getattr(settings, "OUTBOUND_POOL_SIZE", 32)
+        self.connect_timeout = connect_timeout or getattr(settings, "OUTBOUND_CONNECT_TIMEOUT", 3)
+        self.config_ttl = config_ttl if config_ttl is not None else getattr(settings, "OUTBOUND_CONFIG_TTL_SECONDS", 60)
+        self.failure_threshold = failure_threshold or getattr(settings, "OUTBOUND_BREAKER_FAILURES", 5)
+        self.reset_seconds = reset_seconds or getattr(settings, "OUTBOUND_BREAKER_RESET_SECONDS", 30)
+        self.backoff_base = backoff_base if backoff_base is not None else getattr(settings, "OUTBOUND_RETRY_BACKOFF", 0.3)
+        self.clock = clock
+        self.sleep = sleep
+        self.sessions: Dict[str, requests.Session] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.lock = threading.Lock()
+        self.endpoints: Dict[Tuple[str, str], List[IntegrationEndpoint]] = {}
+        self.config_loaded_at: Optional[float] = None
+        self.config_lock = threading.Lock()
+
+    def session_for(self, url: str) -> requests.Session:
+        host = _host(url)
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self.sessions[host] = session
+            return session
+
+    def breaker_for(self, url: str) -> CircuitBreaker:
+        host = _host(url)
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = self.breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_seconds, self.clock)
+            return breaker
+
+    def _load_endpoints(self) -> Dict[Tuple[str, str], List[IntegrationEndpoint]]:
+        now = self.clock()
+        with self.config_lock:
+            if self.config_loaded_at is not None and now - self.config_loaded_at < self.config_ttl:
+                return self.endpoints
+            try:
+                rows = list(
+                    IntegrationEndpoint.objects.filter(is_active=True, provider__is_active=True)
+                    .select_related("provider")
+                    .order_by("provider_id")
+                )
+            except Exception:
+                # پیکربندی در دسترس نیست (مثلاً قبل از migrate)؛ آخرین نسخه یا پیش‌فرض‌ها کار را پیش می‌برند
+                logger.warning("Could not load integration endpoints; keeping previous config", exc_info=True)
+                self.config_loaded_at = now
+                return self.endpoints
+            endpoints: Dict[Tuple[str, str], List[IntegrationEndpoint]] = {}
+            for endpoint in rows:
+                endpoints.setdefault((endpoint.provider.kind, endpoint.code), []).append(endpoint)
+            self.endpoints = endpoints
+            self.config_loaded_at = now
+            return endpoints
+
+    def invalidate(self) -> None:
+        with self.config_lock:
+            self.config_loaded_at = None
+
+    def resolve(
+        self, kind: str, code: str, base_url: str = "", provider_code: Optional[str] = None
+    ) -> ResolvedEndpoint:
+        """
+        base_url آدرس پیش‌فرض سرویس از تنظیمات است. اگر IntegrationEndpoint فعالی برای (kind، code)
+        باشد، path آن (نسبت به base_url ارائه‌دهنده، یا آدرس کامل)، method و timeout_seconds آن
+        جای پیش‌فرض را می‌گیرند. provider_code ارائه‌دهنده مشخصی را انتخاب می‌کند.
+        """
+        method, path, read_timeout, retries = ENDPOINT_DEFAULTS.get(
+            (kind, code), KIND_DEFAULTS.get(kind, FALLBACK_DEFAULT)
+        )
+        candidates = self._load_endpoints().get((kind, code)) or []
+        if provider_code:
+            candidates = [endpoint for endpoint in candidates if endpoint.provider.code == provider_code]
+        if not candidates:
+            return ResolvedEndpoint(
+                kind, code, _join(base_url, path), method, self.connect_timeout, read_timeout, retries
+            )
+        endpoint = candidates[0]
+        provider = endpoint.provider
+        return ResolvedEndpoint(
+            kind,
+            code,
+            _join(provider.base_url or base_url, endpoint.path or path),
+            endpoint.method,
+            self.connect_timeout,
+            float(endpoint.timeout_seconds),
+            retries,
+            provider_id=provider.id,
+        )
+
+    def _backoff(self, attempt: int, response=None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        try:
+            if retry_after is not None:
+                return min(max(float(retry_after), 0.0), 30.0)
+        except (TypeError, ValueError):
+            pass
+        return self.backoff_base * (2**attempt)
+
+    def request(
+        self,
+        kind: str,
+        code: str,
+        base_url: str = "",
+        provider_code: Optional[str] = None,
+        json: Any = None,
+        data: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        **log_fields,
+    ) -> requests.Response:
+        """
+        ارسال درخواست endpoint با سیاست تکرار و قطع‌کننده مدار. پاسخ آخر (حتی 4xx/5xx) برگردانده
+        می‌شود؛ خطای شبکه بعد از آخرین تلاش و مدار باز به صورت RequestException بالا می‌رود.
+        timeout سقف read timeout (مثلاً مهلت باقی‌مانده فراخواننده) است.
+        log_fields به request_log.outbound می‌رود (order_id، redact_keys، ...).
+        """
+        endpoint = self.resolve(kind, code, base_url, provider_code)
+        session = self.session_for(endpoint.url)
+        breaker = self.breaker_for(endpoint.url)
+        read_timeout = min(endpoint.read_timeout, timeout) if timeout else endpoint.read_timeout
+        log_fields.setdefault("provider_id", endpoint.provider_id)
+
+        for attempt in range(endpoint.retries + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {_host(endpoint.url)} ({kind}:{code})")
+            try:
+                with request_log.outbound(
+                    kind, endpoint.method, endpoint.url, body=json if json is not None else data, headers=headers,
+                    **log_fields,
+                ) as outbound_call:
+                    response = outbound_call.response = session.request(
+                        endpoint.method,
+                        endpoint.url,
+                        json=json,
+                        data=data,
+                        headers=headers,
+                        timeout=(endpoint.connect_timeout, read_timeout),
+                    )
+            except requests.RequestException as exc:
+                breaker.record(False)
+                if attempt >= endpoint.retries:
+                    raise
+                logger.warning("%s:%s request error (attempt %s): %s", kind, code, attempt + 1, exc)
+                self.sleep(self._backoff(attempt))
+                continue
+
+            if response.status_code >= 500:
+                breaker.record(False)
+            elif response.status_code != 429:
+                breaker.record(True)
+            if (response.status_code >= 500 or response.status_code == 429) and attempt < endpoint.retries:
+                logger.warning("%s:%s returned %s (attempt %s)", kind, code, response.status_code, attempt + 1)
+                self.sleep(self._backoff(attempt, response))
+                continue
+            return response
+        return response
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            breakers = dict(self.breakers)
+            hosts = list(self.sessions)
+        return {"hosts": hosts, "breakers": {host: breaker.state for host, breaker in breakers.items()}}
+
+
+_client: Optional[OutboundClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> OutboundClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OutboundClient()
+    return _client
+
+
+def reset_client() -> None:
+    """
+    sessionها، قطع‌کننده‌ها و پیکربندی کش‌شده را دور می‌اندازد (مثلاً بعد از تغییر تنظیمات در تست).
+    """
+    global _client
+    with _client_lock:
+        _client = None
+
+
+def pool_task(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    پوشش کاری که به ThreadPoolExecutor داده می‌شود: resolve بعد از گذشت TTL پیکربندی endpointها
+    را روی همان thread از دیتابیس می‌خواند و اتصالی که thread کارگر باز کرده باید در پایان بسته شود.
+    فقط برای threadهای pool؛ روی thread درخواست ممکن است اتصال داخل تراکنش را ببندد.
+    """
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return run
+
+
+def request(kind: str, code: str, base_url: str = "", **kwargs) -> requests.Response:
+    return get_client().request(kind, code, base_url, **kwargs)
@@ -0,0 +1,28 @@
+from typing import Any, Dict
+
+from django.core.cache import cache
+
+from catalog.services import get_catalog_version
+from integrations.services import telegram
+from orders.services import menu_products_for_vendor
+
+MENU_KEYBOARD_KEY = "telegram:menu:{vendor_id}:{version}"
+# ترتیب منو به محبوبیت هم بستگی دارد که با هر سفارش عوض می‌شود؛ کش بعد از این مدت تازه می‌شود
+MENU_KEYBOARD_TTL = 600
+
+
+def get_menu_keyboard_pages(vendor_id: int) -> list:
+    """
+    صفحه‌های کیبورد منوی وندور از کش با کلید نسخه کاتالوگ. در حالت hit هیچ کوئری‌ای به جداول کاتالوگ زده نمی‌شود.
+    """
+    key = MENU_KEYBOARD_KEY.format(vendor_id=vendor_id, version=get_catalog_version(vendor_id))
+    pages = cache.get(key)
+    if pages is None:
+        pages = telegram.build_menu_keyboard_pages(menu_products_for_vendor(vendor_id))
+        cache.set(key, pages, MENU_KEYBOARD_TTL)
+    return pages
+
+
+def get_menu_keyboard(vendor_id: int, page: int = 0) -> Dict[str, Any]:
+    pages = get_menu_keyboard_pages(vendor_id)
+    return pages[min(max(page, 0), len(pages) - 1)]
@@ -1,14 +1,28 @@
 import logging
-from typing import Any, Dict, Optional
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
 
-import requests
 from django.conf import settings
+from django.core.cache import cache
 from django.http import HttpRequest
 from django.urls import reverse
 from core.utils import normalize_phone
+from integrations.services import http_client
 
 logger = logging.getLogger(__name__)
 
+CALLBACK_LOCK_KEY = "payment:callback:lock:{track_id}"
+CALLBACK_RESULT_KEY = "payment:callback:result:{track_id}"
+# قفل باید از timeout درخواست verify (۱۵ ثانیه) بیشتر بماند
+CALLBACK_LOCK_TTL = 30
+CALLBACK_RESULT_TTL = 10 * 60
+# انتظار برای نتیجه صاحب قفل حدود timeout همان verify است؛ بعد از آن صاحب قفل گیر کرده
+CALLBACK_WAIT_SECONDS = 15
+# فاصله سرکشی به کش از ۰٫۲ ثانیه شروع می‌شود و تا سقف ۲ ثانیه بزرگ می‌شود
+CALLBACK_POLL_SECONDS = 0.2
+CALLBACK_POLL_MAX_SECONDS = 2.0
+
 
 def _base_url() -> str:
     base_url = settings.PAYMENT_GATEWAY_BASE_URL.rstrip("/") if settings.PAYMENT_GATEWAY_BASE_URL else ""
@@ -19,6 +33,11 @@ def _base_url() -> str:
     return base_url
 
 
+def _start_url(track_id) -> str:
+    # صفحه پرداخت روی همان دامنه درگاه است (سرور جعلی هم /start/<trackId> دارد)
+    return f"{_base_url()[: -len('/v1')]}/start/{track_id}"
+
+
 def _merchant_id() -> str:
     return settings.PAYMENT_MERCHANT_ID
 
@@ -53,13 +72,21 @@ def create_payment(order) -> Optional[Dict[str, Any]]:
     }
 
     try:
-        response = requests.post(f"{_base_url()}/request", json=payload, headers=_request_headers(), timeout=15)
+        response = http_client.request(
+            "PAYMENT",
+            "create_payment",
+            _base_url(),
+            json=payload,
+            headers=_request_headers(),
+            order_id=order.pk,
+            user_id=order.user_id,
+        )
         response.raise_for_status()
         data = response.json()
         result = data.get("result")
         message = data.get("message")
         track_id = data.get("trackId")
-        payment_url = f"https://gateway.zibal.ir/start/{track_id}" if track_id else None
+        payment_url = _start_url(track_id) if track_id else None
 
         if result in {100, 201} and payment_url:
             return {**data, "payment_url": payment_url, "order_id": payload["orderId"], "message": message}
@@ -71,11 +98,7 @@ def create_payment(order) -> Optional[Dict[str, Any]]:
         return {"payment_url": None, "message": "exception", "error": str(exc)}
 
 
-def verify_payment(request: HttpRequest) -> Optional[Dict[str, Any]]:
-    if not _base_url() or not _merchant_id():
-        logger.warning("Payment gateway configuration missing; cannot verify payment")
-        return None
-
+def extract_track_id(request: HttpRequest) -> Optional[str]:
     payload = request.data if hasattr(request, "data") else {}
     payload = payload or getattr(request, "POST", {})
     payload = payload or getattr(request, "GET", {})
@@ -87,21 +110,80 @@ def verify_payment(request: HttpRequest) -> Optional[Dict[str, Any]]:
             value = value[0] if value else None
         return str(value) if value is not None else None
 
-    track_id = _extract_value(payload, "trackId") or _extract_value(payload, "track_id")
+    return _extract_value(payload, "trackId") or _extract_value(payload, "track_id")
+
+
+def verify_payment(request: HttpRequest) -> Optional[Dict[str, Any]]:
+    if not _base_url() or not _merchant_id():
+        logger.warning("Payment gateway configuration missing; cannot verify payment")
+        return None
+
+    track_id = extract_track_id(request)
     if not track_id:
         return None
+    return verify_track_id(track_id)
+
+
+def single_flight_callback(
+    track_id: str, process: Callable[[], Tuple[Dict[str, Any], int, bool]]
+) -> Tuple[Dict[str, Any], int]:
+    """
+    callbackهای تکراری درگاه (redirect GET و notify POST) برای یک trackId فقط یک بار پردازش می‌شوند.
+    process خروجی (payload، status_code، قابل کش بودن) دارد. اولین درخواست قفل را می‌گیرد و
+    نتیجه قطعی را CALLBACK_RESULT_TTL نگه می‌دارد؛ بقیه تا CALLBACK_WAIT_SECONDS منتظر همان نتیجه
+    می‌مانند و verify دوباره صدا زده نمی‌شود. نتیجه غیرقطعی (خطای شبکه) کش نمی‌شود تا تکرار بعدی
+    دوباره امتحان کند. قفل و نتیجه در کش مشترک (CACHES، بررسی core.E001) هستند تا بین workerها
+    هم اثر کنند؛ قفل ردیف سفارش در _process_payment_callback پشتوانه آخر است.
+    مقدار قفل توکن صاحبش است و فقط همان صاحب آن را پاک می‌کند، تا اگر قفل منقضی شد و
+    درخواست دیگری آن را گرفت، قفل او آزاد نشود.
+    """
+    result_key = CALLBACK_RESULT_KEY.format(track_id=track_id)
+    lock_key = CALLBACK_LOCK_KEY.format(track_id=track_id)
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + CALLBACK_WAIT_SECONDS
+    delay = CALLBACK_POLL_SECONDS
+    while True:
+        cached = cache.get(result_key)
+        if cached is not None:
+            return cached["payload"], cached["status_code"]
+        if cache.add(lock_key, token, CALLBACK_LOCK_TTL):
+            try:
+                cached = cache.get(result_key)
+                if cached is not None:
+                    return cached["payload"], cached["status_code"]
+                payload, status_code, cacheable = process()
+                if cacheable:
+                    cache.set(result_key, {"payload": payload, "status_code": status_code}, CALLBACK_RESULT_TTL)
+                return payload, status_code
+            finally:
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            # صاحب قفل گیر کرده؛ پردازش مستقیم (قفل ردیف سفارش جلوی اعلان تکراری را می‌گیرد)
+            logger.warning("Payment callback for %s still locked after %ss; processing anyway", track_id, CALLBACK_WAIT_SECONDS)
+            payload, status_code, _cacheable = process()
+            return payload, status_code
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, CALLBACK_POLL_MAX_SECONDS)
+
+
+def verify_track_id(track_id: str) -> Optional[Dict[str, Any]]:
+    """
+    تایید (settle) تراکنش با trackId؛ هم callback درگاه و هم reconciliation از آن استفاده می‌کنند.
+    """
+    if not _base_url() or not _merchant_id():
+        logger.warning("Payment gateway configuration missing; cannot verify payment")
+        return None
 
     try:
-        response = requests.post(
-            f"{_base_url()}/verify",
-            json={"merchant": _merchant_id(), "trackId": track_id},
-            headers=_request_headers(),
-            timeout=15,
-        )
+        body = {"merchant": _merchant_id(), "trackId": track_id}
+        response = http_client.request("PAYMENT", "verify_payment", _base_url(), json=body, headers=_request_headers())
         response.raise_for_status()
         data = response.json()
         payment_success = data.get("result") in {100, 101}
-        order_id = _extract_value(data, "orderId") or _extract_value(data, "order_id")
+        order_id = data.get("orderId") or data.get("order_id")
+        order_id = str(order_id) if order_id is not None else None
         return {
             "order_id": order_id,
             "status": "PAID" if payment_success else "FAILED",
@@ -113,3 +195,32 @@ def verify_payment(request: HttpRequest) -> Optional[Dict[str, Any]]:
     except Exception as exc:  # pragma: no cover - logging side-effect
         logger.exception("Payment verification failed: %s", exc)
         return None
+
+
+def inquire_payment(track_id: str) -> Optional[Dict[str, Any]]:
+    """
+    استعلام وضعیت تراکنش (بدون تایید). status زیبال: 1 پرداخت‌شده و تاییدشده،
+    2 پرداخت‌شده و تاییدنشده، -1 در انتظار، سایر مقادیر ناموفق.
+    """
+    if not _base_url() or not _merchant_id():
+        logger.warning("Payment gateway configuration missing; cannot inquire payment")
+        return None
+
+    body = {"merchant": _merchant_id(), "trackId": track_id}
+    try:
+        response = http_client.request("PAYMENT", "inquire_payment", _base_url(), json=body, headers=_request_headers())
+        response.raise_for_status()
+        data = response.json()
+    except Exception as exc:
+        logger.warning("Payment inquiry for %s failed: %s", track_id, exc)
+        return None
+    order_id = data.get("orderId")
+    return {
+        "track_id": str(track_id),
+        "result": data.get("result"),
+        "status": data.get("status"),
+        "order_id": str(order_id) if order_id is not None else None,
+        "amount": data.get("amount"),
+        "ref_number": data.get("refNumber"),
+        "message": data.get("message"),
+    }
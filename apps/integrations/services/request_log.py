@@ -0,0 +1,250 @@
+import atexit
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, List, Optional
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from integrations.models import ExternalRequestLog, IntegrationProvider
+
+logger = logging.getLogger(__name__)
+
+SECRET_KEYS = {"password", "merchant", "token", "api_key", "apikey", "authorization", "secret", "x-api-key", "cookie"}
+# تنظیماتی که مقدارشان اگر جایی در URL یا پیام خطا آمد ماسک می‌شود
+SECRET_SETTINGS = ("TELEGRAM_BOT_TOKEN", "SMS_PASSWORD", "SMS_API_KEY", "PAYMENT_MERCHANT_ID", "PAYMENT_API_KEY")
+BOT_TOKEN_IN_PATH = re.compile(r"/bot[^/]+/")
+MASK = "***"
+MAX_BODY_CHARS = 4000
+MAX_BUFFER = 10_000
+
+
+def _secret_values() -> List[str]:
+    values = [str(getattr(settings, name, "") or "") for name in SECRET_SETTINGS]
+    return [value for value in values if len(value) >= 6]
+
+
+def redact_text(text: str) -> str:
+    text = BOT_TOKEN_IN_PATH.sub(f"/bot{MASK}/", text or "")
+    for value in _secret_values():
+        text = text.replace(value, MASK)
+    return text
+
+
+def redact(data: Any, extra_keys: Iterable[str] = ()) -> Any:
+    """
+    کپی ماسک‌شده dict/list؛ کلیدهای حساس (و extra_keys) با *** جایگزین و رشته‌های بلند کوتاه می‌شوند.
+    """
+    keys = SECRET_KEYS | {key.lower() for key in extra_keys}
+    if isinstance(data, dict):
+        return {
+            str(key): MASK if str(key).lower() in keys else redact(value, extra_keys) for key, value in data.items()
+        }
+    if isinstance(data, (list, tuple)):
+        return [redact(value, extra_keys) for value in data]
+    if isinstance(data, str) and len(data) > MAX_BODY_CHARS:
+        return data[:MAX_BODY_CHARS] + "…"
+    if isinstance(data, (str, int, float, bool)) or data is None:
+        return data
+    return str(data)
+
+
+def _response_body(response) -> Any:
+    content = getattr(response, "content", b"") or b""
+    if not isinstance(content, (bytes, str)):
+        return None
+    text = content.decode("utf-8", errors="replace") if isinstance(content, bytes) else content
+    if len(text) > MAX_BODY_CHARS:
+        return {"truncated": True, "raw": text[:MAX_BODY_CHARS]}
+    try:
+        return json.loads(text)
+    except ValueError:
+        return {"raw": text} if text else None
+
+
+class OutboundCall:
+    """
+    زمان‌سنجی یک درخواست بیرونی:
+
+        with request_log.outbound("TELEGRAM", "POST", url, body=payload) as call:
+            call.response = session.post(url, json=payload)
+
+    در خروج (موفق یا با exception) فقط یک dict به بافر اضافه می‌شود؛ ماسک کردن، تبدیل و INSERT
+    در thread پس‌زمینه انجام می‌شود.
+    """
+
+    def __init__(self, recorder: "ExternalRequestRecorder", kind: str, method: str, url: str, **fields):
+        self.recorder = recorder
+        self.entry = {"kind": kind, "method": method, "url": url, **fields}
+        self.response = None
+
+    def __enter__(self) -> "OutboundCall":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.entry.update(
+            duration_ms=int((time.perf_counter() - self.started) * 1000),
+            response=self.response,
+            error=exc,
+            at=timezone.now(),
+        )
+        self.recorder.record(self.entry)
+        return False
+
+
+class ExternalRequestRecorder:
+    """
+    بافر درون‌حافظه ExternalRequestLog با flush دوره‌ای (bulk_create) در یک thread پس‌زمینه.
+    بافر سقف دارد؛ اگر پایگاه داده عقب بماند، رکوردهای اضافه دور ریخته و شمرده می‌شوند.
+    flush_interval صفر یعنی بدون thread؛ رکوردها تا flush() دستی در بافر می‌مانند (load test).
+    """
+
+    def __init__(self, flush_interval: Optional[float] = None, batch_size: int = 200, max_buffer: int = MAX_BUFFER):
+        self._flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        self.buffer: deque = deque()
+        self.dropped = 0
+        self.flushed = 0
+        self.wakeup = threading.Event()
+        self.flush_lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.thread_lock = threading.Lock()
+        self.provider_ids: Dict[str, int] = {}
+        self.known_provider_ids: set = set()
+
+    @property
+    def flush_interval(self) -> float:
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return float(getattr(settings, "EXTERNAL_REQUEST_LOG_FLUSH_SECONDS", 1.0))
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        if not getattr(settings, "EXTERNAL_REQUEST_LOG_ENABLED", True):
+            return
+        if len(self.buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        self.buffer.append(entry)
+        if self.thread is None and self.flush_interval > 0:
+            self._start()
+        if len(self.buffer) >= self.batch_size:
+            self.wakeup.set()
+
+    def _start(self) -> None:
+        with self.thread_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="external-request-log", daemon=True)
+                self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self.wakeup.wait(self.flush_interval or 1.0)
+            self.wakeup.clear()
+            if self.flush_interval <= 0:
+                continue
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not flush external request logs")
+            finally:
+                close_old_connections()
+
+    def _load_provider_ids(self, entries: List[Dict[str, Any]]) -> None:
+        """
+        یک کوئری در هر flush: اولین ارائه‌دهنده فعال هر نوع (TELEGRAM/SMS/PAYMENT) و وجود
+        provider_idهای صریح (ارائه‌دهنده‌ای که در این فاصله حذف شده، کل batch را خراب نکند).
+        """
+        kinds = {entry["kind"] for entry in entries}
+        explicit_ids = {entry["provider_id"] for entry in entries if entry.get("provider_id")}
+        self.provider_ids = {}
+        self.known_provider_ids = set()
+        for kind, provider_id, is_active in (
+            IntegrationProvider.objects.filter(Q(kind__in=kinds, is_active=True) | Q(id__in=explicit_ids))
+            .order_by("-id")
+            .values_list("kind", "id", "is_active")
+        ):
+            self.known_provider_ids.add(provider_id)
+            if is_active and kind in kinds:
+                self.provider_ids[kind] = provider_id
+
+    def build_row(self, entry: Dict[str, Any]) -> ExternalRequestLog:
+        response = entry.get("response")
+        error = entry.get("error")
+        extra_keys = entry.get("redact_keys") or ()
+        status_code = getattr(response, "status_code", None)
+        status_code = status_code if isinstance(status_code, int) else None
+        headers = getattr(response, "headers", None)
+        if isinstance(error, requests.Timeout):
+            outcome = "TIMEOUT"
+        elif error is not None or status_code is None or status_code >= 400:
+            outcome = "FAIL"
+        else:
+            outcome = "SUCCESS"
+
+        return ExternalRequestLog(
+            provider_id=(
+                entry["provider_id"]
+                if entry.get("provider_id") in self.known_provider_ids
+                else self.provider_ids.get(entry["kind"])
+            ),
+            order_id=entry.get("order_id"),
+            vendor_id=entry.get("vendor_id"),
+            user_id=entry.get("user_id"),
+            trace_id=entry.get("trace_id") or "",
+            request_url=redact_text(entry["url"])[:500],
+            request_method=entry["method"][:10],
+            request_headers=redact(entry.get("headers")) if entry.get("headers") else None,
+            request_body=redact(entry.get("body"), extra_keys),
+            response_status=status_code,
+            response_headers=redact(dict(headers)) if isinstance(headers, Mapping) else None,
+            response_body=redact(_response_body(response), extra_keys) if response is not None else None,
+            duration_ms=entry["duration_ms"],
+            outcome=outcome,
+            error_message=redact_text(str(error))[:500] if error is not None else "",
+            created_at=entry["at"],
+        )
+
+    def flush(self) -> int:
+        with self.flush_lock:
+            entries = []
+            while self.buffer:
+                entries.append(self.buffer.popleft())
+            if not entries:
+                return 0
+            self._load_provider_ids(entries)
+            rows = [self.build_row(entry) for entry in entries]
+            ExternalRequestLog.objects.bulk_create(rows, batch_size=500)
+            self.flushed += len(rows)
+            return len(rows)
+
+    def metrics(self) -> Dict[str, int]:
+        return {"pending": len(self.buffer), "flushed": self.flushed, "dropped": self.dropped}
+
+
+recorder = ExternalRequestRecorder()
+
+
+def outbound(kind: str, method: str, url: str, **fields) -> OutboundCall:
+    """
+    fields: body, headers, provider_id, order_id, vendor_id, user_id, trace_id,
+    redact_keys (کلیدهای حساس اضافه این درخواست، مثلاً متن پیامک OTP).
+    """
+    return OutboundCall(recorder, kind, method, url, **fields)
+
+
+@atexit.register
+def _flush_on_exit() -> None:
+    try:
+        recorder.flush()
+    except Exception:
+        logger.exception("Could not flush external request logs on exit")
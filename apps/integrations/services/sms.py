@@ -1,9 +1,10 @@
 import logging
 from typing import Any, Dict, Optional
 from datetime import datetime, timedelta
-import requests
 from django.conf import settings
 
+from integrations.services import http_client
+
 logger = logging.getLogger(__name__)
 
 
@@ -31,7 +32,7 @@ def _send_base_service_number_sms(
     mobile: str, body_id: int, text: str, mock_label: str = "PATTERN", extra_mock_fields: Optional[Dict[str, Any]] = None
 ) -> Dict[str, Any]:
     """
-    ارسال پیامک پترنی با وب‌سرویس BaseServiceNumber (ملی‌پیامک).
+    ارسال پیامک پترنی با وب‌سرویس BaseServiceNumber (ملی‌پیامک) از طریق SmsRouter.
     """
     mode = getattr(settings, "SMS_MODE", "real")
 
@@ -48,36 +49,11 @@ def _send_base_service_number_sms(
             mock_response.update(extra_mock_fields)
         return mock_response
 
-    url = _rest_base_url() + "/api/SendSMS/BaseServiceNumber"
-    payload = {
-        "username": getattr(settings, "SMS_USERNAME", ""),
-        "password": getattr(settings, "SMS_PASSWORD", ""),
-        "text": str(text),
-        "to": mobile,
-        "bodyId": body_id,
-    }
-
-    try:
-        resp = requests.post(url, data=payload, timeout=10)
-    except Exception as e:
-        logger.exception("Payamak-panel request failed")
-        return {"ok": False, "error": str(e)}
-
-    if resp.status_code != 200:
-        logger.error("Payamak-panel HTTP error %s: %s", resp.status_code, resp.text)
-        return {
-            "ok": False,
-            "http_status": resp.status_code,
-            "raw": resp.text,
-        }
-
-    try:
-        data = resp.json()
-    except ValueError:
-        logger.error("Payamak-panel non-JSON response: %s", resp.text)
-        return {"ok": False, "raw": resp.text}
+    # ارسال واقعی از مسیریاب می‌گذرد: انتخاب سالم‌ترین ارائه‌دهنده و failover تا SMS_ROUTER_DEADLINE
+    from integrations.services.sms_router import get_router  # sms_router خودش از این ماژول import می‌کند
 
-    logger.info("Payamak-panel response: %s", data)
+    data = get_router().send(mobile, body_id, text)
+    logger.info("SMS %s response for %s: %s", mock_label, mobile, data)
     return data
 
 
@@ -93,7 +69,7 @@ def send_sms(mobile: str, text: str) -> bool:
     }
 
     try:
-        response = requests.post(f"{_base_url()}/messages", json=payload, headers=_headers(), timeout=10)
+        response = http_client.request("SMS", "send_sms", _base_url(), json=payload, headers=_headers())
         response.raise_for_status()
         return True
     except Exception as exc:  # pragma: no cover - logging side-effect
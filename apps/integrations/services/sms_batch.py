@@ -0,0 +1,221 @@
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from integrations.services import http_client, sms
+
+logger = logging.getLogger(__name__)
+
+BATCH_LATENCY_SAMPLES = 200
+
+
+def join_last_param(messages: List["QueuedSms"]) -> List[Any]:
+    """
+    ادغام پیش‌فرض: پارامترهای پیام اول، با آخرین پارامتر همه پیام‌ها که با «، » به هم وصل شده‌اند
+    (مثلاً [نام فروشنده، "A1B2، C3D4"] برای چند سفارش پشت سر هم).
+    """
+    params = list(messages[0].params)
+    if params:
+        params[-1] = "، ".join(str(message.params[-1]) for message in messages if message.params)
+    return params
+
+
+class QueuedSms:
+    def __init__(self, mobile: str, body_id: int, params: List[Any], coalesce_key: Optional[str], merge: Callable):
+        self.mobile = mobile
+        self.body_id = body_id
+        self.params = list(params or [])
+        self.coalesce_key = coalesce_key
+        self.merge = merge
+        self.enqueued_at = time.monotonic()
+
+
+class SmsBatcher:
+    """
+    صف پیامک‌های پترنی اعلان سفارش. پیام‌ها با پر شدن max_batch یا گذشتن window ثانیه
+    یکجا flush می‌شوند. پیام‌های هم‌کلید (مثلاً یک فروشنده و یک پترن) داخل پنجره به یک پیام
+    خلاصه تبدیل می‌شوند و پیام تکراری (همان شماره، پترن و پارامترها) یک بار فرستاده می‌شود.
+
+    وب‌سرویس پترنی پنل فقط یک گیرنده می‌پذیرد، پس هر batch به صورت موازی (workers) از مسیریاب
+    پیامک و Session مشترک آن ارسال می‌شود. window صفر یعنی ارسال فوری و هم‌زمان (بدون صف).
+
+    صف فقط در حافظه پروسه است: atexit پیام‌های صف را در خروج عادی (deploy/restart با SIGTERM)
+    می‌فرستد، ولی با kill -9، OOM یا کرش پروسه پیامک‌های سفارشِ داخل پنجره از دست می‌روند.
+    """
+
+    def __init__(
+        self,
+        window: Optional[float] = None,
+        max_batch: Optional[int] = None,
+        workers: Optional[int] = None,
+        send: Optional[Callable[[str, int, List[Any]], Any]] = None,
+    ):
+        self.window = window if window is not None else getattr(settings, "SMS_BATCH_WINDOW_SECONDS", 2.0)
+        self.max_batch = max_batch or getattr(settings, "SMS_BATCH_MAX_SIZE", 50)
+        self.workers = workers or getattr(settings, "SMS_BATCH_WORKERS", 4)
+        self.send = send or (lambda mobile, body_id, params: sms.send_pattern_sms(mobile, body_id, params))
+        self.pending: List[QueuedSms] = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.timer: Optional[threading.Timer] = None
+        self.counters = {"batches": 0, "enqueued": 0, "sent": 0, "failed": 0, "coalesced": 0, "deduplicated": 0}
+        self.batch_latencies_ms: deque = deque(maxlen=BATCH_LATENCY_SAMPLES)
+
+    def enqueue(
+        self,
+        mobile: str,
+        body_id: int,
+        params: Optional[List[Any]] = None,
+        coalesce_key: Optional[str] = None,
+        merge: Callable[[List[QueuedSms]], List[Any]] = join_last_param,
+    ) -> None:
+        message = QueuedSms(mobile, body_id, params, coalesce_key, merge)
+        if self.window <= 0:
+            with self.lock:
+                self.pending.append(message)
+                self.counters["enqueued"] += 1
+            self.flush()
+            return
+
+        with self.lock:
+            self.pending.append(message)
+            self.counters["enqueued"] += 1
+            if len(self.pending) >= self.max_batch:
+                self._schedule(0)
+            elif self.timer is None:
+                self._schedule(self.window)
+
+    def _schedule(self, delay: float) -> None:
+        # زیر self.lock صدا زده می‌شود
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = threading.Timer(delay, self._flush_from_timer)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def _flush_from_timer(self) -> None:
+        # thread تایمر از مسیریاب (load_routes) و ProviderHealthCheck به دیتابیس می‌رود
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Could not flush queued SMS")
+        finally:
+            close_old_connections()
+
+    def _build_batch(self, messages: List[QueuedSms]) -> List[QueuedSms]:
+        groups: "OrderedDict[Any, List[QueuedSms]]" = OrderedDict()
+        for message in messages:
+            if message.coalesce_key:
+                key = ("coalesce", message.coalesce_key)
+            else:
+                key = ("exact", message.mobile, message.body_id, tuple(str(p) for p in message.params))
+            groups.setdefault(key, []).append(message)
+
+        batch: List[QueuedSms] = []
+        for key, group in groups.items():
+            if key[0] == "coalesce" and len(group) > 1:
+                first = group[0]
+                batch.append(QueuedSms(first.mobile, first.body_id, first.merge(group), None, first.merge))
+                self.counters["coalesced"] += len(group) - 1
+            else:
+                batch.append(group[0])
+                self.counters["deduplicated"] += len(group) - 1
+        return batch
+
+    def flush(self) -> int:
+        """
+        ارسال همه پیام‌های صف. تعداد پیامک ارسال‌شده (پس از ادغام) را برمی‌گرداند.
+        """
+        with self.flush_lock:
+            with self.lock:
+                messages, self.pending = self.pending, []
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+                if not messages:
+                    return 0
+                batch = self._build_batch(messages)
+
+            started = time.monotonic()
+            results = self._send_batch(batch)
+            elapsed_ms = (time.monotonic() - started) * 1000
+            failed = sum(1 for result in results if not self._ok(result))
+            with self.lock:
+                self.counters["batches"] += 1
+                self.counters["sent"] += len(batch) - failed
+                self.counters["failed"] += failed
+                self.batch_latencies_ms.append(elapsed_ms)
+            logger.info(
+                "SMS batch: %s queued -> %s sent (%s failed) in %.0f ms",
+                len(messages),
+                len(batch),
+                failed,
+                elapsed_ms,
+            )
+            return len(batch)
+
+    def _send_batch(self, batch: List[QueuedSms]) -> List[Any]:
+        def send_one(message: QueuedSms):
+            try:
+                return self.send(message.mobile, message.body_id, message.params)
+            except Exception:
+                logger.exception("Batched SMS to %s failed", message.mobile)
+                return None
+
+        if len(batch) == 1 or self.workers <= 1:
+            return [send_one(message) for message in batch]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(batch))) as pool:
+            return list(pool.map(http_client.pool_task(send_one), batch))
+
+    @staticmethod
+    def _ok(result) -> bool:
+        if isinstance(result, dict):
+            return result.get("ok", True) and "error" not in result
+        return bool(result)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            counters = dict(self.counters)
+            latencies = sorted(self.batch_latencies_ms)
+            counters["pending"] = len(self.pending)
+        # هر پیام ادغام‌شده یا تکراری یعنی یک پیامک کمتر
+        counters["saved"] = counters["coalesced"] + counters["deduplicated"]
+        counters["batch_p50_ms"] = int(latencies[len(latencies) // 2]) if latencies else None
+        counters["batch_p95_ms"] = int(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]) if latencies else None
+        return counters
+
+
+_batcher: Optional[SmsBatcher] = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher() -> SmsBatcher:
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = SmsBatcher()
+    return _batcher
+
+
+def reset_batcher() -> None:
+    global _batcher
+    with _batcher_lock:
+        _batcher = None
+
+
+@atexit.register
+def _flush_on_exit() -> None:
+    # پیام‌های داخل پنجره با خروج پروسه (deploy/restart) گم نشوند
+    if _batcher is not None:
+        try:
+            _batcher.flush()
+        except Exception:
+            logger.exception("Could not flush pending SMS on exit")
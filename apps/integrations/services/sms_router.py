@@ -0,0 +1,310 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+
+from integrations.models import IntegrationProvider, ProviderHealthCheck
+from integrations.services import http_client, request_log
+from integrations.services.health import is_provider_down
+from integrations.services.sms import _rest_base_url
+
+logger = logging.getLogger(__name__)
+
+SEND_ENDPOINT = "send_pattern"
+# پنجره آماری هر ارائه‌دهنده (تعداد آخرین ارسال‌ها)
+WINDOW_SIZE = 50
+# بعد از این تعداد خطای پشت سر هم ارائه‌دهنده برای COOLDOWN_SECONDS کنار گذاشته می‌شود
+MAX_CONSECUTIVE_FAILURES = 3
+COOLDOWN_SECONDS = 30
+DEGRADED_ERROR_RATE = 0.2
+DEGRADED_LATENCY_MS = 2000
+# ProviderHealthCheck فقط با تغییر وضعیت یا حداکثر هر این مقدار ثانیه نوشته می‌شود
+HEALTH_SAMPLE_INTERVAL = 60
+PROVIDERS_REFRESH_SECONDS = 60
+
+
+class SmsRoute:
+    """
+    یک ارائه‌دهنده پیامک با آمار چرخشی تاخیر و خطا.
+    provider برای مسیر پیش‌فرض تنظیمات (بدون ردیف IntegrationProvider) None است.
+    """
+
+    def __init__(self, code: str, base_url: str, username: str, password: str, provider=None, priority: int = 0):
+        self.code = code
+        self.base_url = base_url.rstrip("/")
+        self.username = username
+        self.password = password
+        self.provider = provider
+        self.priority = priority
+        self.samples: deque = deque(maxlen=WINDOW_SIZE)  # (ok, latency_ms)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.last_status: Optional[str] = None
+        self.last_sampled_at = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, ok: bool, latency_ms: float, now: float) -> None:
+        with self.lock:
+            self.samples.append((ok, latency_ms))
+            if ok:
+                self.consecutive_failures = 0
+                self.cooldown_until = 0.0
+            else:
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+                    self.cooldown_until = now + COOLDOWN_SECONDS
+
+    def in_cooldown(self, now: float) -> bool:
+        return now < self.cooldown_until
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            samples = list(self.samples)
+        latencies = sorted(latency for ok, latency in samples if ok)
+        errors = sum(1 for ok, _ in samples if not ok)
+
+        def percentile(p: float) -> Optional[int]:
+            if not latencies:
+                return None
+            return int(latencies[min(len(latencies) - 1, int(round(p * (len(latencies) - 1))))])
+
+        return {
+            "samples": len(samples),
+            "error_rate": round(errors / len(samples), 3) if samples else 0.0,
+            "latency_p50_ms": percentile(0.5),
+            "latency_p95_ms": percentile(0.95),
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+    def status(self, now: float) -> str:
+        if self.in_cooldown(now):
+            return "DOWN"
+        stats = self.stats()
+        if stats["error_rate"] > DEGRADED_ERROR_RATE or (stats["latency_p95_ms"] or 0) > DEGRADED_LATENCY_MS:
+            return "DEGRADED"
+        return "UP"
+
+    def score(self) -> float:
+        """
+        امتیاز کمتر بهتر: میانه تاخیر ضرب در جریمه نرخ خطا. ارائه‌دهنده بدون نمونه
+        امتیاز صفر می‌گیرد تا یک بار امتحان شود.
+        """
+        stats = self.stats()
+        if not stats["samples"]:
+            return 0.0
+        latency = stats["latency_p50_ms"] if stats["latency_p50_ms"] is not None else DEGRADED_LATENCY_MS
+        return latency * (1 + 4 * stats["error_rate"])
+
+
+def _credentials(provider: IntegrationProvider) -> Dict[str, str]:
+    env = (provider.credentials_ref or {}).get("env") or {}
+    return {
+        "username": os.getenv(env["username"], "") if env.get("username") else getattr(settings, "SMS_USERNAME", ""),
+        "password": os.getenv(env["password"], "") if env.get("password") else getattr(settings, "SMS_PASSWORD", ""),
+    }
+
+
+def _default_route() -> SmsRoute:
+    return SmsRoute(
+        code="settings",
+        base_url=_rest_base_url(),
+        username=getattr(settings, "SMS_USERNAME", ""),
+        password=getattr(settings, "SMS_PASSWORD", ""),
+    )
+
+
+class SmsRouter:
+    """
+    مسیریاب پیامک روی IntegrationProvider(kind="SMS")های فعال.
+    هر پیام به سالم‌ترین/سریع‌ترین ارائه‌دهنده می‌رود و در صورت خطا، تا پایان deadline
+    روی ارائه‌دهنده بعدی امتحان می‌شود. ارائه‌دهنده‌ای که پشت سر هم خطا داده تا پایان cooldown
+    فقط وقتی امتحان می‌شود که گزینه دیگری نمانده باشد.
+    """
+
+    def __init__(
+        self,
+        deadline: Optional[float] = None,
+        attempt_timeout: Optional[float] = None,
+        session: Optional[requests.Session] = None,
+        clock=time.monotonic,
+    ):
+        self.deadline = deadline if deadline is not None else getattr(settings, "SMS_ROUTER_DEADLINE", 8)
+        self.attempt_timeout = (
+            attempt_timeout if attempt_timeout is not None else getattr(settings, "SMS_ROUTER_ATTEMPT_TIMEOUT", 3)
+        )
+        self.clock = clock
+        # بدون session صریح، Session مشترک هر میزبان از http_client استفاده می‌شود
+        self.session = session
+        self.routes: Dict[str, SmsRoute] = {}
+        self.routes_loaded_at: Optional[float] = None
+        self.lock = threading.Lock()
+
+    def load_routes(self) -> List[SmsRoute]:
+        """
+        ردیف‌های فعال SMS را (هر PROVIDERS_REFRESH_SECONDS یک بار) می‌خواند و آمار ارائه‌دهنده‌های
+        قبلی را نگه می‌دارد. اگر هیچ ردیفی نباشد، مسیر پیش‌فرض تنظیمات استفاده می‌شود.
+        """
+        now = self.clock()
+        with self.lock:
+            if self.routes_loaded_at is not None and now - self.routes_loaded_at < PROVIDERS_REFRESH_SECONDS:
+                return list(self.routes.values())
+
+            routes: Dict[str, SmsRoute] = {}
+            for priority, provider in enumerate(
+                IntegrationProvider.objects.filter(kind="SMS", is_active=True).order_by("id")
+            ):
+                route = self.routes.get(provider.code)
+                credentials = _credentials(provider)
+                base_url = provider.base_url or _rest_base_url()
+                if route is None:
+                    route = SmsRoute(provider.code, base_url, provider=provider, priority=priority, **credentials)
+                else:
+                    route.base_url = base_url.rstrip("/")
+                    route.provider = provider
+                    route.priority = priority
+                    route.username, route.password = credentials["username"], credentials["password"]
+                routes[provider.code] = route
+            if not routes:
+                routes["settings"] = self.routes.get("settings") or _default_route()
+            self.routes = routes
+            self.routes_loaded_at = now
+            return list(routes.values())
+
+    def ranked_routes(self) -> List[SmsRoute]:
+        now = self.clock()
+        routes = self.load_routes()
+        # وضعیت DOWN منتشرشده توسط probe_providers هم مثل cooldown به انتهای صف می‌رود
+        unavailable = {route.code for route in routes if route.in_cooldown(now) or is_provider_down(route.code)}
+        healthy = [route for route in routes if route.code not in unavailable]
+        cooling = [route for route in routes if route.code in unavailable]
+        healthy.sort(key=lambda route: (route.score(), route.priority))
+        cooling.sort(key=lambda route: route.cooldown_until)
+        return healthy + cooling
+
+    def send(self, mobile: str, body_id: int, text: str) -> Dict[str, Any]:
+        started = self.clock()
+        attempts: List[Dict[str, Any]] = []
+        for route in self.ranked_routes():
+            remaining = self.deadline - (self.clock() - started)
+            if remaining <= 0.05:
+                break
+            result = self._attempt(route, mobile, body_id, text, timeout=min(self.attempt_timeout, remaining))
+            if result.get("ok", True) and "error" not in result:
+                if attempts:
+                    logger.warning("SMS to %s delivered via %s after failover: %s", mobile, route.code, attempts)
+                return result
+            attempts.append({"provider": route.code, **result})
+
+        logger.error("SMS to %s failed on all providers: %s", mobile, attempts)
+        return {"ok": False, "error": "all SMS providers failed", "attempts": attempts}
+
+    def _attempt(self, route: SmsRoute, mobile: str, body_id: int, text: str, timeout: float) -> Dict[str, Any]:
+        payload = {
+            "username": route.username,
+            "password": route.password,
+            "text": str(text),
+            "to": mobile,
+            "bodyId": body_id,
+        }
+        attempt_started = self.clock()
+        result: Dict[str, Any]
+        client = http_client.get_client()
+        endpoint = client.resolve(
+            "SMS", SEND_ENDPOINT, route.base_url, provider_code=route.code if route.provider else None
+        )
+        url = endpoint.url
+        session = self.session or client.session_for(url)
+        # متن پیامک OTP همان کد ورود است و نباید در لاگ بماند
+        redact_keys = ("text",) if body_id == getattr(settings, "SMS_OTP_BODY_ID", None) else ()
+        try:
+            with request_log.outbound(
+                "SMS",
+                "POST",
+                url,
+                body=payload,
+                provider_id=getattr(route.provider, "id", None),
+                redact_keys=redact_keys,
+            ) as outbound_call:
+                resp = outbound_call.response = session.post(
+                    url, data=payload, timeout=min(timeout, endpoint.read_timeout)
+                )
+        except requests.RequestException as exc:
+            result = {"ok": False, "error": str(exc)}
+        else:
+            if resp.status_code != 200:
+                result = {"ok": False, "error": "http error", "http_status": resp.status_code, "raw": resp.text[:500]}
+            else:
+                try:
+                    result = resp.json()
+                except ValueError:
+                    result = {"ok": False, "error": "non-JSON response", "raw": resp.text[:500]}
+                else:
+                    if not isinstance(result, dict):
+                        result = {"ok": False, "error": "unexpected response", "raw": result}
+                    elif "RetStatus" in result and str(result["RetStatus"]) != "1":
+                        # RetStatus غیر از ۱ یعنی پنل درخواست را رد کرده (اعتبار، شماره، پترن)
+                        result = {"ok": False, "error": result.get("StrRetStatus") or "rejected", "raw": result}
+
+        ok = result.get("ok", True) and "error" not in result
+        now = self.clock()
+        route.record(ok, (now - attempt_started) * 1000, now)
+        if not ok:
+            logger.warning("SMS provider %s failed: %s", route.code, result.get("error"))
+        self._sample_health(route, now)
+        return result
+
+    def _sample_health(self, route: SmsRoute, now: float) -> None:
+        if route.provider is None:
+            return
+        status = route.status(now)
+        with route.lock:
+            if status == route.last_status and now - route.last_sampled_at < HEALTH_SAMPLE_INTERVAL:
+                return
+            route.last_status = status
+            route.last_sampled_at = now
+        stats = route.stats()
+        try:
+            ProviderHealthCheck.objects.create(
+                provider=route.provider,
+                status=status,
+                latency_ms=stats["latency_p50_ms"],
+                details={"source": "sms_router", **stats},
+                checked_at=timezone.now(),
+            )
+        except Exception:
+            logger.exception("Could not record SMS provider health for %s", route.code)
+
+    def metrics(self) -> Dict[str, Any]:
+        now = self.clock()
+        return {
+            route.code: {"status": route.status(now), "score": round(route.score(), 1), **route.stats()}
+            for route in self.load_routes()
+        }
+
+
+_router: Optional[SmsRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> SmsRouter:
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = SmsRouter()
+    return _router
+
+
+def reset_router() -> None:
+    """
+    مسیریاب مشترک و آمار آن را دور می‌اندازد (مثلاً بعد از تغییر ارائه‌دهنده‌ها در تست).
+    """
+    global _router
+    with _router_lock:
+        _router = None
@@ -1,13 +1,18 @@
 import logging
-from typing import Any, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 
-import requests
 from django.conf import settings
 
+from integrations.services import http_client
+from integrations.services.telegram_client import get_client
+from integrations.services.vendor_config import get_vendor_config
+
 logger = logging.getLogger(__name__)
 
 
-TELEGRAM_API_BASE = "https://api.telegram.org/bot"
+# تلگرام حداکثر ۱۰۰ دکمه در هر کیبورد inline می‌پذیرد؛ صفحه‌های کوچک‌تر برای موبایل خواناترند
+MENU_PAGE_SIZE = 8
 ORDER_EVENT_LABELS = {
     "ORDER_CREATED": "ثبت سفارش",
     "ORDER_PAYMENT_VERIFIED": "پرداخت تایید شد",
@@ -22,10 +27,6 @@ ORDER_EVENT_LABELS = {
 }
 
 
-def _bot_url(path: str) -> str:
-    return f"{TELEGRAM_API_BASE}{settings.TELEGRAM_BOT_TOKEN}/{path}"
-
-
 def send_message(
     chat_id: str,
     text: str,
@@ -49,14 +50,99 @@ def send_message(
     if parse_mode:
         payload["parse_mode"] = parse_mode
 
-    try:
-        response = requests.post(_bot_url("sendMessage"), json=payload, timeout=10)
-        response.raise_for_status()
-        return True
-    except Exception as exc:  # pragma: no cover - logging side-effect
-        logger.exception("Failed to send Telegram message: %s", exc)
+    return get_client().call("sendMessage", payload) is not None
+
+
+def edit_message_text(
+    chat_id: str,
+    message_id: int,
+    text: str,
+    reply_markup: Optional[Dict[str, Any]] = None,
+    disable_web_page_preview: bool = True,
+) -> bool:
+    if not settings.TELEGRAM_BOT_TOKEN:
+        logger.warning("Telegram bot token missing; skipping edit_message_text")
+        return False
+
+    payload: Dict[str, Any] = {
+        "chat_id": chat_id,
+        "message_id": message_id,
+        "text": text,
+        "disable_web_page_preview": disable_web_page_preview,
+    }
+    if reply_markup:
+        payload["reply_markup"] = reply_markup
+    return get_client().call("editMessageText", payload) is not None
+
+
+def edit_message_reply_markup(chat_id: str, message_id: int, reply_markup: Optional[Dict[str, Any]] = None) -> bool:
+    if not settings.TELEGRAM_BOT_TOKEN:
+        logger.warning("Telegram bot token missing; skipping edit_message_reply_markup")
         return False
 
+    payload: Dict[str, Any] = {"chat_id": chat_id, "message_id": message_id}
+    if reply_markup:
+        payload["reply_markup"] = reply_markup
+    return get_client().call("editMessageReplyMarkup", payload) is not None
+
+
+def answer_callback_query(callback_query_id: str, text: str = "", show_alert: bool = False) -> bool:
+    if not settings.TELEGRAM_BOT_TOKEN or not callback_query_id:
+        return False
+
+    payload: Dict[str, Any] = {"callback_query_id": callback_query_id}
+    if text:
+        payload["text"] = text[:200]
+        payload["show_alert"] = show_alert
+    return get_client().call("answerCallbackQuery", payload) is not None
+
+
+class EditMessage:
+    """
+    intent پاسخ به callback: ویرایش همان پیامی که دکمه‌اش زده شده به جای ارسال پیام جدید.
+    text=None یعنی فقط کیبورد عوض شود. notice به صورت toast روی answerCallbackQuery نمایش داده می‌شود.
+    """
+
+    def __init__(self, text: Optional[str] = None, reply_markup: Optional[Dict[str, Any]] = None, notice: str = ""):
+        self.text = text
+        self.reply_markup = reply_markup
+        self.notice = notice
+
+
+class CallbackNotice:
+    """
+    intent پاسخ به callback فقط با toast/alert؛ هیچ پیامی ارسال یا ویرایش نمی‌شود.
+    """
+
+    def __init__(self, text: str, alert: bool = False):
+        self.text = text
+        self.alert = alert
+
+
+def apply_callback_intent(callback_query: Dict[str, Any], intent) -> None:
+    """
+    اجرای intent یک handler callback و پاسخ به answerCallbackQuery (تا اسپینر دکمه متوقف شود).
+    اگر callback پیام مبدا نداشته باشد، متن به صورت پیام جدید ارسال می‌شود.
+    """
+    message = callback_query.get("message") or {}
+    chat_id = str((message.get("chat") or {}).get("id") or "")
+    message_id = message.get("message_id")
+    notice, alert = "", False
+
+    if isinstance(intent, EditMessage):
+        notice = intent.notice
+        if not message_id:
+            if intent.text is not None:
+                send_message(chat_id=chat_id, text=intent.text, reply_markup=intent.reply_markup)
+        elif intent.text is None:
+            edit_message_reply_markup(chat_id, message_id, intent.reply_markup)
+        else:
+            edit_message_text(chat_id, message_id, intent.text, intent.reply_markup)
+    elif isinstance(intent, CallbackNotice):
+        notice, alert = intent.text, intent.alert
+
+    answer_callback_query(callback_query.get("id") or "", text=notice, show_alert=alert)
+
 
 def set_webhook(webhook_url: str) -> bool:
     if not settings.TELEGRAM_BOT_TOKEN:
@@ -65,17 +151,11 @@ def set_webhook(webhook_url: str) -> bool:
     if not webhook_url:
         logger.warning("Webhook URL missing; cannot set webhook")
         return False
-    try:
-        response = requests.post(_bot_url("setWebhook"), json={"url": webhook_url}, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        ok = data.get("ok", False)
-        if not ok:
-            logger.warning("Failed to set webhook: %s", data)
-        return ok
-    except Exception as exc:  # pragma: no cover - logging side-effect
-        logger.exception("Failed to set Telegram webhook: %s", exc)
+    data = get_client().call("setWebhook", {"url": webhook_url})
+    if not data:
+        logger.warning("Failed to set Telegram webhook to %s", webhook_url)
         return False
+    return True
 
 
 def _status_label(status: str) -> str:
@@ -171,12 +251,34 @@ def build_address_keyboard(addresses) -> Dict[str, Any]:
     return {"inline_keyboard": rows}
 
 
-def build_menu_keyboard(products) -> Dict[str, Any]:
-    rows = []
-    for product in products:
-        rows.append([{"text": f"{product.name_fa} • {product.base_price:,}", "callback_data": f"product:{product.id}"}])
-    rows.append([{"text": "سبد خرید 🛒", "callback_data": "cart:review"}])
-    return {"inline_keyboard": rows}
+def build_menu_keyboard_pages(products, page_size: int = MENU_PAGE_SIZE) -> List[Dict[str, Any]]:
+    """
+    کیبورد منو صفحه‌بندی‌شده؛ هر صفحه زیر محدودیت تعداد دکمه‌های تلگرام می‌ماند.
+    """
+    products = list(products)
+    chunks = [products[i : i + page_size] for i in range(0, len(products), page_size)] or [[]]
+    pages = []
+    for index, chunk in enumerate(chunks):
+        rows = [
+            [{"text": f"{product.name_fa} • {product.base_price:,}", "callback_data": f"product:{product.id}"}]
+            for product in chunk
+        ]
+        if len(chunks) > 1:
+            nav = []
+            if index > 0:
+                nav.append({"text": "◀️ قبلی", "callback_data": f"menu:page:{index - 1}"})
+            nav.append({"text": f"{index + 1}/{len(chunks)}", "callback_data": f"menu:page:{index}"})
+            if index < len(chunks) - 1:
+                nav.append({"text": "بعدی ▶️", "callback_data": f"menu:page:{index + 1}"})
+            rows.append(nav)
+        rows.append([{"text": "سبد خرید 🛒", "callback_data": "cart:review"}])
+        pages.append({"inline_keyboard": rows})
+    return pages
+
+
+def build_menu_keyboard(products, page: int = 0) -> Dict[str, Any]:
+    pages = build_menu_keyboard_pages(products)
+    return pages[min(max(page, 0), len(pages) - 1)]
 
 
 def _format_order_text(order) -> str:
@@ -242,8 +344,19 @@ def _format_customer_order_event_text(order, event: Optional[str]) -> str:
     return f"به‌روزرسانی سفارش {order.short_code}:\nوضعیت: {status_text}"
 
 
+def get_vendor_chat_id(vendor) -> str:
+    """
+    چت تلگرام فروشنده: chat_id تنظیمات اختصاصی وندور (VendorIntegrationConfig) یا Vendor.telegram_chat_id.
+    ارسال اعلان و مجوز دکمه‌های وضعیت سفارش هر دو از همین استفاده می‌کنند.
+    """
+    if vendor is None:
+        return ""
+    config = get_vendor_config(vendor.id, "TELEGRAM")
+    return str(config.get("chat_id") or getattr(vendor, "telegram_chat_id", "") or "")
+
+
 def send_order_notification_to_vendor(order, event: Optional[str] = None) -> None:
-    chat_id = getattr(order.vendor, "telegram_chat_id", "") or ""
+    chat_id = get_vendor_chat_id(order.vendor)
     if not chat_id:
         logger.info("No vendor Telegram chat configured for vendor_id=%s", order.vendor_id)
         return
@@ -272,7 +385,70 @@ def send_order_notification_to_customer(order, event: Optional[str] = None) -> N
     send_message(chat_id=str(chat_id), text=text)
 
 
+def load_order_context(order):
+    """
+    سفارش همراه vendor، آدرس، پروفایل تلگرام مشتری (select_related) و اقلام (prefetch) در دو کوئری.
+    """
+    from orders.models import Order
+
+    return (
+        Order.objects.select_related("vendor", "delivery_address", "user__telegram")
+        .prefetch_related("items")
+        .get(pk=order.pk)
+    )
+
+
+def _order_event_messages(order, event: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    پیام‌های یک رویداد سفارش برای همه گیرنده‌ها؛ متن مشترک فروشنده و ادمین یک بار ساخته می‌شود.
+    """
+    messages: List[Dict[str, Any]] = []
+    # تنظیمات اختصاصی وندور از کش درون‌پروسه‌ای خوانده می‌شود (بدون کوئری)
+    vendor_config = get_vendor_config(order.vendor_id, "TELEGRAM")
+    vendor_chat_id = get_vendor_chat_id(order.vendor)
+    vendor_events = vendor_config.get("events")
+    if vendor_config.get("enabled") is False or (isinstance(vendor_events, list) and event not in vendor_events):
+        vendor_chat_id = ""
+    admin_chat_id = settings.TELEGRAM_ADMIN_CHAT_ID
+    if vendor_chat_id or admin_chat_id:
+        text = _format_vendor_admin_order_event_text(order, event)
+        if vendor_chat_id:
+            messages.append(
+                {"chat_id": vendor_chat_id, "text": text, "reply_markup": build_order_action_keyboard(order, for_vendor=True)}
+            )
+        if admin_chat_id:
+            messages.append({"chat_id": str(admin_chat_id), "text": text, "reply_markup": build_order_action_keyboard(order)})
+    if not vendor_chat_id:
+        logger.info("No vendor Telegram chat configured for vendor_id=%s", order.vendor_id)
+
+    tg_profile = getattr(order.user, "telegram", None)
+    customer_chat_id = getattr(tg_profile, "telegram_user_id", None)
+    if customer_chat_id:
+        messages.append({"chat_id": str(customer_chat_id), "text": _format_customer_order_event_text(order, event)})
+    else:
+        logger.info("No Telegram profile for user_id=%s; skipping customer notification", order.user_id)
+    return messages
+
+
 def dispatch_order_event(order, event: Optional[str] = None) -> None:
-    send_order_notification_to_vendor(order, event=event)
-    send_order_notification_to_admin(order, event=event)
-    send_order_notification_to_customer(order, event=event)
+    """
+    اطلاع‌رسانی رویداد سفارش به فروشنده، ادمین و مشتری.
+    داده‌ها یک بار و با تعداد کوئری ثابت خوانده می‌شوند و ارسال‌ها موازی انجام می‌شوند،
+    پس زمان کل نزدیک به کندترین ارسال است نه مجموع آن‌ها. threadها عمدتاً HTTP می‌زنند، ولی ثبت
+    درخواست یا تازه‌سازی پیکربندی endpointها ممکن است روی همان thread به دیتابیس برود؛ http_client.pool_task
+    اتصال آن را در پایان می‌بندد. تعداد threadها با TELEGRAM_ORDER_EVENT_FANOUT_WORKERS تنظیم می‌شود.
+    """
+    messages = _order_event_messages(load_order_context(order), event)
+    if not messages:
+        return
+    if len(messages) == 1:
+        send_message(**messages[0])
+        return
+
+    fanout_workers = max(1, getattr(settings, "TELEGRAM_ORDER_EVENT_FANOUT_WORKERS", 4))
+    with ThreadPoolExecutor(max_workers=min(len(messages), fanout_workers)) as executor:
+        futures = [executor.submit(http_client.pool_task(send_message), **message) for message in messages]
+    for message, future in zip(messages, futures):
+        exc = future.exception()
+        if exc is not None:
+            logger.error("Order %s event %s to chat %s failed: %s", order.pk, event, message["chat_id"], exc)
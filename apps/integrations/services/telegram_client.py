@@ -0,0 +1,283 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, Optional
+
+import requests
+from django.conf import settings
+
+from integrations.services import http_client, request_log
+
+logger = logging.getLogger(__name__)
+
+# محدودیت‌های Bot API: حدود ۳۰ پیام در ثانیه کل، ۱ پیام در ثانیه برای هر چت، ۲۰ پیام در دقیقه برای گروه‌ها
+GLOBAL_RATE_PER_SECOND = 30
+CHAT_RATE_PER_SECOND = 1
+GROUP_RATE_PER_MINUTE = 20
+MAX_TRACKED_CHATS = 10_000
+# محدودیت هر چت مربوط به پیام‌های جدید است؛ ویرایش پیام و answerCallbackQuery فقط زیر محدودکننده سراسری‌اند
+CHAT_LIMITED_METHOD_PREFIXES = ("send", "forward", "copy")
+# فقط این متدها با تکرارشان اثر دوباره ندارند؛ sendMessage و بقیه بعد از timeout یا 5xx ممکن است
+# پیام را فرستاده باشند، پس فقط وقتی تکرار می‌شوند که درخواست قطعاً نرسیده (خطای اتصال یا 429)
+IDEMPOTENT_METHOD_PREFIXES = ("getUpdates", "getMe", "answerCallbackQuery", "editMessage")
+# پاسخ 400 تلگرام وقتی ویرایش همان متن و دکمه‌های فعلی را دارد (مثلاً دو کلیک پشت هم روی یک دکمه)
+NOT_MODIFIED_DESCRIPTION = "message is not modified"
+LATENCY_SAMPLES = 1000
+
+
+class TokenBucket:
+    """
+    Token bucket ساده و thread-safe. reserve زمان انتظار لازم برای گرفتن یک توکن را برمی‌گرداند
+    و توکن را از همین حالا رزرو می‌کند (بدهی)، پس درخواست‌های هم‌زمان پشت هم صف می‌شوند.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.updated_at = clock()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class TelegramClient:
+    """
+    کلاینت Bot API با Session ماندگار (keep-alive)، محدودکننده سراسری و هر چت،
+    رعایت retry_after در 429 و backoff در خطاهای 5xx/شبکه (برای متدهای غیر idempotent فقط خطای اتصال).
+    Session، timeout هر متد و قطع‌کننده مدار از http_client می‌آیند (endpoint هر متد همان نام متد است).
+    """
+
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        base_url: Optional[str] = None,
+        timeout: Optional[float] = None,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        session: Optional[requests.Session] = None,
+        sleep=time.sleep,
+    ):
+        self.token = token if token is not None else settings.TELEGRAM_BOT_TOKEN
+        self.base_url = (base_url or getattr(settings, "TELEGRAM_API_BASE_URL", "") or "https://api.telegram.org").rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.sleep = sleep
+
+        self.outbound = http_client.get_client()
+        self.session = session or self.outbound.session_for(self.base_url)
+        self.breaker = self.outbound.breaker_for(self.base_url)
+
+        self.global_bucket = TokenBucket(GLOBAL_RATE_PER_SECOND, GLOBAL_RATE_PER_SECOND)
+        self.chat_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.chat_buckets_lock = threading.Lock()
+
+        self.metrics_lock = threading.Lock()
+        self.counters = {
+            "requests": 0,
+            "sent": 0,
+            "failed": 0,
+            "not_modified": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "circuit_open": 0,
+            "throttled": 0,
+            "throttled_seconds": 0.0,
+        }
+        self.latencies_ms: deque = deque(maxlen=LATENCY_SAMPLES)
+        # تعداد فراخوانی هر متد (sendMessage/editMessageText/...) برای سنجش حجم پیام‌های خروجی
+        self.calls_by_method: Dict[str, int] = {}
+
+    def _url(self, method: str) -> str:
+        return f"{self.base_url}/bot{self.token}/{method}"
+
+    def _count(self, key: str, value: float = 1) -> None:
+        with self.metrics_lock:
+            self.counters[key] += value
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        key = str(chat_id)
+        with self.chat_buckets_lock:
+            bucket = self.chat_buckets.get(key)
+            if bucket is None:
+                # chat_id منفی یعنی گروه/کانال
+                if key.startswith("-"):
+                    bucket = TokenBucket(GROUP_RATE_PER_MINUTE / 60, GROUP_RATE_PER_MINUTE)
+                else:
+                    bucket = TokenBucket(CHAT_RATE_PER_SECOND, 1)
+                self.chat_buckets[key] = bucket
+                while len(self.chat_buckets) > MAX_TRACKED_CHATS:
+                    self.chat_buckets.popitem(last=False)
+            else:
+                self.chat_buckets.move_to_end(key)
+            return bucket
+
+    def _throttle(self, chat_id) -> None:
+        waits = [self.global_bucket.reserve()]
+        if chat_id is not None:
+            waits.append(self._chat_bucket(chat_id).reserve())
+        wait = max(waits)
+        if wait > 0:
+            self._count("throttled")
+            self._count("throttled_seconds", wait)
+            self.sleep(wait)
+
+    def call(
+        self, method: str, payload: Optional[Dict[str, Any]] = None, chat_id=None, timeout: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        فراخوانی یک متد Bot API. در صورت موفقیت پاسخ JSON و در غیر این صورت None برمی‌گرداند.
+        chat_id (یا payload["chat_id"]) برای محدودکننده هر چت استفاده می‌شود.
+        timeout برای long polling (getUpdates) باید از timeout خود متد بیشتر باشد.
+        """
+        if not self.token:
+            logger.warning("Telegram bot token missing; skipping %s", method)
+            return None
+
+        payload = payload or {}
+        with self.metrics_lock:
+            self.calls_by_method[method] = self.calls_by_method.get(method, 0) + 1
+        chat_id = chat_id if chat_id is not None else payload.get("chat_id")
+        if not method.startswith(CHAT_LIMITED_METHOD_PREFIXES):
+            chat_id = None
+        endpoint = self.outbound.resolve("TELEGRAM", method, self.base_url)
+        request_timeout = (endpoint.connect_timeout, timeout or self.timeout or endpoint.read_timeout)
+        idempotent = method.startswith(IDEMPOTENT_METHOD_PREFIXES)
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                self._count("circuit_open")
+                self._count("failed")
+                logger.warning("Telegram %s skipped; circuit open for %s", method, self.base_url)
+                return None
+            if attempt:
+                self._count("retries")
+            self._throttle(chat_id)
+            self._count("requests")
+            started = time.monotonic()
+            url = self._url(method)
+            try:
+                with request_log.outbound(
+                    "TELEGRAM", "POST", url, body=payload, provider_id=endpoint.provider_id
+                ) as outbound_call:
+                    response = outbound_call.response = self.session.post(url, json=payload, timeout=request_timeout)
+            except requests.RequestException as exc:
+                self.breaker.record(False)
+                logger.warning("Telegram %s request error (attempt %s): %s", method, attempt + 1, exc)
+                if not idempotent and not isinstance(exc, requests.ConnectionError):
+                    # timeout خواندن: شاید پیام رسیده باشد، تکرارش پیام تکراری می‌سازد
+                    break
+                self.sleep(self.backoff_base * (2**attempt))
+                continue
+            finally:
+                with self.metrics_lock:
+                    self.latencies_ms.append((time.monotonic() - started) * 1000)
+
+            if response.status_code >= 500:
+                self.breaker.record(False)
+            elif response.status_code != 429:
+                self.breaker.record(True)
+            if response.status_code == 429:
+                self._count("rate_limited")
+                retry_after = self._retry_after(response)
+                logger.warning("Telegram %s rate limited; retry after %ss", method, retry_after)
+                self.sleep(retry_after)
+                continue
+            if response.status_code >= 500:
+                logger.warning("Telegram %s server error %s (attempt %s)", method, response.status_code, attempt + 1)
+                if not idempotent:
+                    break
+                self.sleep(self.backoff_base * (2**attempt))
+                continue
+
+            try:
+                data = response.json()
+            except ValueError:
+                data = {}
+            if (
+                response.status_code == 400
+                and method.startswith("editMessage")
+                and NOT_MODIFIED_DESCRIPTION in str(data.get("description", ""))
+            ):
+                # پیام همان چیزی است که می‌خواستیم؛ ویرایش موفق حساب می‌شود
+                self._count("not_modified")
+                return data
+            if response.status_code >= 400 or not data.get("ok", False):
+                logger.warning("Telegram %s failed: %s %s", method, response.status_code, data or response.text[:200])
+                self._count("failed")
+                return None
+            self._count("sent")
+            return data
+
+        self._count("failed")
+        logger.error("Telegram %s failed after %s attempts", method, attempt + 1)
+        return None
+
+    @staticmethod
+    def _retry_after(response) -> float:
+        try:
+            data = response.json()
+            retry_after = (data.get("parameters") or {}).get("retry_after")
+        except ValueError:
+            retry_after = None
+        retry_after = retry_after or response.headers.get("Retry-After") or 1
+        try:
+            return max(float(retry_after), 0.0)
+        except (TypeError, ValueError):
+            return 1.0
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.metrics_lock:
+            counters = dict(self.counters)
+            counters["calls_by_method"] = dict(self.calls_by_method)
+            latencies = sorted(self.latencies_ms)
+
+        def percentile(p: float) -> Optional[int]:
+            if not latencies:
+                return None
+            return int(latencies[min(len(latencies) - 1, int(round(p * (len(latencies) - 1))))])
+
+        counters.update({"latency_p50_ms": percentile(0.5), "latency_p95_ms": percentile(0.95)})
+        return counters
+
+
+_client: Optional[TelegramClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> TelegramClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TelegramClient()
+    return _client
+
+
+def configure_client(**kwargs) -> TelegramClient:
+    """
+    جایگزینی کلاینت مشترک با تنظیمات دیگر (مثلاً base_url سرور جعلی Bot API در تست و load run).
+    """
+    global _client
+    with _client_lock:
+        _client = TelegramClient(**kwargs)
+    return _client
+
+
+def reset_client() -> None:
+    """
+    کلاینت مشترک را دور می‌اندازد (مثلاً بعد از تغییر تنظیمات در تست).
+    """
+    global _client
+    with _client_lock:
+        _client = None
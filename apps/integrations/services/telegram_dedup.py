@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from integrations.models import TelegramUpdateReceipt
+
+DEFAULT_LRU_SIZE = 50_000
+
+
+def _ttl() -> timedelta:
+    # تلگرام آپدیت‌های تحویل‌نشده را حداکثر ۲۴ ساعت نگه می‌دارد
+    return timedelta(seconds=getattr(settings, "TELEGRAM_UPDATE_DEDUP_TTL", 24 * 3600))
+
+
+class UpdateDeduplicator:
+    """
+    پنجره حذف تکراری update_id: LRU داخل پروسه جلوی جدول TelegramUpdateReceipt.
+    تکرارهای اخیر بدون کوئری رد می‌شوند؛ بین پروسه‌ها کلید اصلی جدول تضمین می‌کند فقط یکی ثبت شود.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_LRU_SIZE, clock=time.monotonic):
+        self.max_size = max_size
+        self.clock = clock
+        self.seen: "OrderedDict[int, float]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _remember(self, update_id: int) -> None:
+        self.seen[update_id] = self.clock()
+        self.seen.move_to_end(update_id)
+        while len(self.seen) > self.max_size:
+            self.seen.popitem(last=False)
+
+    def _seen_recently(self, update_id: int) -> bool:
+        with self.lock:
+            seen_at = self.seen.get(update_id)
+            if seen_at is None:
+                return False
+            if self.clock() - seen_at > _ttl().total_seconds():
+                del self.seen[update_id]
+                return False
+            return True
+
+    def is_duplicate(self, update_id: Optional[int]) -> bool:
+        """
+        True اگر این update_id قبلاً دریافت شده باشد؛ در غیر این صورت آن را ثبت می‌کند.
+        """
+        if update_id is None:
+            return False
+        update_id = int(update_id)
+        if self._seen_recently(update_id):
+            return True
+
+        try:
+            with transaction.atomic():
+                TelegramUpdateReceipt.objects.create(update_id=update_id)
+            duplicate = False
+        except IntegrityError:
+            duplicate = not self._expired_receipt_replaced(update_id)
+
+        with self.lock:
+            self._remember(update_id)
+        return duplicate
+
+    def release(self, update_id: Optional[int]) -> None:
+        """
+        رسید یک update_id را پس می‌گیرد (ردیف و LRU) تا retry تلگرام دوباره پذیرفته شود؛
+        وقتی ذخیره یا پردازش آپدیت بعد از ثبت رسید شکست خورده است.
+        """
+        if update_id is None:
+            return
+        update_id = int(update_id)
+        with self.lock:
+            self.seen.pop(update_id, None)
+        TelegramUpdateReceipt.objects.filter(update_id=update_id).delete()
+
+    @staticmethod
+    def _expired_receipt_replaced(update_id: int) -> bool:
+        # رسید قدیمی‌تر از TTL هنوز پاک نشده؛ آن را تازه می‌کنیم و آپدیت را جدید حساب می‌کنیم
+        return bool(
+            TelegramUpdateReceipt.objects.filter(update_id=update_id, received_at__lt=timezone.now() - _ttl()).update(
+                received_at=timezone.now()
+            )
+        )
+
+    def clear(self) -> None:
+        with self.lock:
+            self.seen.clear()
+
+
+def purge_expired_receipts(now=None) -> int:
+    now = now or timezone.now()
+    deleted, _ = TelegramUpdateReceipt.objects.filter(received_at__lt=now - _ttl()).delete()
+    return deleted
+
+
+deduplicator = UpdateDeduplicator()
+
+
+def _update_id(update) -> Optional[int]:
+    return update.get("update_id") if isinstance(update, dict) else None
+
+
+def is_duplicate_update(update: dict) -> bool:
+    return deduplicator.is_duplicate(_update_id(update))
+
+
+@contextmanager
+def receive_update(update: dict) -> Iterator[bool]:
+    """
+    ثبت رسید آپدیت؛ مقدار yield‌شده True یعنی تکراری است. اگر بدنه (enqueue یا پردازش inline)
+    خطا بدهد رسید پس گرفته می‌شود، وگرنه retry تلگرام به عنوان تکراری رد و آپدیت برای همیشه گم می‌شد.
+    """
+    duplicate = is_duplicate_update(update)
+    try:
+        yield duplicate
+    except Exception:
+        if not duplicate:
+            deduplicator.release(_update_id(update))
+        raise
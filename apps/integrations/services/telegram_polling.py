@@ -0,0 +1,111 @@
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from django.db.models import Max
+
+from integrations.models import TelegramUpdate
+from integrations.services import telegram_updates
+from integrations.services.telegram_client import TelegramClient, get_client
+from integrations.services.telegram_dedup import receive_update
+
+logger = logging.getLogger(__name__)
+
+# getUpdates حداکثر ۱۰۰ آپدیت در هر پاسخ برمی‌گرداند
+MAX_BATCH_SIZE = 100
+ALLOWED_UPDATES = ["message", "edited_message", "callback_query"]
+# long poll کوتاه وقتی کاری در جریان است؛ صفر نباشد تا getUpdates بی‌وقفه تکرار نشود و
+# توکن‌های محدودکننده سراسری (۳۰ در ثانیه) را از ارسال پیام‌ها نگیرد
+BUSY_POLL_TIMEOUT = 1
+
+
+def initial_offset() -> Optional[int]:
+    """
+    offset شروع: یکی بعد از آخرین update_id ذخیره‌شده؛ آپدیت‌های قبلی در تلگرام تایید (حذف) می‌شوند.
+    """
+    last = TelegramUpdate.objects.aggregate(last=Max("update_id"))["last"]
+    return last + 1 if last is not None else None
+
+
+def fetch_updates(
+    client: TelegramClient, offset: Optional[int], limit: int = MAX_BATCH_SIZE, timeout: int = 25
+) -> Optional[List[Dict[str, Any]]]:
+    payload: Dict[str, Any] = {
+        "limit": min(max(limit, 1), MAX_BATCH_SIZE),
+        "timeout": timeout,
+        "allowed_updates": ALLOWED_UPDATES,
+    }
+    if offset is not None:
+        payload["offset"] = offset
+    data = client.call("getUpdates", payload, timeout=timeout + 10)
+    if data is None:
+        return None
+    result = data.get("result")
+    return result if isinstance(result, list) else []
+
+
+def store_updates(updates: List[Dict[str, Any]]) -> int:
+    """
+    آپدیت‌ها قبل از جلو بردن offset در صف ذخیره می‌شوند تا با کرش پروسه چیزی از دست نرود.
+    """
+    stored = 0
+    for update in updates:
+        with receive_update(update) as duplicate:
+            if duplicate:
+                continue
+            telegram_updates.enqueue_update(update)
+        stored += 1
+    return stored
+
+
+def run_polling(
+    handler: Callable[[dict], Any],
+    client: Optional[TelegramClient] = None,
+    workers: int = 8,
+    batch_size: int = MAX_BATCH_SIZE,
+    long_poll_timeout: int = 25,
+    error_backoff: float = 2.0,
+    once: bool = False,
+) -> Dict[str, int]:
+    """
+    مصرف getUpdates با offset و پردازش آپدیت‌ها با همان UpdateWorkerPool صف webhook
+    (ترتیب هر چت حفظ می‌شود، چت‌های مختلف موازی). با once=True بعد از خالی شدن صف تلگرام خارج می‌شود.
+    """
+    client = client or get_client()
+    telegram_updates.requeue_stale_updates()
+    pool = telegram_updates.UpdateWorkerPool(handler, workers=workers)
+    offset = initial_offset()
+    stats = {"polls": 0, "received": 0, "stored": 0}
+    try:
+        while True:
+            # وقتی کاری در جریان است long poll کوتاه می‌شود تا آپدیت‌های چت‌های مشغول معطل نمانند
+            if once:
+                timeout = 0
+            elif pool.in_flight:
+                timeout = min(BUSY_POLL_TIMEOUT, long_poll_timeout)
+            else:
+                timeout = long_poll_timeout
+            updates = fetch_updates(client, offset, limit=batch_size, timeout=timeout)
+            stats["polls"] += 1
+            if updates is None:
+                logger.warning("getUpdates failed; retrying in %ss", error_backoff)
+                time.sleep(error_backoff)
+                if once:
+                    break
+                continue
+
+            if updates:
+                stats["received"] += len(updates)
+                stats["stored"] += store_updates(updates)
+                offset = max(int(update["update_id"]) for update in updates) + 1
+
+            while pool.run_once(limit=batch_size):
+                pass
+            if once and not updates:
+                pool.drain()
+                if not pool.run_once(limit=batch_size):
+                    break
+    finally:
+        pool.shutdown()
+    stats.update(pool.stats)
+    return stats
@@ -0,0 +1,253 @@
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from integrations.models import TelegramUpdate
+from integrations.services.telegram_client import get_client
+from integrations.services.telegram_dedup import purge_expired_receipts
+
+logger = logging.getLogger(__name__)
+
+# آپدیتی که بیش از این مدت در PROCESSING مانده (مثلاً worker کرش کرده) دوباره در صف قرار می‌گیرد.
+STALE_PROCESSING_AFTER = timedelta(minutes=5)
+
+
+def _retention() -> timedelta:
+    # آپدیت‌های DONE/FAILED بعد از این مدت پاک می‌شوند (برای بررسی خطا و معیارهای تاخیر کافی است)
+    return timedelta(seconds=getattr(settings, "TELEGRAM_UPDATE_RETENTION_SECONDS", 7 * 24 * 3600))
+
+
+def extract_chat_id(update: Dict[str, Any]) -> Optional[int]:
+    """
+    chat_id آپدیت برای حفظ ترتیب پردازش هر چت.
+    """
+    callback_query = update.get("callback_query") or {}
+    message = (
+        update.get("message")
+        or update.get("edited_message")
+        or callback_query.get("message")
+        or {}
+    )
+    chat_id = (message.get("chat") or {}).get("id") or (callback_query.get("from") or {}).get("id")
+    try:
+        return int(chat_id) if chat_id is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def enqueue_update(update: Dict[str, Any]) -> TelegramUpdate:
+    return TelegramUpdate.objects.create(
+        update_id=update.get("update_id"),
+        chat_id=extract_chat_id(update),
+        payload=update,
+    )
+
+
+def requeue_stale_updates(now=None) -> int:
+    now = now or timezone.now()
+    return TelegramUpdate.objects.filter(
+        status=TelegramUpdate.STATUS_PROCESSING, started_at__lt=now - STALE_PROCESSING_AFTER
+    ).update(status=TelegramUpdate.STATUS_PENDING, started_at=None, claimed_by="")
+
+
+def purge_processed_updates(now=None) -> int:
+    now = now or timezone.now()
+    deleted, _ = TelegramUpdate.objects.filter(
+        status__in=[TelegramUpdate.STATUS_DONE, TelegramUpdate.STATUS_FAILED], processed_at__lt=now - _retention()
+    ).delete()
+    return deleted
+
+
+def _in_shard(chat_id: Optional[int], shard: int, shards: int) -> bool:
+    return shards <= 1 or (chat_id or 0) % shards == shard
+
+
+def claim_pending_batches(
+    limit: int = 200, busy_chats: Iterable = (), shard: int = 0, shards: int = 1
+) -> "OrderedDict[Optional[int], List[TelegramUpdate]]":
+    """
+    آپدیت‌های در انتظار را به ترتیب دریافت برمی‌دارد و بر اساس chat_id گروه‌بندی می‌کند.
+    چت‌هایی که هنوز در حال پردازش‌اند کنار گذاشته می‌شوند تا ترتیب هر چت به هم نخورد.
+    برای اجرای چند پروسه، هر پروسه یک shard (chat_id % shards) را پردازش می‌کند.
+    روی PostgreSQL ردیف‌ها با FOR UPDATE SKIP LOCKED خوانده می‌شوند و UPDATE شرطی (فقط PENDING)
+    با توکن یکتای همین claim تضمین می‌کند دو worker (مثلاً پروسه قدیم و جدید هنگام deploy یا
+    shard تکراری) هرگز یک آپدیت را با هم پردازش نکنند.
+    """
+    busy = set(busy_chats)
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    with transaction.atomic():
+        pending = (
+            TelegramUpdate.objects.select_for_update(skip_locked=True)
+            .filter(status=TelegramUpdate.STATUS_PENDING)
+            .order_by("id")
+            .values_list("id", "chat_id")[:limit]
+        )
+        ids = [
+            update_id for update_id, chat_id in pending
+            if chat_id not in busy and _in_shard(chat_id, shard, shards)
+        ]
+        if not ids:
+            return OrderedDict()
+        TelegramUpdate.objects.filter(id__in=ids, status=TelegramUpdate.STATUS_PENDING).update(
+            status=TelegramUpdate.STATUS_PROCESSING, started_at=now, claimed_by=token
+        )
+
+    batches: "OrderedDict[Optional[int], List[TelegramUpdate]]" = OrderedDict()
+    claimed = TelegramUpdate.objects.filter(
+        id__in=ids, status=TelegramUpdate.STATUS_PROCESSING, claimed_by=token
+    ).order_by("id")
+    for update in claimed:
+        batches.setdefault(update.chat_id, []).append(update)
+    return batches
+
+
+def process_chat_updates(updates: List[TelegramUpdate], handler: Callable[[dict], Any]) -> Dict[str, int]:
+    """
+    پردازش ترتیبی آپدیت‌های یک چت. خطای یک آپدیت جلوی آپدیت‌های بعدی همان چت را نمی‌گیرد.
+    """
+    stats = {"done": 0, "failed": 0}
+    try:
+        for update in updates:
+            error_message = ""
+            try:
+                handler(update.payload)
+            except Exception as exc:
+                logger.exception("Telegram update %s (chat %s) failed", update.update_id, update.chat_id)
+                error_message = str(exc)[:500] or exc.__class__.__name__
+
+            update.status = TelegramUpdate.STATUS_FAILED if error_message else TelegramUpdate.STATUS_DONE
+            update.error_message = error_message
+            update.attempts += 1
+            update.processed_at = timezone.now()
+            update.save(update_fields=["status", "error_message", "attempts", "processed_at"])
+            stats["failed" if error_message else "done"] += 1
+    finally:
+        close_old_connections()
+    return stats
+
+
+def queue_metrics(window: timedelta = timedelta(minutes=5)) -> Dict[str, Any]:
+    """
+    معیارهای تاخیر صف: تعداد در انتظار، عمر قدیمی‌ترین آپدیت و تاخیر دریافت تا پایان پردازش در بازه اخیر.
+    """
+    now = timezone.now()
+    pending = TelegramUpdate.objects.filter(status=TelegramUpdate.STATUS_PENDING)
+    oldest = pending.aggregate(oldest=Min("received_at"))["oldest"]
+    recent = list(
+        TelegramUpdate.objects.filter(processed_at__gte=now - window)
+        .order_by()
+        .values_list("received_at", "processed_at")
+    )
+    lags = sorted((processed - received).total_seconds() * 1000 for received, processed in recent)
+
+    def percentile(p: float) -> Optional[int]:
+        if not lags:
+            return None
+        return int(lags[min(len(lags) - 1, int(round(p * (len(lags) - 1))))])
+
+    return {
+        "pending": pending.count(),
+        "processing": TelegramUpdate.objects.filter(status=TelegramUpdate.STATUS_PROCESSING).count(),
+        "oldest_pending_age_ms": int((now - oldest).total_seconds() * 1000) if oldest else 0,
+        "processed_recent": len(lags),
+        "lag_p50_ms": percentile(0.5),
+        "lag_p95_ms": percentile(0.95),
+        "lag_max_ms": int(lags[-1]) if lags else None,
+    }
+
+
+class UpdateWorkerPool:
+    """
+    اجرای آپدیت‌ها با ThreadPoolExecutor: هر چت حداکثر یک job در حال اجرا دارد.
+    با workers=1 همه‌چیز در همین thread اجرا می‌شود (برای تست و دیباگ).
+    """
+
+    def __init__(self, handler: Callable[[dict], Any], workers: int = 8, shard: int = 0, shards: int = 1):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.shard = shard
+        self.shards = shards
+        self.executor = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        self.in_flight: Dict[Optional[int], Any] = {}
+        self.stats = {"done": 0, "failed": 0}
+
+    def _collect(self) -> None:
+        for chat_id, future in list(self.in_flight.items()):
+            if future.done():
+                del self.in_flight[chat_id]
+                for key, value in future.result().items():
+                    self.stats[key] += value
+
+    def run_once(self, limit: int = 200) -> int:
+        """
+        یک دور برداشتن و زمان‌بندی آپدیت‌ها؛ تعداد آپدیت‌های زمان‌بندی‌شده را برمی‌گرداند.
+        """
+        self._collect()
+        if self.executor and len(self.in_flight) >= self.workers * 4:
+            return 0
+        batches = claim_pending_batches(
+            limit=limit, busy_chats=self.in_flight.keys(), shard=self.shard, shards=self.shards
+        )
+        for chat_id, updates in batches.items():
+            if self.executor:
+                self.in_flight[chat_id] = self.executor.submit(process_chat_updates, updates, self.handler)
+            else:
+                for key, value in process_chat_updates(updates, self.handler).items():
+                    self.stats[key] += value
+        return sum(len(updates) for updates in batches.values())
+
+    def drain(self) -> None:
+        for future in list(self.in_flight.values()):
+            future.result()
+        self._collect()
+
+    def shutdown(self) -> None:
+        self.drain()
+        if self.executor:
+            self.executor.shutdown(wait=True)
+
+
+def run_worker(
+    handler: Callable[[dict], Any],
+    workers: int = 8,
+    poll_interval: float = 0.5,
+    batch_size: int = 200,
+    stats_interval: float = 60.0,
+    once: bool = False,
+    shard: int = 0,
+    shards: int = 1,
+) -> Dict[str, int]:
+    requeue_stale_updates()
+    pool = UpdateWorkerPool(handler, workers=workers, shard=shard, shards=shards)
+    last_stats = time.monotonic()
+    try:
+        while True:
+            scheduled = pool.run_once(limit=batch_size)
+            if once and not scheduled:
+                pool.drain()
+                if not pool.run_once(limit=batch_size):
+                    break
+                continue
+
+            if time.monotonic() - last_stats >= stats_interval:
+                purge_expired_receipts()
+                purge_processed_updates()
+                logger.info(
+                    "Telegram update queue: %s processed=%s client=%s", queue_metrics(), pool.stats, get_client().metrics()
+                )
+                last_stats = time.monotonic()
+            if not scheduled:
+                time.sleep(poll_interval)
+    finally:
+        pool.shutdown()
+    return pool.stats
@@ -0,0 +1,98 @@
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from django.core.cache import cache
+
+from integrations.models import VendorIntegrationConfig
+
+VENDOR_CONFIG_VERSION_KEY = "integrations:vendor-config:version"
+# هر چند ثانیه یک بار نسخه از کش مشترک خوانده می‌شود (نه در هر پیام)
+VERSION_CHECK_SECONDS = 5
+
+# کلیدهای شناخته‌شده config:
+#   TELEGRAM: chat_id (چت اعلان سفارش به جای Vendor.telegram_chat_id)، events (فهرست رویدادهای مجاز)، enabled
+#   SMS: phone (شماره اعلان به جای primary_phone_number)، order_created_body_id (پترن اختصاصی)، enabled
+
+
+def get_vendor_config_version() -> int:
+    version = cache.get(VENDOR_CONFIG_VERSION_KEY)
+    if version is None:
+        cache.add(VENDOR_CONFIG_VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VENDOR_CONFIG_VERSION_KEY)
+    return version
+
+
+def bump_vendor_config_version() -> int:
+    """
+    بعد از هر تغییر VendorIntegrationConfig یا ارائه‌دهنده‌ها؛ همه پروسه‌ها در فاصله
+    VERSION_CHECK_SECONDS نسخه جدید را می‌بینند و پروسه فعلی بلافاصله.
+    """
+    get_vendor_config_version()
+    try:
+        version = cache.incr(VENDOR_CONFIG_VERSION_KEY)
+    except ValueError:
+        version = int(time.time() * 1000)
+        cache.set(VENDOR_CONFIG_VERSION_KEY, version, timeout=None)
+    resolver.expire()
+    return version
+
+
+class VendorConfigResolver:
+    """
+    همه VendorIntegrationConfigهای فعال (با ارائه‌دهنده فعال) در یک کوئری و در حافظه پروسه، با کلید
+    (vendor_id، kind ارائه‌دهنده). فقط وقتی نسخه در کش مشترک عوض شده باشد دوباره بارگذاری می‌شود،
+    پس مسیر ارسال اعلان کوئری اضافه‌ای ندارد. اگر وندوری برای یک نوع چند ردیف داشته باشد،
+    ارائه‌دهنده با id کمتر برنده است.
+    """
+
+    def __init__(self, check_interval: float = VERSION_CHECK_SECONDS, clock=time.monotonic):
+        self.check_interval = check_interval
+        self.clock = clock
+        self.version: Optional[int] = None
+        self.checked_at: Optional[float] = None
+        self.configs: Dict[Tuple[int, str], Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+
+    def expire(self) -> None:
+        with self.lock:
+            self.checked_at = None
+
+    def _refresh(self) -> None:
+        now = self.clock()
+        with self.lock:
+            if self.checked_at is not None and now - self.checked_at < self.check_interval:
+                return
+            version = get_vendor_config_version()
+            if version != self.version:
+                configs: Dict[Tuple[int, str], Dict[str, Any]] = {}
+                rows = (
+                    VendorIntegrationConfig.objects.filter(is_active=True, provider__is_active=True)
+                    .order_by("provider_id")
+                    .values_list("vendor_id", "provider__kind", "provider__code", "config")
+                )
+                for vendor_id, kind, provider_code, config in rows:
+                    if (vendor_id, kind) not in configs:
+                        configs[(vendor_id, kind)] = {
+                            **(config if isinstance(config, dict) else {}),
+                            "provider_code": provider_code,
+                        }
+                self.configs = configs
+                self.version = version
+            self.checked_at = now
+
+    def get(self, vendor_id, kind: str) -> Dict[str, Any]:
+        """
+        تنظیمات اختصاصی وندور برای یک نوع ارائه‌دهنده (TELEGRAM/SMS/...)؛ بدون ردیف، dict خالی.
+        """
+        if not vendor_id:
+            return {}
+        self._refresh()
+        return self.configs.get((vendor_id, kind), {})
+
+
+resolver = VendorConfigResolver()
+
+
+def get_vendor_config(vendor_id, kind: str) -> Dict[str, Any]:
+    return resolver.get(vendor_id, kind)
@@ -0,0 +1,18 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from integrations.models import IntegrationProvider, VendorIntegrationConfig
+from integrations.services.vendor_config import bump_vendor_config_version
+
+
+@receiver(post_save, sender=VendorIntegrationConfig)
+@receiver(post_delete, sender=VendorIntegrationConfig)
+@receiver(post_save, sender=IntegrationProvider)
+@receiver(post_delete, sender=IntegrationProvider)
+def bump_vendor_config_version_on_change(sender, instance, **kwargs):
+    """
+    تغییر تنظیمات وندور یا فعال/غیرفعال شدن ارائه‌دهنده کش VendorConfigResolver را باطل می‌کند.
+    بعد از commit اجرا می‌شود تا پروسه‌های دیگر داده قدیمی را با نسخه جدید بارگذاری نکنند.
+    """
+    transaction.on_commit(bump_vendor_config_version)
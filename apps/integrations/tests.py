@@ -1,6 +1,47 @@
+import io
+import threading
+import time
+from datetime import timedelta
+
+import requests
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase, override_settings
 from django.urls import reverse
-from unittest.mock import patch
+from django.utils import timezone
+from unittest.mock import Mock, patch
+
+from accounts.models import TelegramUser, User
+from addresses.models import Address
+from catalog.models import OptionGroup, OptionItem, Product, ProductOptionGroup
+from orders.models import Order, OrderItem
+from integrations.models import (
+    ExternalRequestLog,
+    IntegrationProvider,
+    ProviderHealthCheck,
+    TelegramConversation,
+    TelegramUpdate,
+    TelegramUpdateReceipt,
+    VendorIntegrationConfig,
+)
+from integrations.services.conversation import conversation_scope, get_telegram_user, load_conversation
+from integrations.services.menu import get_menu_keyboard
+from integrations.views import _handle_order_status_callback, handle_telegram_update
+from vendors.models import Vendor
+from integrations import loadtest
+from integrations.fakes.sms import FakeSmsPanel
+from integrations.fakes.suite import FakeProviderSuite
+from integrations.services import http_client, payments, request_log, sms, telegram, telegram_dedup, telegram_polling, telegram_updates
+from integrations.services import health, vendor_config
+from integrations.services.health import HealthState, ProviderProber, get_provider_status
+from integrations.services.http_client import OutboundClient
+from integrations.services.request_log import ExternalRequestRecorder, OutboundCall
+from integrations.services.sms_batch import SmsBatcher
+from integrations.services.sms_router import SmsRouter
+from integrations.services.telegram_client import TelegramClient, TokenBucket
+
+# شمارش کوئری‌ها فقط کوئری‌های کاتالوگ را بسنجد، نه خواندن از جدول کش
+LOCAL_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
 
 
 class TelegramWebhookRoutingTests(TestCase):
@@ -21,4 +62,785 @@ class TelegramWebhookRoutingTests(TestCase):
         response = self.client.post(url, data=payload, content_type="application/json")
 
         self.assertEqual(response.status_code, 200)
+        mock_send_message.assert_not_called()
+        self.assertEqual(TelegramUpdate.objects.get().chat_id, 1)
+
+        call_command("process_telegram_updates", "--once", "--workers", "1", stdout=io.StringIO())
+        mock_send_message.assert_called_once()
+        self.assertEqual(TelegramUpdate.objects.get().status, TelegramUpdate.STATUS_DONE)
+
+    @override_settings(TELEGRAM_WEBHOOK_SECRET="s3cr3t", TELEGRAM_WEBHOOK_INLINE=True)
+    @patch("integrations.views.telegram.send_message")
+    def test_inline_mode_processes_inside_request(self, mock_send_message):
+        url = reverse("integrations:telegram-webhook", kwargs={"secret": "s3cr3t"})
+        payload = {"message": {"chat": {"id": 1}, "text": "/start"}}
+
+        self.client.post(url, data=payload, content_type="application/json")
+
         mock_send_message.assert_called_once()
+        self.assertFalse(TelegramUpdate.objects.exists())
+
+
+class TelegramUpdateQueueTests(TestCase):
+    def _enqueue(self, update_id, chat_id):
+        return telegram_updates.enqueue_update(
+            {"update_id": update_id, "message": {"chat": {"id": chat_id}, "text": str(update_id)}}
+        )
+
+    def test_keeps_order_per_chat_and_skips_busy_chats(self):
+        for update_id, chat_id in ((1, 10), (2, 20), (3, 10), (4, 20), (5, 10)):
+            self._enqueue(update_id, chat_id)
+
+        batches = telegram_updates.claim_pending_batches(busy_chats={20})
+        self.assertEqual(list(batches), [10])
+        self.assertEqual([u.update_id for u in batches[10]], [1, 3, 5])
+
+        handled = []
+        telegram_updates.process_chat_updates(batches[10], lambda update: handled.append(update["update_id"]))
+        self.assertEqual(handled, [1, 3, 5])
+        self.assertEqual(TelegramUpdate.objects.filter(status=TelegramUpdate.STATUS_PENDING).count(), 2)
+
+    def test_failed_update_does_not_block_chat_and_metrics_report_lag(self):
+        self._enqueue(1, 10)
+        self._enqueue(2, 10)
+
+        def handler(update):
+            if update["update_id"] == 1:
+                raise ValueError("boom")
+
+        stats = telegram_updates.run_worker(handler, workers=1, once=True)
+
+        self.assertEqual(stats, {"done": 1, "failed": 1})
+        self.assertEqual(TelegramUpdate.objects.get(update_id=1).error_message, "boom")
+        metrics = telegram_updates.queue_metrics()
+        self.assertEqual((metrics["pending"], metrics["processed_recent"]), (0, 2))
+        self.assertIsNotNone(metrics["lag_p95_ms"])
+
+    def test_claims_carry_a_token_and_are_never_handed_out_twice(self):
+        self._enqueue(1, 10)
+        self._enqueue(2, 20)
+
+        first = telegram_updates.claim_pending_batches(shards=1)
+        second = telegram_updates.claim_pending_batches(shards=1)
+
+        self.assertEqual(sorted(first), [10, 20])
+        self.assertEqual(second, {})
+        self.assertEqual(len(set(TelegramUpdate.objects.values_list("claimed_by", flat=True))), 1)
+
+    @override_settings(TELEGRAM_UPDATE_RETENTION_SECONDS=3600)
+    def test_processed_updates_are_purged_after_retention(self):
+        old, recent, _ = self._enqueue(1, 10), self._enqueue(2, 10), self._enqueue(3, 10)
+        TelegramUpdate.objects.filter(pk=old.pk).update(
+            status=TelegramUpdate.STATUS_DONE, processed_at=timezone.now() - timedelta(hours=2)
+        )
+        TelegramUpdate.objects.filter(pk=recent.pk).update(status=TelegramUpdate.STATUS_FAILED, processed_at=timezone.now())
+
+        self.assertEqual(telegram_updates.purge_processed_updates(), 1)
+        self.assertEqual(sorted(TelegramUpdate.objects.values_list("update_id", flat=True)), [2, 3])
+
+
+
+class TelegramPollingTests(TestCase):
+    def setUp(self):
+        telegram_dedup.deduplicator.clear()
+
+    def _update(self, update_id, chat_id):
+        return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "text": str(update_id)}}
+
+    def test_consumes_batches_with_offset_and_keeps_chat_order(self):
+        client = Mock()
+        client.call.side_effect = [
+            {"ok": True, "result": [self._update(7, 1), self._update(8, 2), self._update(9, 1)]},
+            {"ok": True, "result": [self._update(10, 2)]},
+            {"ok": True, "result": []},
+        ]
+        handled = []
+
+        stats = telegram_polling.run_polling(
+            lambda update: handled.append(update["update_id"]), client=client, workers=1, once=True
+        )
+
+        offsets = [call.args[1].get("offset") for call in client.call.call_args_list]
+        self.assertEqual(offsets, [None, 10, 11])
+        self.assertEqual(handled, [7, 9, 8, 10])
+        self.assertEqual((stats["received"], stats["done"]), (4, 4))
+        self.assertEqual(telegram_polling.initial_offset(), 11)
+
+
+class TelegramClientTests(TestCase):
+    def _response(self, status_code, body):
+        return Mock(status_code=status_code, json=Mock(return_value=body), headers={}, text="")
+
+    def test_token_bucket_reserves_wait_time(self):
+        now = [0.0]
+        bucket = TokenBucket(rate=1, capacity=1, clock=lambda: now[0])
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 1.0)
+        now[0] = 2.0
+        self.assertEqual(bucket.reserve(), 0.0)
+
+    def test_honours_retry_after_and_backs_off_on_server_errors(self):
+        sleeps = []
+        client = TelegramClient(token="t", base_url="http://fake", session=requests.Session(), sleep=sleeps.append)
+        client.session.post = Mock(
+            side_effect=[
+                self._response(429, {"ok": False, "parameters": {"retry_after": 3}}),
+                self._response(502, {}),
+                self._response(200, {"ok": True, "result": {}}),
+            ]
+        )
+
+        self.assertEqual(client.call("editMessageText", {"chat_id": -100, "text": "hi"}), {"ok": True, "result": {}})
+
+        self.assertEqual(client.session.post.call_args[0][0], "http://fake/bott/editMessageText")
+        self.assertIn(3.0, sleeps)
+        self.assertIn(client.backoff_base * 2, sleeps)
+        metrics = client.metrics()
+        self.assertEqual((metrics["requests"], metrics["sent"], metrics["rate_limited"], metrics["retries"]), (3, 1, 1, 2))
+
+    def test_unchanged_edit_counts_as_success(self):
+        client = TelegramClient(token="t", base_url="http://fake", session=requests.Session(), sleep=lambda s: None)
+        not_modified = {
+            "ok": False,
+            "error_code": 400,
+            "description": "Bad Request: message is not modified: specified new message content and reply markup "
+            "are exactly the same as a current content and reply markup of the message",
+        }
+        client.session.post = Mock(return_value=self._response(400, not_modified))
+
+        with patch("integrations.services.telegram.get_client", return_value=client), override_settings(
+            TELEGRAM_BOT_TOKEN="t"
+        ):
+            self.assertTrue(telegram.edit_message_text("1", 10, "same"))
+        self.assertIsNone(client.call("sendMessage", {"chat_id": 1, "text": "same"}))
+        metrics = client.metrics()
+        self.assertEqual((metrics["not_modified"], metrics["failed"]), (1, 1))
+
+    def test_send_message_retries_only_when_the_request_never_arrived(self):
+        client = TelegramClient(token="t", base_url="http://fake", session=requests.Session(), sleep=lambda s: None)
+        client.session.post = Mock(
+            side_effect=[
+                requests.ConnectionError("refused"),
+                self._response(429, {"ok": False, "parameters": {"retry_after": 1}}),
+                self._response(200, {"ok": True, "result": {}}),
+            ]
+        )
+        self.assertEqual(client.call("sendMessage", {"chat_id": 1, "text": "hi"}), {"ok": True, "result": {}})
+
+        for failure in (requests.ReadTimeout("slow"), self._response(502, {})):
+            client.session.post = Mock(side_effect=[failure, self._response(200, {"ok": True, "result": {}})])
+            self.assertIsNone(client.call("sendMessage", {"chat_id": 1, "text": "hi"}))
+            self.assertEqual(client.session.post.call_count, 1)
+
+    def test_per_chat_limit_throttles_second_message(self):
+        sleeps = []
+        client = TelegramClient(token="t", base_url="http://fake", session=requests.Session(), sleep=sleeps.append)
+        client.session.post = Mock(return_value=self._response(200, {"ok": True}))
+
+        client.call("sendMessage", {"chat_id": 1, "text": "a"})
+        client.call("sendMessage", {"chat_id": 1, "text": "b"})
+        client.call("sendMessage", {"chat_id": 2, "text": "c"})
+
+        self.assertEqual(len(sleeps), 1)
+        self.assertEqual(client.metrics()["throttled"], 1)
+
+
+
+class TelegramUpdateDedupTests(TestCase):
+    def setUp(self):
+        telegram_dedup.deduplicator.clear()
+        self.url = reverse("integrations:telegram-webhook", kwargs={"secret": "s3cr3t"})
+
+    @override_settings(TELEGRAM_WEBHOOK_SECRET="s3cr3t")
+    def test_redelivered_update_is_queued_once(self):
+        payload = {"update_id": 77, "callback_query": {"data": "cart:checkout", "message": {"chat": {"id": 5}}}}
+        for _ in range(3):
+            response = self.client.post(self.url, data=payload, content_type="application/json")
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(TelegramUpdate.objects.count(), 1)
+
+    @override_settings(TELEGRAM_WEBHOOK_SECRET="s3cr3t")
+    def test_failed_enqueue_releases_the_receipt_for_the_retry(self):
+        payload = {"update_id": 78, "message": {"chat": {"id": 5}, "text": "hi"}}
+        with patch("integrations.views.telegram_updates.enqueue_update", side_effect=RuntimeError("db down")):
+            with self.assertRaises(RuntimeError):
+                self.client.post(self.url, data=payload, content_type="application/json")
+        self.assertFalse(TelegramUpdateReceipt.objects.exists())
+
+        response = self.client.post(self.url, data=payload, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(TelegramUpdate.objects.get().update_id, 78)
+
+    def test_lru_answers_without_queries_and_db_covers_other_processes(self):
+        self.assertFalse(telegram_dedup.deduplicator.is_duplicate(1))
+        with self.assertNumQueries(0):
+            self.assertTrue(telegram_dedup.deduplicator.is_duplicate(1))
+
+        other_process = telegram_dedup.UpdateDeduplicator()
+        self.assertTrue(other_process.is_duplicate(1))
+
+    @override_settings(TELEGRAM_UPDATE_DEDUP_TTL=60)
+    def test_expired_receipts_are_purged(self):
+        self.assertFalse(telegram_dedup.deduplicator.is_duplicate(2))
+        TelegramUpdateReceipt.objects.update(received_at=timezone.now() - timedelta(minutes=5))
+
+        self.assertEqual(telegram_dedup.purge_expired_receipts(), 1)
+        self.assertFalse(telegram_dedup.UpdateDeduplicator().is_duplicate(2))
+
+
+
+class TelegramConversationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(phone="09120000000")
+        self.tg_user = TelegramUser.objects.create(
+            user=user,
+            telegram_user_id=42,
+            state={"otp_verified": True, "vendor_id": 3, "cart": [{"product_id": 1, "quantity": 1}]},
+        )
+
+    def test_seeds_from_legacy_state_then_one_read_and_one_write_per_scope(self):
+        conversation = load_conversation(self.tg_user)
+        self.assertTrue(conversation.otp_verified)
+        self.assertEqual(conversation.vendor_id, 3)
+
+        with self.assertNumQueries(2):  # TelegramUser + conversation in one SELECT, one UPDATE on exit
+            with conversation_scope():
+                tg_user = get_telegram_user(42)
+                conversation = load_conversation(tg_user)
+                self.assertIs(get_telegram_user(42), tg_user)
+                self.assertIs(load_conversation(tg_user), conversation)
+                conversation.cart_append({"product_id": 2, "quantity": 1})
+                conversation.start_option_flow(5, [7, 8])
+                conversation.option_increment(7, 70)
+                conversation.option_increment(7, 70)
+
+        record = TelegramConversation.objects.get(pk=self.tg_user.pk)
+        self.assertEqual(record.version, 1)
+        self.assertEqual([item["product_id"] for item in record.cart], [1, 2])
+        self.assertEqual(record.option_flow["selections"], {"7": {"70": 2}})
+
+    def test_conflicting_writers_keep_both_cart_lines(self):
+        first = load_conversation(self.tg_user)
+        with conversation_scope():
+            second = load_conversation(TelegramUser.objects.get(pk=self.tg_user.pk))
+            second.cart_append({"product_id": 3, "quantity": 1})
+            first.cart_append({"product_id": 2, "quantity": 1})  # autoflush outside the scope
+
+        record = TelegramConversation.objects.get(pk=self.tg_user.pk)
+        self.assertEqual(sorted(item["product_id"] for item in record.cart), [1, 2, 3])
+        self.assertEqual(record.version, 2)
+
+    def test_changes_are_flushed_when_processing_fails(self):
+        with self.assertRaises(RuntimeError):
+            with conversation_scope():
+                conversation = load_conversation(get_telegram_user(42))
+                conversation.reset(vendor_id=3)  # مثل checkout: سفارش ساخته شد و سبد خالی شد
+                raise RuntimeError("telegram send failed")
+
+        record = TelegramConversation.objects.get(pk=self.tg_user.pk)
+        self.assertEqual((record.cart, record.version), ([], 1))
+
+    def test_reset_keeps_auth_fields(self):
+        conversation = load_conversation(self.tg_user)
+        conversation.reset(vendor_id=9, coords={"latitude": 35.7, "longitude": 51.4})
+
+        record = TelegramConversation.objects.get(pk=self.tg_user.pk)
+        self.assertTrue(record.otp_verified)
+        self.assertEqual((record.vendor_id, record.cart, record.latitude), (9, [], 35.7))
+
+
+
+@patch("integrations.views.evaluate_vendor_serviceability", return_value=(True, "IN_ZONE", 5000, None, 100))
+@patch("integrations.views.pick_nearest_available_vendor")
+@patch("integrations.services.telegram.get_client")
+class TelegramOrderFlowTests(TestCase):
+    def setUp(self):
+        self.vendor = Vendor.objects.create(name="Kitchen", slug="kitchen")
+        user = User.objects.create_user(phone="09120000000")
+        self.tg_user = TelegramUser.objects.create(user=user, telegram_user_id=42, state={"otp_verified": True})
+        self.address = Address.objects.create(user=user, title="خانه", latitude=35.7, longitude=51.4)
+        self.sandwich = Product.objects.create(vendor=self.vendor, name_fa="ساندویچ", base_price=100000)
+        sauce = OptionGroup.objects.create(vendor=self.vendor, name="سس", max_select=2)
+        self.ketchup = OptionItem.objects.create(group=sauce, name="کچاپ", price_delta_amount=5000)
+        ProductOptionGroup.objects.create(product=self.sandwich, group=sauce)
+
+    def _tap(self, data):
+        handle_telegram_update(
+            {"callback_query": {"id": data, "data": data, "message": {"chat": {"id": 42}, "message_id": 1}}}
+        )
+
+    def _calls(self, get_client):
+        return [call.args[0] for call in get_client.return_value.call.call_args_list]
+
+    def test_option_flow_adds_priced_line_to_cart(self, get_client, pick_vendor, _serviceability):
+        get_client.return_value.call.return_value = {"ok": True}
+        pick_vendor.return_value = self.vendor
+        group_id = self.ketchup.group_id
+
+        self._tap(f"address:{self.address.id}")
+        self._tap(f"product:{self.sandwich.id}")
+        self._tap(f"option:pick:{group_id}:{self.ketchup.id}")
+        self._tap(f"option:pick:{group_id}:{self.ketchup.id}")
+        self._tap("option:next")
+        self._tap("cart:review")
+
+        conversation = TelegramConversation.objects.get(pk=self.tg_user.pk)
+        self.assertIsNone(conversation.option_flow)
+        self.assertEqual(len(conversation.cart), 1)
+        self.assertEqual(conversation.cart[0]["modifier_unit_total"], 10000)
+        self.assertEqual((conversation.vendor_id, conversation.delivery_fee), (self.vendor.id, 5000))
+        last_edit = get_client.return_value.call.call_args_list[-2].args
+        self.assertEqual(last_edit[0], "editMessageText")
+        self.assertIn("جمع کل: 115,000", last_edit[1]["text"])
+
+        # قبلاً هر ضربه یک sendMessage جدید بود (۶ پیام)؛ حالا فقط منو ارسال و بقیه ویرایش می‌شود
+        calls = self._calls(get_client)
+        self.assertEqual(calls.count("sendMessage"), 1)
+        self.assertEqual(calls.count("editMessageText"), 5)
+        self.assertEqual(calls.count("answerCallbackQuery"), 6)
+
+    def test_validation_errors_answer_with_alert_instead_of_message(self, get_client, pick_vendor, _serviceability):
+        get_client.return_value.call.return_value = {"ok": True}
+        handle_telegram_update({"callback_query": {"id": "cb1", "data": "cart:review", "message": {"chat": {"id": 42}, "message_id": 1}}})
+
+        get_client.return_value.call.assert_called_once_with(
+            "answerCallbackQuery", {"callback_query_id": "cb1", "text": "سبد خرید خالی است.", "show_alert": True}
+        )
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class TelegramMenuKeyboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.vendor = Vendor.objects.create(name="Kitchen", slug="kitchen")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products = [
+                Product.objects.create(vendor=self.vendor, name_fa=f"غذا {i}", base_price=10000, sort_order=i)
+                for i in range(10)
+            ]
+
+    def test_cached_pages_until_product_change(self):
+        first = get_menu_keyboard(self.vendor.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_menu_keyboard(self.vendor.id), first)
+
+        self.assertEqual(len(first["inline_keyboard"]), 8 + 2)
+        self.assertEqual(first["inline_keyboard"][-2][-1]["callback_data"], "menu:page:1")
+        second_page = get_menu_keyboard(self.vendor.id, page=1)
+        self.assertEqual(len(second_page["inline_keyboard"]), 2 + 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].name_fa = "پیتزا"
+            self.products[0].save()
+        refreshed = get_menu_keyboard(self.vendor.id)
+        self.assertTrue(refreshed["inline_keyboard"][0][0]["text"].startswith("پیتزا"))
+
+
+@override_settings(TELEGRAM_ADMIN_CHAT_ID="900")
+class OrderEventFanoutTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(phone="09120000000")
+        TelegramUser.objects.create(user=user, telegram_user_id=42)
+        vendor = Vendor.objects.create(name="Kitchen", slug="kitchen", telegram_chat_id="700")
+        address = Address.objects.create(user=user, full_text="Tehran")
+        product = Product.objects.create(vendor=vendor, name_fa="کباب", base_price=1000)
+        self.order = Order.objects.create(user=user, vendor=vendor, delivery_address=address, total_amount=1000)
+        OrderItem.objects.create(
+            order=self.order, product=product, product_title_snapshot="کباب", unit_price_snapshot=1000, quantity=2
+        )
+
+    @patch("integrations.services.telegram.send_message")
+    def test_loads_context_once_and_sends_concurrently(self, send_message):
+        send_message.side_effect = lambda **kwargs: time.sleep(0.2)
+        order = Order.objects.get(pk=self.order.pk)
+        # تنظیمات وندورها یک بار در هر پروسه بارگذاری می‌شود، نه در هر اعلان
+        vendor_config.get_vendor_config(order.vendor_id, "TELEGRAM")
+
+        started = time.monotonic()
+        with self.assertNumQueries(2):
+            telegram.dispatch_order_event(order, event="ORDER_CREATED")
+        elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 0.5)
+        sent = {call.kwargs["chat_id"]: call.kwargs["text"] for call in send_message.call_args_list}
+        self.assertEqual(set(sent), {"700", "900", "42"})
+        self.assertIn("کباب ×2", sent["700"])
+        self.assertEqual(sent["700"], sent["900"])
+
+
+class TelegramLoadTestHarnessTests(TestCase):
+    def test_scripted_order_flow_against_fake_bot_api(self):
+        loadtest.seed_loadtest_catalog()
+        request_log.recorder.buffer.clear()
+
+        report = loadtest.run_loadtest(chats=2, concurrency=1)
+
+        self.assertEqual((report["updates"], report["errors"]), (18, 0))
+        self.assertEqual(Order.objects.filter(source="TELEGRAM").count(), 2)
+        self.assertIn("tap:option:pick", report["by_kind"])
+        self.assertGreater(report["queries_per_update"]["mean"], 0)
+        self.assertEqual(report["outbound_by_method"]["answerCallbackQuery"], 10)
+        self.assertIsNotNone(report["latency_ms"]["p99"])
+        logged = ExternalRequestLog.objects.filter(request_url__contains="/bot***/")
+        self.assertEqual(logged.count(), sum(report["outbound_by_method"].values()))
+        self.assertFalse(ExternalRequestLog.objects.filter(request_url__contains=loadtest.LOADTEST_TOKEN).exists())
+
+
+class SmsRouterTests(TestCase):
+    def setUp(self):
+        self.primary = IntegrationProvider.objects.create(
+            kind="SMS", code="sms_primary", name="Primary", base_url="http://primary.test"
+        )
+        self.backup = IntegrationProvider.objects.create(
+            kind="SMS", code="sms_backup", name="Backup", base_url="http://backup.test"
+        )
+        self.now = [100.0]
+        self.session = Mock()
+        self.router = SmsRouter(deadline=5, attempt_timeout=2, session=self.session, clock=lambda: self.now[0])
+
+    def _post(self, url, data=None, timeout=None):
+        if url.startswith("http://primary.test"):
+            raise requests.ConnectionError("primary down")
+        self.now[0] += 0.05
+        return Mock(status_code=200, json=Mock(return_value={"Value": "1", "RetStatus": 1}))
+
+    def test_fails_over_then_skips_provider_in_cooldown(self):
+        self.session.post.side_effect = self._post
+
+        for _ in range(3):
+            result = self.router.send("09120000000", 1, "1234")
+            self.assertEqual(result["RetStatus"], 1)
+        primary_calls = [c for c in self.session.post.call_args_list if c.args[0].startswith("http://primary.test")]
+        self.assertLessEqual(len(primary_calls), 3)
+        self.assertTrue(all(c.kwargs["timeout"] <= 2 for c in self.session.post.call_args_list))
+
+        self.session.post.reset_mock()
+        self.router.routes["sms_primary"].cooldown_until = self.now[0] + 30
+        self.router.send("09120000000", 1, "1234")
+        self.assertEqual(self.session.post.call_count, 1)
+        self.assertTrue(self.session.post.call_args.args[0].startswith("http://backup.test"))
+
+        metrics = self.router.metrics()
+        self.assertEqual(metrics["sms_primary"]["status"], "DOWN")
+        self.assertEqual(metrics["sms_backup"]["status"], "UP")
+        self.assertTrue(ProviderHealthCheck.objects.filter(provider=self.primary).exists())
+        self.assertEqual(ProviderHealthCheck.objects.filter(provider=self.backup, status="UP").count(), 1)
+
+    def test_rejected_everywhere_reports_attempts(self):
+        self.session.post.return_value = Mock(
+            status_code=200, json=Mock(return_value={"RetStatus": 35, "StrRetStatus": "InvalidData"})
+        )
+        result = self.router.send("09120000000", 1, "1234")
+        self.assertFalse(result["ok"])
+        self.assertEqual([a["provider"] for a in result["attempts"]], ["sms_primary", "sms_backup"])
+
+
+class SmsBatcherTests(TestCase):
+    def test_coalesces_vendor_messages_and_flushes_on_window(self):
+        sent = []
+        batcher = SmsBatcher(window=0.05, max_batch=10, workers=2, send=lambda *args: sent.append(args) or {"ok": True})
+
+        batcher.enqueue("0911", 7, ["Shop", "A1"], coalesce_key="vendor:1")
+        batcher.enqueue("0912", 8, ["A1", "track"])
+        batcher.enqueue("0911", 7, ["Shop", "B2"], coalesce_key="vendor:1")
+        batcher.enqueue("0912", 8, ["A1", "track"])
+        self.assertEqual(sent, [])
+
+        deadline = time.monotonic() + 2
+        while batcher.metrics()["batches"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertCountEqual(sent, [("0911", 7, ["Shop", "A1، B2"]), ("0912", 8, ["A1", "track"])])
+        metrics = batcher.metrics()
+        self.assertEqual((metrics["enqueued"], metrics["sent"], metrics["saved"]), (4, 2, 2))
+        self.assertIsNotNone(metrics["batch_p95_ms"])
+
+    def test_size_trigger_and_zero_window_send_without_waiting(self):
+        sent = []
+        batcher = SmsBatcher(window=0, send=lambda *args: sent.append(args) or {"ok": True})
+        batcher.enqueue("0911", 7, ["x"])
+        self.assertEqual(len(sent), 1)
+
+        batcher = SmsBatcher(window=60, max_batch=2, send=lambda *args: sent.append(args) or {"ok": True})
+        batcher.enqueue("0913", 7, ["a"])
+        batcher.enqueue("0914", 7, ["b"])
+        deadline = time.monotonic() + 2
+        while len(sent) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(sent), 3)
+
+
+class ExternalRequestRecorderTests(TestCase):
+    def test_buffers_until_flush_and_redacts_secrets(self):
+        recorder = ExternalRequestRecorder(flush_interval=0)
+        provider = IntegrationProvider.objects.create(kind="PAYMENT", code="pay_zibal", name="Zibal")
+
+        with OutboundCall(
+            recorder,
+            "TELEGRAM",
+            "POST",
+            "https://api.telegram.org/bot123:SECRET/sendMessage",
+            body={"chat_id": 1, "text": "hi"},
+        ) as call:
+            call.response = Mock(status_code=200, headers={"Content-Type": "application/json"}, content=b'{"ok": true}')
+        with self.assertRaises(requests.Timeout):
+            with OutboundCall(
+                recorder,
+                "SMS",
+                "POST",
+                "https://rest.example/api/SendSMS/BaseServiceNumber",
+                body={"username": "u", "password": "p@ss", "text": "123456"},
+                redact_keys=("text",),
+            ):
+                raise requests.Timeout("read timed out")
+        with OutboundCall(recorder, "PAYMENT", "POST", "https://gateway.test/v1/request", body={"merchant": "m-1"}) as call:
+            call.response = Mock(status_code=500, headers={}, content=b"oops")
+
+        self.assertEqual(ExternalRequestLog.objects.count(), 0)
+        with self.assertNumQueries(2):
+            self.assertEqual(recorder.flush(), 3)
+
+        telegram_log, sms_log, payment_log = ExternalRequestLog.objects.order_by("id")
+        self.assertEqual(telegram_log.request_url, "https://api.telegram.org/bot***/sendMessage")
+        self.assertEqual((telegram_log.outcome, telegram_log.response_body), ("SUCCESS", {"ok": True}))
+        self.assertEqual(sms_log.outcome, "TIMEOUT")
+        self.assertEqual(sms_log.request_body, {"username": "u", "password": "***", "text": "***"})
+        self.assertEqual((payment_log.outcome, payment_log.provider_id), ("FAIL", provider.id))
+        self.assertEqual(payment_log.request_body, {"merchant": "***"})
+
+
+class ProviderHealthProbeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_hysteresis_needs_consecutive_observations(self):
+        state = HealthState()
+        self.assertEqual(state.observe("UP"), "UP")
+        self.assertEqual(state.observe("DOWN"), "UP")
+        self.assertEqual(state.observe("UP"), "UP")
+        self.assertEqual(state.observe("DOWN"), "UP")
+        self.assertEqual(state.observe("DOWN"), "DOWN")
+        self.assertEqual([state.observe("UP") for _ in range(3)], ["DOWN", "DOWN", "UP"])
+
+    def test_probes_concurrently_records_checks_and_publishes_status(self):
+        IntegrationProvider.objects.create(kind="TELEGRAM", code="telegram_main", name="Bot", base_url="http://tg.test")
+        IntegrationProvider.objects.create(kind="SMS", code="sms_main", name="SMS", base_url="http://sms.test")
+        IntegrationProvider.objects.create(kind="PAYMENT", code="pay_zibal", name="Zibal", base_url="http://pay.test")
+
+        def post(url, timeout=None, **kwargs):
+            if url.startswith("http://sms.test"):
+                raise requests.ConnectionError("refused")
+            body = {"ok": True, "result": {}} if "/getMe" in url else {"result": 203}
+            return Mock(status_code=200, json=Mock(return_value=body))
+
+        session = Mock()
+        session.post.side_effect = post
+        prober = ProviderProber(workers=3, timeout=1, session=session)
+        checks = prober.run_once()
+
+        statuses = {check.provider.code: check.status for check in checks}
+        self.assertEqual(statuses, {"telegram_main": "UP", "sms_main": "DOWN", "pay_zibal": "UP"})
+        self.assertEqual(ProviderHealthCheck.objects.count(), 3)
+        called = {call.args[0] for call in session.post.call_args_list}
+        self.assertIn("http://pay.test/v1/inquiry", called)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_provider_status("sms_main")["status"], "DOWN")
+            self.assertEqual(get_provider_status("telegram_main")["status"], "UP")
+
+    def test_status_falls_back_to_the_latest_check_row(self):
+        provider = IntegrationProvider.objects.create(kind="SMS", code="sms_backup", name="SMS")
+        ProviderHealthCheck.objects.create(provider=provider, status="UP", checked_at=timezone.now() - timedelta(hours=1))
+        ProviderHealthCheck.objects.create(provider=provider, status="DOWN", details={"source": "probe"})
+        # نمونه cooldown مسیریاب پیامک جدیدتر است ولی وضعیت را تعیین نمی‌کند
+        ProviderHealthCheck.objects.create(provider=provider, status="UP", details={"source": "sms_router"})
+        # پروسه‌ای که daemon در کش آن منتشر نکرده است
+        health._local_status.clear()
+
+        self.assertEqual(get_provider_status("sms_backup")["status"], "DOWN")
+        with self.assertNumQueries(0):
+            self.assertTrue(health.is_provider_down("sms_backup"))
+        self.assertIsNone(get_provider_status("missing"))
+
+        cooled = IntegrationProvider.objects.create(kind="SMS", code="sms_cooled", name="SMS 2")
+        ProviderHealthCheck.objects.create(provider=cooled, status="DOWN", details={"source": "sms_router"})
+        self.assertFalse(health.is_provider_down("sms_cooled"))
+
+
+@override_settings(PAYMENT_RETURN_URL="https://shop.test/payment-result", CACHES=LOCAL_CACHE)
+@patch("orders.services.telegram.dispatch_order_event")
+class PaymentCallbackSingleFlightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(phone="09120000000")
+        vendor = Vendor.objects.create(name="Kitchen", slug="kitchen")
+        address = Address.objects.create(user=user, full_text="Tehran")
+        self.order = Order.objects.create(
+            user=user, vendor=vendor, delivery_address=address, meta={"payment": {"trackId": 555}}
+        )
+        self.url = reverse("integrations:payment-callback")
+
+    @patch("integrations.views.payments.verify_track_id")
+    def test_redirect_and_notify_callbacks_verify_once(self, verify, dispatch):
+        verify.return_value = {
+            "order_id": self.order.short_code, "status": "PAID", "track_id": "555", "result": 100, "ref_number": "r1",
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            redirect_response = self.client.get(self.url, {"trackId": "555"})
+            notify_response = self.client.post(self.url, {"trackId": "555"}, content_type="application/json")
+            # اعلان‌ها بعد از commit (و آزاد شدن قفل ردیف) فرستاده می‌شوند، نه داخل آن
+            dispatch.assert_not_called()
+
+        self.assertEqual(redirect_response.status_code, 302)
+        self.assertIn("payment_status=PAID", redirect_response["Location"])
+        self.assertEqual(notify_response.status_code, 200)
+        self.assertEqual(notify_response.json()["order_status"], "CONFIRMED")
+        verify.assert_called_once_with("555")
+        events = [call.kwargs.get("event") for call in dispatch.call_args_list]
+        self.assertEqual(events.count("ORDER_PAYMENT_VERIFIED"), 1)
+
+    def test_waits_for_the_in_flight_result_instead_of_verifying_again(self, dispatch):
+        cache.add(payments.CALLBACK_LOCK_KEY.format(track_id="777"), True, 30)
+        stored = {"payload": {"status": "ok", "track_id": "777"}, "status_code": 200}
+        timer = threading.Timer(0.1, lambda: cache.set(payments.CALLBACK_RESULT_KEY.format(track_id="777"), stored, 60))
+        timer.start()
+        process = Mock()
+
+        payload, status_code = payments.single_flight_callback("777", process)
+
+        timer.join()
+        self.assertEqual((payload, status_code), (stored["payload"], 200))
+        process.assert_not_called()
+
+    def test_does_not_release_a_lock_taken_over_by_another_request(self, dispatch):
+        lock_key = payments.CALLBACK_LOCK_KEY.format(track_id="888")
+
+        def slow_process():
+            # قفل این درخواست منقضی شده و درخواست دیگری آن را گرفته است
+            cache.set(lock_key, "other-token", 30)
+            return {"status": "error"}, 502, False
+
+        payments.single_flight_callback("888", slow_process)
+
+        self.assertEqual(cache.get(lock_key), "other-token")
+
+
+class FakeProviderSuiteTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(phone="09120000000")
+        vendor = Vendor.objects.create(name="Kitchen", slug="kitchen")
+        address = Address.objects.create(user=user, full_text="Tehran")
+        self.order = Order.objects.create(user=user, vendor=vendor, delivery_address=address, total_amount=250000)
+
+    def test_services_talk_to_fake_providers_over_http(self):
+        with FakeProviderSuite() as fakes, fakes.activate(
+            TELEGRAM_BOT_TOKEN="123:fake", PAYMENT_MERCHANT_ID="zibal", EXTERNAL_REQUEST_LOG_FLUSH_SECONDS=0
+        ):
+            payment = payments.create_payment(self.order)
+            track_id = payment["trackId"]
+            self.assertEqual(payment["payment_url"], f"{fakes.zibal.url}/start/{track_id}")
+            self.assertEqual(payments.verify_track_id(str(track_id))["status"], "FAILED")
+            self.assertEqual(requests.get(payment["payment_url"]).status_code, 200)
+            verification = payments.verify_track_id(str(track_id))
+            self.assertEqual((verification["status"], verification["order_id"]), ("PAID", self.order.short_code))
+            self.assertEqual(payments.inquire_payment(str(track_id))["status"], 1)
+
+            sms_result = sms.send_pattern_sms("09121112233", 412520, ["A1", "B2"])
+            self.assertEqual(sms_result["RetStatus"], 1)
+            self.assertEqual(fakes.sms.messages_to("09121112233")[0]["text"], "A1;B2")
+
+            self.assertTrue(telegram.set_webhook("https://shop.test/hook"))
+            self.assertEqual(fakes.telegram.webhook_url, "https://shop.test/hook")
+
+    def test_injected_rate_limits_carry_retry_after(self):
+        with FakeSmsPanel(rate_limit_rate=1.0, retry_after=7, seed=1) as fake:
+            response = requests.post(f"{fake.url}/api/SendSMS/GetCredit", data={"username": "u", "password": "p"})
+            self.assertEqual((response.status_code, response.headers["Retry-After"]), (429, "7"))
+            fake.configure(rate_limit_rate=0.0)
+            response = requests.post(f"{fake.url}/api/SendSMS/GetCredit", data={"username": "u", "password": "p"})
+            self.assertEqual(response.json()["RetStatus"], 1)
+            self.assertEqual(fake.faults[429], 1)
+
+
+class OutboundClientTests(TestCase):
+    def test_endpoint_rows_override_defaults_and_are_cached(self):
+        provider = IntegrationProvider.objects.create(
+            kind="PAYMENT", code="pay_zibal", name="Zibal", base_url="https://pay.example/v2"
+        )
+        provider.endpoints.create(code="verify_payment", path="/settle", timeout_seconds=4)
+        client = OutboundClient()
+
+        endpoint = client.resolve("PAYMENT", "verify_payment", "https://gateway.zibal.ir/v1")
+        self.assertEqual(
+            (endpoint.url, endpoint.read_timeout, endpoint.provider_id), ("https://pay.example/v2/settle", 4, provider.id)
+        )
+        with self.assertNumQueries(0):
+            fallback = client.resolve("PAYMENT", "create_payment", "https://gateway.zibal.ir/v1")
+        self.assertEqual(
+            (fallback.url, fallback.read_timeout, fallback.retries), ("https://gateway.zibal.ir/v1/request", 15, 0)
+        )
+        self.assertIs(client.session_for(endpoint.url), client.session_for("https://pay.example/other"))
+
+    def test_circuit_opens_after_repeated_failures_and_half_opens_after_reset(self):
+        now = [0.0]
+        client = OutboundClient(failure_threshold=2, reset_seconds=30, clock=lambda: now[0], sleep=lambda seconds: None)
+        session = client.session_for("http://gw.test")
+        session.request = Mock(side_effect=requests.ConnectionError("refused"))
+
+        with self.assertRaises(http_client.CircuitOpenError):
+            client.request("PAYMENT", "verify_payment", "http://gw.test/v1", json={"trackId": 1})
+        self.assertEqual(session.request.call_count, 2)
+        self.assertEqual(client.breaker_for("http://gw.test").state, "OPEN")
+
+        now[0] = 31.0
+        session.request = Mock(return_value=Mock(status_code=200, headers={}, content=b"{}"))
+        response = client.request("PAYMENT", "verify_payment", "http://gw.test/v1", json={"trackId": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.breaker_for("http://gw.test").state, "CLOSED")
+        self.assertEqual(session.request.call_args.kwargs["timeout"], (client.connect_timeout, 15))
+
+
+class VendorConfigResolverTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(phone="09120000000")
+        self.vendor = Vendor.objects.create(name="Kitchen", slug="kitchen", telegram_chat_id="700")
+        address = Address.objects.create(user=user, full_text="Tehran")
+        self.order = Order.objects.create(user=user, vendor=self.vendor, delivery_address=address, total_amount=1000)
+        self.telegram_provider = IntegrationProvider.objects.create(kind="TELEGRAM", code="telegram_main", name="Bot")
+        vendor_config.resolver.expire()
+
+    @override_settings(TELEGRAM_ADMIN_CHAT_ID="")
+    @patch("integrations.services.telegram.send_message")
+    def test_vendor_override_is_cached_and_refreshed_on_save(self, send_message):
+        with self.captureOnCommitCallbacks(execute=True):
+            config = VendorIntegrationConfig.objects.create(
+                vendor=self.vendor, provider=self.telegram_provider, config={"chat_id": "-100555"}
+            )
+
+        telegram.dispatch_order_event(self.order, event="ORDER_CREATED")
+        with self.assertNumQueries(0):
+            self.assertEqual(vendor_config.get_vendor_config(self.vendor.id, "TELEGRAM")["chat_id"], "-100555")
+            self.assertEqual(vendor_config.get_vendor_config(self.vendor.id, "SMS"), {})
+        self.assertEqual(send_message.call_args.kwargs["chat_id"], "-100555")
+
+        config.config = {"chat_id": "-100555", "events": ["ORDER_CANCELLED"]}
+        with self.captureOnCommitCallbacks(execute=True):
+            config.save()
+        send_message.reset_mock()
+        telegram.dispatch_order_event(self.order, event="ORDER_CREATED")
+        send_message.assert_not_called()
+
+    @override_settings(TELEGRAM_ADMIN_CHAT_ID="")
+    @patch("orders.services.handle_order_status_change")
+    @patch("integrations.services.telegram.send_message")
+    def test_status_buttons_are_authorized_for_the_override_chat(self, send_message, _status_change):
+        with self.captureOnCommitCallbacks(execute=True):
+            VendorIntegrationConfig.objects.create(
+                vendor=self.vendor, provider=self.telegram_provider, config={"chat_id": "-100555"}
+            )
+        Order.objects.filter(pk=self.order.pk).update(status="CONFIRMED")
+
+        _handle_order_status_callback("-100555", f"order:{self.order.id}:PREPARING")
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "PREPARING")
+        self.assertEqual(self.order.status_history.get().changed_by_type, "VENDOR")
@@ -1,11 +1,10 @@
-import hashlib
 import logging
-import secrets
-from datetime import timedelta
 from typing import Optional
 from urllib.parse import urlencode
 
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import redirect
@@ -24,15 +23,23 @@ from integrations.models import (
     ProviderHealthCheck,
     VendorIntegrationConfig,
 )
-from integrations.services import payments, sms, telegram
+from integrations.services import payments, sms, telegram, telegram_dedup, telegram_updates
+from integrations.services.menu import get_menu_keyboard
+from orders.pricing import PricingError, price_cart
+from integrations.services.conversation import (
+    conversation_scope,
+    forget_telegram_user,
+    get_telegram_user,
+    load_conversation,
+)
 from orders.models import Order, OrderStatusHistory
 from orders.modifiers import NO_OPTION_ITEM_NAMES, build_option_group_payload, normalize_modifiers
 from orders.views import OrderCreateSerializer
 from orders.services import (
     ACTIVE_ORDER_STATUSES,
+    apply_payment_result,
     evaluate_vendor_serviceability,
     notify_order_created,
-    notify_payment_verified,
     pick_nearest_available_vendor,
 )
 from rest_framework.request import Request
@@ -40,10 +47,10 @@ from rest_framework.test import APIRequestFactory
 from vendors.models import Vendor
 from core.utils import normalize_phone
 from accounts.models import LoginOTP
+from accounts.services import OTPRateLimited, issue_login_otp, verify_otp_code
 
 logger = logging.getLogger(__name__)
 
-AUTH_STATE_KEYS = {"otp_verified", "awaiting_otp", "pending_phone"}
 
 
 def _contact_request_keyboard():
@@ -54,29 +61,6 @@ def _contact_request_keyboard():
     }
 
 
-def _update_state(
-    tg_user: TelegramUser,
-    new_values: dict,
-    *,
-    clear_keys: Optional[list[str]] = None,
-    replace: bool = False,
-):
-    current_state = tg_user.state or {}
-    if replace:
-        state = {k: current_state.get(k) for k in AUTH_STATE_KEYS if k in current_state}
-    else:
-        state = current_state.copy()
-
-    if clear_keys:
-        for key in clear_keys:
-            state.pop(key, None)
-
-    state.update(new_values)
-    tg_user.state = state
-    tg_user.save(update_fields=["state"])
-    return state
-
-
 def _extract_address_details(text: str) -> tuple[str, str]:
     cleaned = (text or "").strip()
     if not cleaned:
@@ -94,14 +78,6 @@ def _is_iranian_phone(phone: str) -> bool:
     return len(normalized) == 11 and normalized.startswith("09")
 
 
-def _make_otp_code(length: int = 6) -> str:
-    return "".join(secrets.choice("0123456789") for _ in range(length))
-
-
-def _hash_code(code: str, salt: str) -> str:
-    return hashlib.sha256(f"{code}:{salt}".encode("utf-8")).hexdigest()
-
-
 def _option_required_min(option_group: dict) -> int:
     min_select = option_group.get("min_select") or 0
     if min_select > 0:
@@ -161,6 +137,7 @@ def _link_telegram_user(chat_id, phone_normalized: str, chat: dict) -> TelegramU
             "is_bot": chat.get("is_bot", False),
         },
     )
+    forget_telegram_user(chat_id)
     return tg_user
 
 
@@ -198,22 +175,14 @@ def _send_otp_for_phone(chat_id, phone: str, chat: dict):
         return HttpResponse(status=status.HTTP_200_OK)
 
     phone_normalized = normalize_phone(phone)
-    ttl_seconds = int(getattr(settings, "LOGIN_OTP_TTL_SECONDS", 120))
-    expires_at = timezone.now() + timedelta(seconds=ttl_seconds)
-    raw_code = _make_otp_code(length=6)
-    salt = secrets.token_hex(8)
-    code_hash = _hash_code(raw_code, salt)
-    ip = None
-    user_agent = ""
-    LoginOTP.objects.create(
-        phone=phone_normalized,
-        purpose=LoginOTP.PURPOSE_LINK_TG,
-        code_hash=code_hash,
-        salt=salt,
-        expires_at=expires_at,
-        ip=ip,
-        user_agent=user_agent,
-    )
+    try:
+        _otp, raw_code = issue_login_otp(phone=phone_normalized, purpose=LoginOTP.PURPOSE_LINK_TG)
+    except OTPRateLimited as exc:
+        telegram.send_message(
+            chat_id=str(chat_id),
+            text=f"درخواست کد بیش از حد مجاز است. لطفاً {exc.retry_after} ثانیه دیگر دوباره تلاش کنید.",
+        )
+        return HttpResponse(status=status.HTTP_200_OK)
     try:
         sms.send_otp(mobile=phone_normalized, code=raw_code)
     except Exception:
@@ -221,15 +190,7 @@ def _send_otp_for_phone(chat_id, phone: str, chat: dict):
         return HttpResponse(status=status.HTTP_200_OK)
 
     tg_user = _link_telegram_user(chat_id, phone_normalized, chat)
-
-    _update_state(
-        tg_user,
-        {
-            "pending_phone": phone_normalized,
-            "otp_verified": False,
-            "awaiting_otp": True,
-        },
-    )
+    load_conversation(tg_user).set(pending_phone=phone_normalized, otp_verified=False, awaiting_otp=True)
 
     telegram.send_message(chat_id=str(chat_id), text="کد تایید ارسال شد. لطفاً کد ۶ رقمی را وارد کنید.")
     return HttpResponse(status=status.HTTP_200_OK)
@@ -242,22 +203,15 @@ def _link_phone_without_otp(chat_id, phone: str, chat: dict):
 
     phone_normalized = normalize_phone(phone)
     tg_user = _link_telegram_user(chat_id, phone_normalized, chat)
-
-    _update_state(
-        tg_user,
-        {
-            "pending_phone": phone_normalized,
-            "otp_verified": True,
-            "awaiting_otp": False,
-        },
-    )
+    load_conversation(tg_user).set(pending_phone=phone_normalized, otp_verified=True, awaiting_otp=False)
 
     telegram.send_message(chat_id=str(chat_id), text="حساب شما تایید شد.")
     return _send_main_menu(tg_user)
 
 
 def _verify_otp_and_link(tg_user: TelegramUser, code: str):
-    phone = (tg_user.state or {}).get("pending_phone") or tg_user.user.phone
+    conversation = load_conversation(tg_user)
+    phone = conversation.pending_phone or tg_user.user.phone
     if not phone:
         return False, "ابتدا شماره موبایل را وارد کنید."
 
@@ -277,7 +231,7 @@ def _verify_otp_and_link(tg_user: TelegramUser, code: str):
     if now > otp.expires_at:
         return False, "کد منقضی شده است. دوباره درخواست دهید."
 
-    if _hash_code(code, otp.salt) != otp.code_hash:
+    if not verify_otp_code(otp, code):
         otp.attempts += 1
         otp.save(update_fields=["attempts"])
         return False, "کد اشتباه است. دوباره تلاش کنید."
@@ -286,7 +240,7 @@ def _verify_otp_and_link(tg_user: TelegramUser, code: str):
     otp.attempts += 1
     otp.save(update_fields=["is_used", "attempts"])
 
-    _update_state(tg_user, {"otp_verified": True, "awaiting_otp": False})
+    conversation.set(otp_verified=True, awaiting_otp=False)
     return True, None
 
 
@@ -338,21 +292,16 @@ def _handle_live_location(tg_user: TelegramUser, location: dict):
         telegram.send_message(chat_id=str(chat_id), text="در این موقعیت امکان ارسال نداریم.")
         return HttpResponse(status=status.HTTP_200_OK)
 
-    _update_state(
-        tg_user,
-        {
-            "pending_address": {
-                "latitude": float(lat),
-                "longitude": float(lng),
-                "vendor_id": vendor.id,
-                "delivery_type": delivery_type,
-                "delivery_fee": delivery_fee or 0,
-            },
-            "coords": coords,
-            "cart": [],
-            "awaiting_address_details": True,
+    load_conversation(tg_user).reset(
+        pending_address={
+            "latitude": float(lat),
+            "longitude": float(lng),
+            "vendor_id": vendor.id,
+            "delivery_type": delivery_type,
+            "delivery_fee": delivery_fee or 0,
         },
-        replace=True,
+        coords=coords,
+        awaiting_address_details=True,
     )
 
     telegram.send_message(
@@ -377,8 +326,8 @@ def _handle_address_details(tg_user: TelegramUser, text: str):
         )
         return HttpResponse(status=status.HTTP_200_OK)
 
-    state = tg_user.state or {}
-    pending_addr = state.get("pending_address") or {}
+    conversation = load_conversation(tg_user)
+    pending_addr = conversation.pending_address or {}
     lat = pending_addr.get("latitude")
     lng = pending_addr.get("longitude")
     vendor_id = pending_addr.get("vendor_id")
@@ -404,29 +353,21 @@ def _handle_address_details(tg_user: TelegramUser, text: str):
         receiver_name=tg_user.user.full_name or title,
     )
 
-    products = Product.objects.filter(
-        vendor=vendor, is_active=True, is_available=True, is_available_today=True
-    ).order_by("sort_order", "id")
 
-    _update_state(
-        tg_user,
-        {
-            "address_id": address.id,
-            "vendor_id": vendor.id,
-            "delivery_type": delivery_type,
-            "delivery_fee": delivery_fee,
-            "cart": state.get("cart") or [],
-            "coords": {"latitude": float(lat), "longitude": float(lng)},
-        },
-        clear_keys=["pending_address", "awaiting_address_details"],
-        replace=True,
+    conversation.reset(
+        address_id=address.id,
+        vendor_id=vendor.id,
+        delivery_type=delivery_type,
+        delivery_fee=delivery_fee,
+        cart=list(conversation.cart or []),
+        coords={"latitude": float(lat), "longitude": float(lng)},
     )
 
     telegram.send_message(
         chat_id=str(chat_id),
         text=f"آدرس «{title}» ذخیره شد و نزدیک‌ترین آشپزخانه انتخاب شد: {vendor.name}\n"
         f"روش ارسال: {'پس‌کرایه' if delivery_type == 'OUT_OF_ZONE_SNAPP' else 'پیک داخلی'}",
-        reply_markup=telegram.build_menu_keyboard(products),
+        reply_markup=get_menu_keyboard(vendor.id),
     )
     return HttpResponse(status=status.HTTP_200_OK)
 
@@ -552,10 +493,39 @@ class ProviderHealthCheckViewSet(viewsets.ModelViewSet):
 @authentication_classes([])          # مهم: هیچ auth کلاس پیش‌فرض اعمال نشود
 @permission_classes([AllowAny])  
 def telegram_webhook(request, secret: str):
+    """
+    آپدیت خام ذخیره می‌شود و فوراً 200 برمی‌گردد؛ پردازش با process_telegram_updates انجام می‌شود.
+    با TELEGRAM_WEBHOOK_INLINE=True (محیط توسعه) آپدیت همین‌جا پردازش می‌شود.
+    """
     if settings.TELEGRAM_WEBHOOK_SECRET and secret != settings.TELEGRAM_WEBHOOK_SECRET:
         return HttpResponse(status=status.HTTP_403_FORBIDDEN)
 
     update = request.data or {}
+    # تکرار update_id (retry تلگرام) قبل از هر خواندن state رد می‌شود؛ اگر ذخیره یا پردازش
+    # خطا بدهد رسید پس گرفته می‌شود تا retry تلگرام دوباره پذیرفته شود
+    with telegram_dedup.receive_update(update) as duplicate:
+        if duplicate:
+            return HttpResponse(status=status.HTTP_200_OK)
+
+        if getattr(settings, "TELEGRAM_WEBHOOK_INLINE", False):
+            handle_telegram_update(update)
+            return HttpResponse(status=status.HTTP_200_OK)
+
+        if isinstance(update, dict) and update:
+            telegram_updates.enqueue_update(update)
+    return HttpResponse(status=status.HTTP_200_OK)
+
+
+def handle_telegram_update(update: dict):
+    """
+    پردازش یک آپدیت تلگرام (پیام یا callback). توسط worker صف و حالت inline فراخوانی می‌شود.
+    وضعیت گفتگو یک بار خوانده و در پایان حداکثر یک بار نوشته می‌شود.
+    """
+    with conversation_scope():
+        return _dispatch_telegram_update(update)
+
+
+def _dispatch_telegram_update(update: dict):
     callback_query = update.get("callback_query") or {}
     if callback_query:
         return _handle_telegram_callback(callback_query)
@@ -570,10 +540,10 @@ def telegram_webhook(request, secret: str):
     if not chat_id:
         return HttpResponse(status=status.HTTP_200_OK)
 
-    tg_user = TelegramUser.objects.filter(telegram_user_id=chat_id).select_related("user").first()
+    tg_user = get_telegram_user(chat_id)
 
     if text.startswith("/start"):
-        if tg_user and (tg_user.state or {}).get("otp_verified"):
+        if tg_user and load_conversation(tg_user).otp_verified:
             return _send_main_menu(tg_user)
         return _prompt_for_phone(chat_id)
 
@@ -591,12 +561,12 @@ def telegram_webhook(request, secret: str):
         return _prompt_for_phone(chat_id)
 
     normalized_text = (text or "").strip()
-    state = tg_user.state or {}
-    is_verified = state.get("otp_verified", False)
+    conversation = load_conversation(tg_user)
+    is_verified = conversation.otp_verified
     if not is_verified:
         if _is_iranian_phone(normalize_phone(normalized_text)):
             return _send_otp_for_phone(chat_id, normalized_text, chat)
-        if normalized_text.isdigit() and len(normalized_text) in {4, 5, 6} and state.get("awaiting_otp"):
+        if normalized_text.isdigit() and len(normalized_text) in {4, 5, 6} and conversation.awaiting_otp:
             ok, err = _verify_otp_and_link(tg_user, normalized_text)
             if ok:
                 telegram.send_message(chat_id=str(chat_id), text="حساب شما تایید شد.")
@@ -606,7 +576,7 @@ def telegram_webhook(request, secret: str):
         telegram.send_message(chat_id=str(chat_id), text="ابتدا شماره موبایل ایران را وارد کرده و کد تایید را وارد کنید.")
         return HttpResponse(status=status.HTTP_200_OK)
 
-    if state.get("awaiting_address_details") and normalized_text:
+    if conversation.awaiting_address_details and normalized_text:
         return _handle_address_details(tg_user, text)
 
     if location:
@@ -629,18 +599,19 @@ def _handle_telegram_callback(callback_query: dict):
     if not chat_id:
         return HttpResponse(status=status.HTTP_200_OK)
 
-    tg_user = TelegramUser.objects.filter(telegram_user_id=chat_id).select_related("user").first()
-    state = tg_user.state if tg_user else {}
-    if not tg_user or not (state or {}).get("otp_verified"):
+    tg_user = get_telegram_user(chat_id)
+    if not tg_user or not load_conversation(tg_user).otp_verified:
         return _prompt_for_phone(chat_id)
 
     if data.startswith("order:"):
-        return _handle_order_status_callback(chat_id, data)
-
-    if data.startswith("menu:") or data.startswith("address:") or data.startswith("product:") or data.startswith("cart:"):
-        return _handle_menu_callback(chat_id, data)
+        result = _handle_order_status_callback(chat_id, data)
+    elif data.startswith(("menu:", "address:", "product:", "option:", "cart:")):
+        result = _handle_menu_callback(chat_id, data)
+    else:
+        result = telegram.CallbackNotice("دستور ناشناخته است.", alert=True)
 
-    telegram.send_message(chat_id=str(chat_id), text="دستور ناشناخته است.")
+    # handlerها می‌توانند به جای ارسال پیام جدید intent ویرایش (EditMessage) یا toast برگردانند
+    telegram.apply_callback_intent(callback_query, result)
     return HttpResponse(status=status.HTTP_200_OK)
 
 
@@ -659,9 +630,9 @@ def _handle_order_status_callback(chat_id, data: str):
         telegram.send_message(chat_id=str(chat_id), text="سفارش پیدا نشد.")
         return HttpResponse(status=status.HTTP_200_OK)
 
-    vendor_chat_id = getattr(order.vendor, "telegram_chat_id", "") or ""
+    vendor_chat_id = telegram.get_vendor_chat_id(order.vendor)
     admin_chat_id = str(settings.TELEGRAM_ADMIN_CHAT_ID) if settings.TELEGRAM_ADMIN_CHAT_ID else ""
-    if str(chat_id) not in {str(vendor_chat_id), admin_chat_id}:
+    if str(chat_id) not in {vendor_chat_id, admin_chat_id} - {""}:
         telegram.send_message(chat_id=str(chat_id), text="شما مجاز به تغییر این سفارش نیستید.")
         return HttpResponse(status=status.HTTP_200_OK)
 
@@ -669,7 +640,7 @@ def _handle_order_status_callback(chat_id, data: str):
         telegram.send_message(chat_id=str(chat_id), text="وضعیت سفارش قبلاً روی همین حالت است.")
         return HttpResponse(status=status.HTTP_200_OK)
 
-    is_vendor_chat = str(chat_id) == str(vendor_chat_id)
+    is_vendor_chat = bool(vendor_chat_id) and str(chat_id) == vendor_chat_id
     valid_statuses = (
         {"PREPARING", "OUT_FOR_DELIVERY"}
         if is_vendor_chat
@@ -713,12 +684,13 @@ def _handle_order_status_callback(chat_id, data: str):
 
 
 def _handle_menu_callback(chat_id, data: str):
-    tg_user = TelegramUser.objects.filter(telegram_user_id=chat_id).select_related("user").first()
+    tg_user = get_telegram_user(chat_id)
     if not tg_user:
         telegram.send_message(chat_id=str(chat_id), text="برای استفاده ابتدا شماره موبایل خود را ارسال کنید.")
         return HttpResponse(status=status.HTTP_200_OK)
 
     user = tg_user.user
+    conversation = load_conversation(tg_user)
 
     if data == "menu:order":
         addresses = Address.objects.filter(user=user, is_active=True)
@@ -736,6 +708,15 @@ def _handle_menu_callback(chat_id, data: str):
         )
         return HttpResponse(status=status.HTTP_200_OK)
 
+    if data.startswith("menu:page:"):
+        try:
+            page = int(data.split(":")[2])
+        except ValueError:
+            page = 0
+        if not conversation.vendor_id:
+            return telegram.CallbackNotice("ابتدا آدرس تحویل را انتخاب کنید.", alert=True)
+        return telegram.EditMessage(text="منوی امروز:", reply_markup=get_menu_keyboard(conversation.vendor_id, page))
+
     if data == "menu:share_location":
         telegram.send_message(
             chat_id=str(chat_id),
@@ -769,22 +750,17 @@ def _handle_menu_callback(chat_id, data: str):
         if not last_order:
             telegram.send_message(chat_id=str(chat_id), text="سفارشی برای تکرار یافت نشد.")
             return HttpResponse(status=status.HTTP_200_OK)
-        _update_state(
-            tg_user,
-            {
-                "cart": [
-                    {
-                        "product_id": str(item.product_id),
-                        "quantity": item.quantity,
-                    }
-                    for item in last_order.items.all()
-                ],
-                "address_id": getattr(last_order, "delivery_address_id", None),
-                "vendor_id": getattr(last_order, "vendor_id", None),
-                "delivery_type": getattr(last_order.delivery, "delivery_type", None) if hasattr(last_order, "delivery") else None,
-            },
-            clear_keys=["pending_address", "awaiting_address_details"],
-            replace=True,
+        conversation.reset(
+            cart=[
+                {
+                    "product_id": str(item.product_id),
+                    "quantity": item.quantity,
+                }
+                for item in last_order.items.all()
+            ],
+            address_id=getattr(last_order, "delivery_address_id", None),
+            vendor_id=getattr(last_order, "vendor_id", None),
+            delivery_type=getattr(last_order.delivery, "delivery_type", None) if hasattr(last_order, "delivery") else None,
         )
         telegram.send_message(
             chat_id=str(chat_id),
@@ -835,28 +811,19 @@ def _handle_menu_callback(chat_id, data: str):
             telegram.send_message(chat_id=str(chat_id), text="ارسال به این آدرس فعال نیست.")
             return HttpResponse(status=status.HTTP_200_OK)
 
-        products = Product.objects.filter(
-            vendor=vendor, is_active=True, is_available=True, is_available_today=True
-        ).order_by("sort_order", "id")
-
-        _update_state(
-            tg_user,
-            {
-                "address_id": address.id,
-                "vendor_id": vendor.id,
-                "delivery_type": delivery_type,
-                "delivery_fee": delivery_fee or 0,
-                "cart": [],
-                "coords": coords,
-            },
-            clear_keys=["pending_address", "awaiting_address_details"],
-            replace=True,
+
+        conversation.reset(
+            address_id=address.id,
+            vendor_id=vendor.id,
+            delivery_type=delivery_type,
+            delivery_fee=delivery_fee or 0,
+            coords=coords,
         )
 
         telegram.send_message(
             chat_id=str(chat_id),
             text=f"آشپزخانه انتخاب شد: {vendor.name}\nروش ارسال: {'پس‌کرایه' if delivery_type == 'OUT_OF_ZONE_SNAPP' else 'پیک داخلی'}",
-            reply_markup=telegram.build_menu_keyboard(products),
+            reply_markup=get_menu_keyboard(vendor.id),
         )
         return HttpResponse(status=status.HTTP_200_OK)
 
@@ -864,129 +831,96 @@ def _handle_menu_callback(chat_id, data: str):
         product_id = data.split(":")[1]
         product = Product.objects.filter(id=product_id, is_active=True, is_available=True, is_available_today=True).first()
         if not product:
-            telegram.send_message(chat_id=str(chat_id), text="این آیتم در دسترس نیست.")
-            return HttpResponse(status=status.HTTP_200_OK)
+            return telegram.CallbackNotice("این آیتم در دسترس نیست.", alert=True)
 
-        state = tg_user.state or {}
-        if not state.get("cart"):
-            state["cart"] = []
-        if state.get("vendor_id") and str(state["vendor_id"]) != str(product.vendor_id):
-            telegram.send_message(chat_id=str(chat_id), text="آدرس یا فروشنده انتخاب شده با این آیتم سازگار نیست.")
-            return HttpResponse(status=status.HTTP_200_OK)
+        if conversation.vendor_id and str(conversation.vendor_id) != str(product.vendor_id):
+            return telegram.CallbackNotice("آدرس یا فروشنده انتخاب شده با این آیتم سازگار نیست.", alert=True)
         option_groups = build_option_group_payload(product)
         if not option_groups:
-            state["cart"].append({"product_id": product.id, "quantity": 1, "modifiers": []})
-            tg_user.state = state
-            tg_user.save(update_fields=["state"])
-
-            telegram.send_message(
-                chat_id=str(chat_id),
-                text=f"{product.name_fa} به سبد خرید اضافه شد.",
-                reply_markup=telegram.build_menu_keyboard(Product.objects.filter(
-                    vendor=product.vendor, is_active=True, is_available=True, is_available_today=True
-                ).order_by("sort_order", "id")),
-            )
-            return HttpResponse(status=status.HTTP_200_OK)
+            conversation.cart_append({"product_id": product.id, "quantity": 1, "modifiers": []})
+            # پیام منو همان‌جا می‌ماند؛ فقط toast نمایش داده می‌شود
+            return telegram.CallbackNotice(f"{product.name_fa} به سبد خرید اضافه شد.")
 
-        state["option_flow"] = {
-            "product_id": product.id,
-            "group_ids": [group["id"] for group in option_groups],
-            "group_index": 0,
-            "selections": {},
-        }
-        tg_user.state = state
-        tg_user.save(update_fields=["state"])
+        conversation.start_option_flow(product.id, [group["id"] for group in option_groups])
 
         first_group = option_groups[0]
         required_min = _option_required_min(first_group)
         requirement_text = f"حداقل انتخاب: {required_min}" if required_min else "اختیاری"
-        telegram.send_message(
-            chat_id=str(chat_id),
+        return telegram.EditMessage(
             text=f"برای {product.name_fa}، {first_group['name']} را انتخاب کنید.\n{requirement_text}",
             reply_markup=_build_option_keyboard(first_group, {}),
         )
-        return HttpResponse(status=status.HTTP_200_OK)
 
     if data.startswith("option:"):
-        state = tg_user.state or {}
-        option_flow = state.get("option_flow") or {}
+        option_flow = conversation.option_flow or {}
         product_id = option_flow.get("product_id")
         group_ids = option_flow.get("group_ids") or []
         group_index = int(option_flow.get("group_index") or 0)
         if not product_id or not group_ids or group_index >= len(group_ids):
-            telegram.send_message(chat_id=str(chat_id), text="فرآیند انتخاب گزینه‌ها معتبر نیست.")
-            return HttpResponse(status=status.HTTP_200_OK)
+            return telegram.CallbackNotice("فرآیند انتخاب گزینه‌ها معتبر نیست.", alert=True)
 
         product = Product.objects.filter(id=product_id, is_active=True).first()
         if not product:
-            telegram.send_message(chat_id=str(chat_id), text="آیتم انتخاب‌شده در دسترس نیست.")
-            return HttpResponse(status=status.HTTP_200_OK)
+            return telegram.CallbackNotice("آیتم انتخاب‌شده در دسترس نیست.", alert=True)
 
         option_groups = {group["id"]: group for group in build_option_group_payload(product)}
         current_group_id = group_ids[group_index]
         current_group = option_groups.get(current_group_id)
         if not current_group:
-            telegram.send_message(chat_id=str(chat_id), text="گروه انتخابی یافت نشد.")
-            return HttpResponse(status=status.HTTP_200_OK)
+            return telegram.CallbackNotice("گروه انتخابی یافت نشد.", alert=True)
 
-        selections = option_flow.get("selections") or {}
-        group_selections = selections.get(str(current_group_id)) or {}
-        group_selections = {int(k): int(v) for k, v in group_selections.items()}
+        group_selections = conversation.option_selections(current_group_id)
 
         action = data.split(":", 2)[1] if ":" in data else ""
         if action == "pick":
             parts = data.split(":")
             if len(parts) < 4:
-                telegram.send_message(chat_id=str(chat_id), text="گزینه انتخابی نامعتبر است.")
-                return HttpResponse(status=status.HTTP_200_OK)
+                return telegram.CallbackNotice("گزینه انتخابی نامعتبر است.", alert=True)
             item_id = int(parts[3])
             items_map = {item["id"]: item for item in current_group.get("items", [])}
             item = items_map.get(item_id)
             if not item:
-                telegram.send_message(chat_id=str(chat_id), text="گزینه انتخابی نامعتبر است.")
-                return HttpResponse(status=status.HTTP_200_OK)
+                return telegram.CallbackNotice("گزینه انتخابی نامعتبر است.", alert=True)
             if item["name"] in NO_OPTION_ITEM_NAMES:
-                group_selections = {item_id: 1}
+                conversation.option_set_group(current_group_id, {item_id: 1})
             else:
-                for selected_id in list(group_selections.keys()):
-                    selected_item = items_map.get(selected_id)
-                    if selected_item and selected_item.get("name") in NO_OPTION_ITEM_NAMES:
-                        group_selections.pop(selected_id, None)
-                group_selections[item_id] = group_selections.get(item_id, 0) + 1
+                no_option_ids = [
+                    selected_id
+                    for selected_id in group_selections
+                    if (items_map.get(selected_id) or {}).get("name") in NO_OPTION_ITEM_NAMES
+                ]
+                conversation.option_increment(current_group_id, item_id, drop_item_ids=no_option_ids)
+            group_selections = conversation.option_selections(current_group_id)
         elif action == "reset":
+            conversation.option_set_group(current_group_id, {})
             group_selections = {}
         elif action == "cancel":
-            state.pop("option_flow", None)
-            tg_user.state = state
-            tg_user.save(update_fields=["state"])
-            telegram.send_message(chat_id=str(chat_id), text="فرآیند انتخاب گزینه‌ها لغو شد.")
-            return HttpResponse(status=status.HTTP_200_OK)
+            conversation.clear_option_flow()
+            return telegram.EditMessage(
+                text="منوی امروز:",
+                reply_markup=get_menu_keyboard(product.vendor_id),
+                notice="فرآیند انتخاب گزینه‌ها لغو شد.",
+            )
         elif action == "next":
             total_selected = sum(group_selections.values())
             required_min = _option_required_min(current_group)
             max_select = current_group.get("max_select")
             if required_min and total_selected < required_min:
-                telegram.send_message(chat_id=str(chat_id), text="ابتدا گزینه‌های لازم را انتخاب کنید.")
-                return HttpResponse(status=status.HTTP_200_OK)
+                return telegram.CallbackNotice("ابتدا گزینه‌های لازم را انتخاب کنید.", alert=True)
             if max_select and total_selected > max_select:
-                telegram.send_message(chat_id=str(chat_id), text=f"حداکثر انتخاب مجاز {max_select} است.")
-                return HttpResponse(status=status.HTTP_200_OK)
-            selections[str(current_group_id)] = group_selections
-            option_flow["selections"] = selections
-            option_flow["group_index"] = group_index + 1
-            if option_flow["group_index"] >= len(group_ids):
+                return telegram.CallbackNotice(f"حداکثر انتخاب مجاز {max_select} است.", alert=True)
+            if group_index + 1 >= len(group_ids):
                 modifiers_payload = []
                 for group_id in group_ids:
-                    group_items = selections.get(str(group_id), {})
+                    group_items = conversation.option_selections(group_id)
                     items_payload = [{"id": item_id, "quantity": qty} for item_id, qty in group_items.items()]
                     modifiers_payload.append({"group_id": group_id, "items": items_payload})
                 try:
                     modifiers, modifier_total = normalize_modifiers(product, modifiers_payload)
                 except ValueError as exc:
-                    telegram.send_message(chat_id=str(chat_id), text=str(exc))
-                    return HttpResponse(status=status.HTTP_200_OK)
+                    return telegram.CallbackNotice(str(exc), alert=True)
 
-                state.setdefault("cart", []).append(
+                conversation.cart_append(
                     {
                         "product_id": product.id,
                         "quantity": 1,
@@ -994,74 +928,47 @@ def _handle_menu_callback(chat_id, data: str):
                         "modifier_unit_total": modifier_total,
                     }
                 )
-                state.pop("option_flow", None)
-                tg_user.state = state
-                tg_user.save(update_fields=["state"])
-                telegram.send_message(
-                    chat_id=str(chat_id),
-                    text=f"{product.name_fa} به سبد خرید اضافه شد.",
-                    reply_markup=telegram.build_menu_keyboard(Product.objects.filter(
-                        vendor=product.vendor, is_active=True, is_available=True, is_available_today=True
-                    ).order_by("sort_order", "id")),
+                conversation.clear_option_flow()
+                return telegram.EditMessage(
+                    text=f"{product.name_fa} به سبد خرید اضافه شد.\nمنوی امروز:",
+                    reply_markup=get_menu_keyboard(product.vendor_id),
+                    notice=f"{product.name_fa} به سبد خرید اضافه شد.",
                 )
-                return HttpResponse(status=status.HTTP_200_OK)
 
-            next_group_id = group_ids[option_flow["group_index"]]
+            conversation.option_advance()
+            next_group_id = group_ids[group_index + 1]
             next_group = option_groups.get(next_group_id)
-            selections = option_flow.get("selections") or {}
-            tg_user.state = state
-            tg_user.save(update_fields=["state"])
             required_min = _option_required_min(next_group)
             requirement_text = f"حداقل انتخاب: {required_min}" if required_min else "اختیاری"
-            telegram.send_message(
-                chat_id=str(chat_id),
+            return telegram.EditMessage(
                 text=f"مرحله بعد: {next_group['name']}\n{requirement_text}",
-                reply_markup=_build_option_keyboard(next_group, selections.get(str(next_group_id), {})),
+                reply_markup=_build_option_keyboard(next_group, conversation.option_selections(next_group_id)),
             )
-            return HttpResponse(status=status.HTTP_200_OK)
         else:
-            telegram.send_message(chat_id=str(chat_id), text="دستور نامعتبر است.")
-            return HttpResponse(status=status.HTTP_200_OK)
+            return telegram.CallbackNotice("دستور نامعتبر است.", alert=True)
 
-        selections[str(current_group_id)] = group_selections
-        option_flow["selections"] = selections
-        state["option_flow"] = option_flow
-        tg_user.state = state
-        tg_user.save(update_fields=["state"])
         summary = _format_option_selection(current_group, group_selections)
         required_min = _option_required_min(current_group)
         requirement_text = f"حداقل انتخاب: {required_min}" if required_min else "اختیاری"
         text = f"{current_group['name']}\n{requirement_text}"
         if summary:
             text += f"\nانتخاب‌های فعلی:\n{summary}"
-        telegram.send_message(
-            chat_id=str(chat_id),
-            text=text,
-            reply_markup=_build_option_keyboard(current_group, group_selections),
-        )
-        return HttpResponse(status=status.HTTP_200_OK)
+        return telegram.EditMessage(text=text, reply_markup=_build_option_keyboard(current_group, group_selections))
 
     if data == "cart:review":
-        state = tg_user.state or {}
-        cart = state.get("cart") or []
+        cart = conversation.cart or []
         if not cart:
-            telegram.send_message(chat_id=str(chat_id), text="سبد خرید خالی است.")
-            return HttpResponse(status=status.HTTP_200_OK)
-        product_ids = [item.get("product_id") for item in cart]
-        products = Product.objects.filter(id__in=product_ids)
+            return telegram.CallbackNotice("سبد خرید خالی است.", alert=True)
+        if not conversation.vendor_id:
+            return telegram.CallbackNotice("ابتدا آدرس تحویل را انتخاب کنید.", alert=True)
+        try:
+            quote = price_cart(conversation.vendor_id, cart, delivery_fee=conversation.delivery_fee, cached=True)
+        except PricingError as exc:
+            return telegram.CallbackNotice(str(exc), alert=True)
         lines = []
-        total = state.get("delivery_fee") or 0
-        for item in cart:
-            prod = next((p for p in products if str(p.id) == str(item.get("product_id"))), None)
-            if not prod:
-                continue
-            qty = int(item.get("quantity") or 1)
-            modifier_unit_total = item.get("modifier_unit_total") or 0
-            line = (prod.base_price + modifier_unit_total) * qty
-            total += line
-            lines.append(f"{prod.name_fa} × {qty} = {line:,}")
-            modifiers = item.get("modifiers") or []
-            for group in modifiers:
+        for line in quote["lines"]:
+            lines.append(f"{line['title']} × {line['quantity']} = {line['line_total']:,}")
+            for group in line["modifiers"]:
                 group_items = group.get("items") or []
                 details = []
                 for opt in group_items:
@@ -1069,59 +976,43 @@ def _handle_menu_callback(chat_id, data: str):
                     details.append(f"{opt.get('name')} ×{opt_qty}")
                 if details:
                     lines.append(f"  • {group.get('group_name')}: {', '.join(details)}")
-        lines.append(f"هزینه ارسال: {state.get('delivery_fee') or 0:,}")
-        lines.append(f"جمع کل: {total:,}")
-        lines.append(f"روش ارسال: {'پس‌کرایه' if state.get('delivery_type') == 'OUT_OF_ZONE_SNAPP' else 'پیک داخلی'}")
-        telegram.send_message(
-            chat_id=str(chat_id),
+        lines.append(f"هزینه ارسال: {quote['delivery_fee']:,}")
+        lines.append(f"جمع کل: {quote['total']:,}")
+        lines.append(f"روش ارسال: {'پس‌کرایه' if conversation.delivery_type == 'OUT_OF_ZONE_SNAPP' else 'پیک داخلی'}")
+        return telegram.EditMessage(
             text="\n".join(lines),
-            reply_markup={"inline_keyboard": [[{"text": "ثبت و پرداخت 💳", "callback_data": "cart:checkout"}]]},
+            reply_markup={
+                "inline_keyboard": [
+                    [{"text": "ثبت و پرداخت 💳", "callback_data": "cart:checkout"}],
+                    [{"text": "بازگشت به منو 🍽️", "callback_data": "menu:page:0"}],
+                ]
+            },
         )
-        return HttpResponse(status=status.HTTP_200_OK)
 
     if data == "cart:checkout":
-        state = tg_user.state or {}
-        cart = state.get("cart") or []
-        address_id = state.get("address_id")
-        vendor_id = state.get("vendor_id")
-        delivery_type = state.get("delivery_type")
+        cart = conversation.cart or []
+        address_id = conversation.address_id
+        vendor_id = conversation.vendor_id
+        delivery_type = conversation.delivery_type
         if not cart or not address_id or not vendor_id:
-            telegram.send_message(chat_id=str(chat_id), text="اطلاعات سفارش کامل نیست.")
-            return HttpResponse(status=status.HTTP_200_OK)
+            return telegram.CallbackNotice("اطلاعات سفارش کامل نیست.", alert=True)
         address = Address.objects.filter(id=address_id, user=user).first()
         vendor = Vendor.objects.filter(id=vendor_id).first()
         if not address or not vendor:
-            telegram.send_message(chat_id=str(chat_id), text="آدرس یا فروشنده نامعتبر است.")
-            return HttpResponse(status=status.HTTP_200_OK)
-
-        cart_products = Product.objects.filter(id__in=[item.get("product_id") for item in cart])
-        items_payload = []
-        subtotal = 0
-        for item in cart:
-            prod = next((p for p in cart_products if str(p.id) == str(item.get("product_id"))), None)
-            if not prod:
-                continue
-            qty = int(item.get("quantity") or 1)
-            items_payload.append({"product": prod.id, "quantity": qty, "modifiers": item.get("modifiers")})
-            subtotal += prod.base_price * qty
+            return telegram.CallbackNotice("آدرس یا فروشنده نامعتبر است.", alert=True)
 
         order, payment_url, error = _place_order_from_state(tg_user)
         if error:
-            telegram.send_message(chat_id=str(chat_id), text=error)
-            return HttpResponse(status=status.HTTP_200_OK)
+            return telegram.CallbackNotice(error, alert=True)
 
         summary = f"سفارش شما ثبت شد. کد: {order.short_code}\nمبلغ: {order.total_amount:,}"
         reply_markup = None
         if payment_url:
             summary += f"\nبرای تکمیل سفارش پرداخت کنید."
             reply_markup = {"inline_keyboard": [[{"text": "پرداخت سفارش 💳", "url": payment_url}]]}
-        telegram.send_message(chat_id=str(chat_id), text=summary, reply_markup=reply_markup)
-        _update_state(
-            tg_user,
-            {"cart": []},
-            clear_keys=["pending_address", "awaiting_address_details"],
-        )
-        return HttpResponse(status=status.HTTP_200_OK)
+        conversation.set(cart=[], pending_address=None, awaiting_address_details=False)
+        # پیام سبد با رسید سفارش جایگزین می‌شود تا دکمه ثبت دوباره زده نشود
+        return telegram.EditMessage(text=summary, reply_markup=reply_markup)
 
     telegram.send_message(chat_id=str(chat_id), text="دستور ناشناخته است.")
     return HttpResponse(status=status.HTTP_200_OK)
@@ -1151,13 +1042,13 @@ def _first_error_message(errors):
 
 
 def _place_order_from_state(tg_user: TelegramUser):
-    state = tg_user.state or {}
+    conversation = load_conversation(tg_user)
     user = tg_user.user
 
-    cart = state.get("cart") or []
-    address_id = state.get("address_id")
-    vendor_id = state.get("vendor_id")
-    coords = state.get("coords")
+    cart = conversation.cart or []
+    address_id = conversation.address_id
+    vendor_id = conversation.vendor_id
+    coords = conversation.coords
     if not cart:
         return None, None, "سبد خرید خالی است."
     if not address_id or not vendor_id:
@@ -1175,18 +1066,21 @@ def _place_order_from_state(tg_user: TelegramUser):
     if not is_serviceable or not delivery_type:
         return None, None, "در حال حاضر امکان سرویس‌دهی به این آدرس وجود ندارد."
 
-    if state.get("delivery_type") and state.get("delivery_type") != delivery_type:
+    if conversation.delivery_type and conversation.delivery_type != delivery_type:
         return None, None, "روش ارسال تغییر کرده است. لطفاً دوباره آدرس را انتخاب کنید."
 
     product_ids = [item.get("product_id") for item in cart if item.get("product_id")]
-    products = Product.objects.filter(id__in=product_ids, vendor=vendor, is_active=True, is_available=True, is_available_today=True)
-    items_payload = []
-    for item in cart:
-        prod = next((p for p in products if str(p.id) == str(item.get("product_id"))), None)
-        if not prod:
-            continue
-        qty = int(item.get("quantity") or 1)
-        items_payload.append({"product": prod.id, "quantity": qty, "modifiers": item.get("modifiers")})
+    available_ids = set(
+        Product.objects.filter(
+            id__in=product_ids, vendor=vendor, is_active=True, is_available=True, is_available_today=True
+        ).values_list("id", flat=True)
+    )
+    # قیمت‌گذاری با OrderCreateSerializer (price_cart) انجام می‌شود؛ اینجا فقط اقلام ناموجود کنار می‌روند
+    items_payload = [
+        {"product": int(item["product_id"]), "quantity": int(item.get("quantity") or 1), "modifiers": item.get("modifiers")}
+        for item in cart
+        if item.get("product_id") and int(item["product_id"]) in available_ids
+    ]
 
     if not items_payload:
         return None, None, "هیچ آیتم فعالی در سبد شما نیست."
@@ -1237,19 +1131,33 @@ def _place_order_from_state(tg_user: TelegramUser):
     return order, payment_url, None
 
 
-@csrf_exempt
-@api_view(["POST", "GET"])
-@authentication_classes([])
-@permission_classes([AllowAny])
-def payment_callback(request):
-    redirect_url = _payment_return_url()
-    verification = payments.verify_payment(request)
+def _find_payment_order(track_id: str, order_id: Optional[str]):
+    from orders.models import Order  # local import to avoid circular
+
+    # create_payment پاسخ درگاه (شامل trackId عددی) را در meta["payment"] نگه می‌دارد
+    track_filter = Q(meta__payment__trackId=str(track_id))
+    if str(track_id).isdigit():
+        track_filter |= Q(meta__payment__trackId=int(track_id))
+    order = Order.objects.filter(track_filter).first()
+    if order or not order_id:
+        return order
+    order = Order.objects.filter(meta__payment__order_id=str(order_id)).first()
+    if not order:
+        order = Order.objects.filter(id=str(order_id)).first()
+    if not order:
+        # Fall back to comparing short codes derived from the UUID
+        order = next((o for o in Order.objects.all() if getattr(o, "short_code", "") == str(order_id)), None)
+    return order
+
+
+def _process_payment_callback(track_id: str):
+    """
+    یک بار verify و اعمال نتیجه برای trackId. خروجی: (payload، status_code، قابل کش بودن).
+    """
+    from orders.models import Order  # local import to avoid circular
+
+    verification = payments.verify_track_id(track_id)
     if not verification:
-        payload_source = {}
-        if hasattr(request, "data"):
-            payload_source = request.data or {}
-        payload_source = payload_source or getattr(request, "POST", {}) or getattr(request, "GET", {})
-        track_id = payload_source.get("trackId") or payload_source.get("track_id")
         failure_payload = {
             "status": "verification_failed",
             "order_status": "FAILED",
@@ -1261,19 +1169,11 @@ def payment_callback(request):
             "result": None,
             "message": "",
         }
-        return _redirect_or_json(request, failure_payload, status_code=status.HTTP_400_BAD_REQUEST, redirect_url=redirect_url)
+        return failure_payload, status.HTTP_400_BAD_REQUEST, False
 
     order_id = verification.get("order_id")
     payment_status = verification.get("status")
-    from orders.models import Order  # local import to avoid circular
-    order = None
-    if order_id:
-        order = Order.objects.filter(meta__payment__order_id=str(order_id)).first()
-        if not order:
-            order = Order.objects.filter(id=str(order_id)).first()
-        if not order:
-            # Fall back to comparing short codes derived from the UUID
-            order = next((o for o in Order.objects.all() if getattr(o, "short_code", "") == str(order_id)), None)
+    order = _find_payment_order(track_id, order_id)
     if not order:
         failure_payload = {
             "status": "order_not_found",
@@ -1286,38 +1186,12 @@ def payment_callback(request):
             "result": verification.get("result"),
             "message": verification.get("message"),
         }
-        return _redirect_or_json(request, failure_payload, status_code=status.HTTP_404_NOT_FOUND, redirect_url=redirect_url)
+        return failure_payload, status.HTTP_404_NOT_FOUND, True
 
-    previous_status = order.status
-    previous_payment_status = order.payment_status
-    payment_verified_now = payment_status == "PAID" and previous_payment_status != "PAID"
-    if payment_status == "PAID":
-        order.payment_status = "PAID"
-        if order.status in {"PENDING_PAYMENT", "FAILED"}:
-            order.status = "CONFIRMED"
-    else:
-        # Only downgrade if payment was not previously captured
-        if order.payment_status != "PAID":
-            order.payment_status = "FAILED"
-            if order.status == "PENDING_PAYMENT":
-                order.status = "FAILED"
-    if order.payment_status != previous_payment_status or order.status != previous_status:
-        order.save(update_fields=["payment_status", "status"])
-
-    if previous_status != order.status:
-        from orders.models import OrderStatusHistory
-        from orders.services import handle_order_status_change
-
-        OrderStatusHistory.objects.create(
-            order=order,
-            from_status=previous_status,
-            to_status=order.status,
-            changed_by_type="SYSTEM",
-        )
-        handle_order_status_change(order)
-
-    if payment_verified_now:
-        notify_payment_verified(order)
+    # قفل ردیف: callback و reconciliation هم‌زمان پرداخت را دو بار تایید و اعلان نکنند
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(pk=order.pk)
+        apply_payment_result(order, payment_status)
 
     response_payload = {
         "status": "ok",
@@ -1330,4 +1204,29 @@ def payment_callback(request):
         "result": verification.get("result"),
         "message": verification.get("message"),
     }
-    return _redirect_or_json(request, response_payload, redirect_url=redirect_url)
+    return response_payload, status.HTTP_200_OK, True
+
+
+@csrf_exempt
+@api_view(["POST", "GET"])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def payment_callback(request):
+    redirect_url = _payment_return_url()
+    track_id = payments.extract_track_id(request)
+    if not track_id:
+        failure_payload = {
+            "status": "verification_failed",
+            "order_status": "FAILED",
+            "payment_status": "FAILED",
+            "order_id": "",
+            "order_code": "",
+            "track_id": None,
+            "ref_number": "",
+            "result": None,
+            "message": "",
+        }
+        return _redirect_or_json(request, failure_payload, status_code=status.HTTP_400_BAD_REQUEST, redirect_url=redirect_url)
+
+    payload, status_code = payments.single_flight_callback(track_id, lambda: _process_payment_callback(track_id))
+    return _redirect_or_json(request, payload, status_code=status_code, redirect_url=redirect_url)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from notifications.services import run_workers
+
+
+class Command(BaseCommand):
+    help = (
+        "Send due PENDING notifications in priority order with N workers. Rows are claimed with "
+        "SELECT ... FOR UPDATE SKIP LOCKED, so several workers and processes never send the same notification."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Worker threads in this process.")
+        parser.add_argument("--batch-size", type=int, default=20, help="Notifications claimed per worker round.")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds to sleep when nothing is due.")
+        parser.add_argument("--once", action="store_true", help="Send everything currently due and exit.")
+
+    def handle(self, *args, **options):
+        try:
+            stats = run_workers(
+                workers=options["workers"],
+                batch_size=options["batch_size"],
+                poll_interval=options["poll_interval"],
+                once=options["once"],
+            )
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped.")
+            return
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Sent {stats['SENT']}, retry scheduled {stats['PENDING']}, failed {stats['FAILED']} "
+                f"in {stats['elapsed_ms']} ms."
+            )
+        )
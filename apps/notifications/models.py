@@ -125,11 +125,16 @@ class Notification(models.Model):
     priority = models.PositiveSmallIntegerField(default=5, db_index=True)  # 1=high ... 9=low
     scheduled_for = models.DateTimeField(null=True, blank=True, db_index=True)
 
+    # worker ارسال‌کننده (run_notification_workers) و زمان برداشتن از صف؛ برای بازگرداندن ردیف‌های گیرکرده
+    claimed_by = models.CharField(max_length=64, blank=True, default="")
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
     created_at = models.DateTimeField(default=timezone.now, db_index=True)
     sent_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         indexes = [
+            models.Index(fields=["status", "priority", "created_at"]),
             models.Index(fields=["status", "created_at"]),
             models.Index(fields=["channel", "status"]),
             models.Index(fields=["event_type", "created_at"]),
@@ -0,0 +1,302 @@
+import logging
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from notifications.models import AdminRecipient, Notification, NotificationDelivery
+
+logger = logging.getLogger(__name__)
+
+# ردیف SENDING که بیش از این مدت مانده (worker کرش کرده) به صف برمی‌گردد
+STALE_SENDING_AFTER = timedelta(minutes=10)
+# run_workers هر این چند ثانیه ردیف‌های SENDING مانده را به صف برمی‌گرداند
+REQUEUE_STALE_EVERY_SECONDS = 60
+PLACEHOLDER = re.compile(r"{{\s*(\w+)\s*}}")
+
+Recipient = Dict[str, str]
+
+
+def render(notification: Notification) -> Tuple[str, str]:
+    """
+    (عنوان، متن) اعلان: قالب با {{key}}های context یا در نبود قالب، context["text"].
+    """
+    context = notification.context if isinstance(notification.context, dict) else {}
+    template = notification.template
+    if template is None:
+        return str(context.get("title") or ""), str(context.get("text") or "")
+
+    def substitute(text: str) -> str:
+        return PLACEHOLDER.sub(lambda match: str(context.get(match.group(1), "")), text or "")
+
+    return substitute(template.title), substitute(template.body)
+
+
+def resolve_recipients(notification: Notification, admins: List[AdminRecipient]) -> List[Recipient]:
+    """
+    مقصدهای فنی اعلان بر اساس recipient_type و کانال. context["chat_id"] یا context["phone"]
+    مقصد را صریحاً تعیین می‌کند. برای وندور تنظیمات VendorIntegrationConfig (کش‌شده) اعمال می‌شود.
+    """
+    from integrations.services.telegram import get_vendor_chat_id
+    from integrations.services.vendor_config import get_vendor_config
+
+    context = notification.context if isinstance(notification.context, dict) else {}
+    telegram = notification.channel == "TELEGRAM"
+    explicit = context.get("chat_id") if telegram else context.get("phone")
+    if explicit:
+        return [{"chat_id": str(explicit)} if telegram else {"phone": str(explicit)}]
+
+    if notification.recipient_type == "ADMIN":
+        if telegram:
+            return [{"chat_id": admin.telegram_chat_id} for admin in admins if admin.telegram_chat_id]
+        return [{"phone": admin.phone_number} for admin in admins if admin.phone_number]
+
+    if notification.recipient_type == "VENDOR":
+        vendor = notification.vendor or getattr(notification.order, "vendor", None)
+        if vendor is None:
+            return []
+        config = get_vendor_config(vendor.id, notification.channel)
+        if config.get("enabled") is False:
+            return []
+        if telegram:
+            chat_id = get_vendor_chat_id(vendor)
+            return [{"chat_id": chat_id}] if chat_id else []
+        phone = config.get("phone") or vendor.primary_phone_number
+        return [{"phone": phone}] if phone else []
+
+    if notification.recipient_type == "CUSTOMER":
+        user = notification.user or getattr(notification.order, "user", None)
+        if user is None:
+            return []
+        if telegram:
+            chat_id = getattr(getattr(user, "telegram", None), "telegram_user_id", None)
+            return [{"chat_id": str(chat_id)}] if chat_id else []
+        return [{"phone": user.phone}] if user.phone else []
+    return []
+
+
+def _send_telegram(notification: Notification, recipient: Recipient, title: str, body: str) -> Tuple[bool, str]:
+    from integrations.services import telegram
+
+    text = f"{title}\n{body}" if title else body
+    if telegram.send_message(chat_id=recipient["chat_id"], text=text):
+        return True, ""
+    return False, "telegram send failed"
+
+
+def _send_sms(notification: Notification, recipient: Recipient, title: str, body: str) -> Tuple[bool, str]:
+    from integrations.services import sms
+
+    context = notification.context if isinstance(notification.context, dict) else {}
+    if context.get("body_id"):
+        # پیامک پترنی: پارامترها از context و متن رندرشده فقط برای ثبت در delivery است
+        result = sms.send_pattern_sms(recipient["phone"], int(context["body_id"]), context.get("params") or [])
+        ok = isinstance(result, dict) and result.get("ok", True) and "error" not in result
+        return ok, "" if ok else str(result.get("error") if isinstance(result, dict) else result)[:500]
+    if sms.send_sms(recipient["phone"], body):
+        return True, ""
+    return False, "sms send failed"
+
+
+CHANNEL_SENDERS: Dict[str, Callable[[Notification, Recipient, str, str], Tuple[bool, str]]] = {
+    "TELEGRAM": _send_telegram,
+    "SMS": _send_sms,
+}
+
+
+def requeue_stale_notifications(now=None) -> int:
+    now = now or timezone.now()
+    return Notification.objects.filter(status="SENDING", claimed_at__lt=now - STALE_SENDING_AFTER).update(
+        status="PENDING", claimed_by="", claimed_at=None
+    )
+
+
+def claim_due_notifications(worker_id: str, limit: int = 20, now=None) -> List[Notification]:
+    """
+    اعلان‌های PENDING سررسیده را به ترتیب priority (۱ فوری‌ترین) و زمان ساخت برمی‌دارد.
+    روی PostgreSQL ردیف‌ها با SELECT ... FOR UPDATE SKIP LOCKED قفل می‌شوند تا workerهای هم‌زمان
+    ردیف‌های یکدیگر را رد کنند و منتظر نمانند؛ UPDATE با شرط status و claimed_by تضمین می‌کند
+    که هر ردیف فقط به یک worker برسد (حتی روی پایگاه‌داده بدون قفل ردیفی).
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Notification.objects.select_for_update(skip_locked=True)
+            .filter(status="PENDING")
+            .filter(Q(scheduled_for__isnull=True) | Q(scheduled_for__lte=now))
+            .order_by("priority", "created_at", "id")
+            .values_list("id", flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        Notification.objects.filter(id__in=ids, status="PENDING").update(
+            status="SENDING", claimed_by=worker_id, claimed_at=now
+        )
+    return list(
+        Notification.objects.filter(id__in=ids, status="SENDING", claimed_by=worker_id)
+        .select_related("template", "vendor", "user__telegram", "order__vendor", "order__user__telegram")
+        .annotate(last_attempt=Max("deliveries__attempt_no"))
+        .order_by("priority", "created_at", "id")
+    )
+
+
+def deliver_notification(notification: Notification, admins: List[AdminRecipient]) -> str:
+    """
+    ارسال یک اعلان claim‌شده از کانال آن؛ هر تلاش یک NotificationDelivery برای هر گیرنده دارد.
+    تلاش ناموفق تا NOTIFICATION_MAX_ATTEMPTS با scheduled_for عقب‌افتاده (backoff نمایی) به صف
+    برمی‌گردد؛ خروجی وضعیت جدید اعلان است. در تلاش دوباره گیرنده‌هایی که قبلاً delivery موفق
+    دارند (مثلاً بخشی از ادمین‌ها) دوباره پیام نمی‌گیرند.
+    """
+    attempt_no = (getattr(notification, "last_attempt", None) or 0) + 1
+    max_attempts = getattr(settings, "NOTIFICATION_MAX_ATTEMPTS", 3)
+    title, body = render(notification)
+    recipients = resolve_recipients(notification, admins)
+    sender = CHANNEL_SENDERS.get(notification.channel)
+
+    already_sent = False
+    if attempt_no > 1 and recipients:
+        sent = set(
+            NotificationDelivery.objects.filter(notification=notification, status="SENT").values_list(
+                "to_telegram_chat_id", "to_phone_number"
+            )
+        )
+        pending = [
+            recipient for recipient in recipients
+            if (recipient.get("chat_id", ""), recipient.get("phone", "")) not in sent
+        ]
+        already_sent = bool(sent) and not pending
+        recipients = pending
+
+    deliveries: List[NotificationDelivery] = []
+    if sender is None or (not recipients and not already_sent):
+        error = f"channel {notification.channel} not supported" if sender is None else "no recipient"
+        deliveries.append(
+            NotificationDelivery(
+                notification=notification, status="FAILED", attempt_no=attempt_no, max_attempts=max_attempts,
+                rendered_title=title[:160], rendered_body=body, error_message=error,
+            )
+        )
+        retryable = False
+    else:
+        for recipient in recipients:
+            try:
+                ok, error = sender(notification, recipient, title, body)
+            except Exception as exc:
+                logger.exception("Notification %s to %s failed", notification.id, recipient)
+                ok, error = False, str(exc)[:500] or exc.__class__.__name__
+            deliveries.append(
+                NotificationDelivery(
+                    notification=notification,
+                    to_telegram_chat_id=recipient.get("chat_id", ""),
+                    to_phone_number=recipient.get("phone", ""),
+                    rendered_title=title[:160],
+                    rendered_body=body,
+                    status="SENT" if ok else "FAILED",
+                    attempt_no=attempt_no,
+                    max_attempts=max_attempts,
+                    error_message=error,
+                    sent_at=timezone.now() if ok else None,
+                )
+            )
+        retryable = True
+
+    now = timezone.now()
+    NotificationDelivery.objects.bulk_create(deliveries)
+    if all(delivery.status == "SENT" for delivery in deliveries):
+        status, fields = "SENT", {"sent_at": now}
+    elif retryable and attempt_no < max_attempts:
+        delay = getattr(settings, "NOTIFICATION_RETRY_SECONDS", 30) * (2 ** (attempt_no - 1))
+        status, fields = "PENDING", {"scheduled_for": now + timedelta(seconds=delay)}
+    else:
+        status, fields = "FAILED", {}
+    # فقط اگر هنوز در اختیار همین worker است (requeue نشده باشد)
+    Notification.objects.filter(pk=notification.pk, status="SENDING", claimed_by=notification.claimed_by).update(
+        status=status, claimed_by="", claimed_at=None, **fields
+    )
+    return status
+
+
+class NotificationWorker:
+    """
+    یک worker: claim یک batch، ارسال ترتیبی و تکرار تا خالی شدن صف. workerها مستقل‌اند و فقط
+    از طریق SKIP LOCKED با هم هماهنگ می‌شوند، پس توان عملیاتی با تعداد آن‌ها بالا می‌رود.
+    """
+
+    def __init__(self, batch_size: int = 20):
+        self.worker_id = uuid.uuid4().hex
+        self.batch_size = batch_size
+        self.stats = {"SENT": 0, "PENDING": 0, "FAILED": 0}
+
+    def run_once(self) -> int:
+        notifications = claim_due_notifications(self.worker_id, limit=self.batch_size)
+        if not notifications:
+            return 0
+        admins = []
+        if any(notification.recipient_type == "ADMIN" for notification in notifications):
+            admins = list(AdminRecipient.objects.filter(is_active=True).order_by("id"))
+        for notification in notifications:
+            self.stats[deliver_notification(notification, admins)] += 1
+        return len(notifications)
+
+
+def run_workers(
+    workers: int = 4,
+    batch_size: int = 20,
+    poll_interval: float = 1.0,
+    once: bool = False,
+    stop: Optional[threading.Event] = None,
+) -> Dict[str, int]:
+    """
+    اجرای workers worker در thread جدا (ارسال‌ها I/O هستند). once=True تا خالی شدن صف
+    سررسیده اجرا می‌شود. برای مقیاس بیشتر چند پروسه run_notification_workers هم‌زمان امن است.
+    thread اصلی هر REQUEUE_STALE_EVERY_SECONDS ردیف‌های مانده از workerهای کرش‌کرده را برمی‌گرداند.
+    """
+    requeue_stale_notifications()
+    stop = stop or threading.Event()
+    pool = [NotificationWorker(batch_size=batch_size) for _ in range(max(1, workers))]
+
+    def loop(worker: NotificationWorker) -> None:
+        try:
+            while not stop.is_set():
+                try:
+                    claimed = worker.run_once()
+                except Exception:
+                    logger.exception("Notification worker %s failed", worker.worker_id)
+                    claimed = 0
+                if not claimed:
+                    if once:
+                        return
+                    stop.wait(poll_interval)
+        finally:
+            close_old_connections()
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=len(pool), thread_name_prefix="notification-worker") as executor:
+        try:
+            futures = [executor.submit(loop, worker) for worker in pool]
+            while True:
+                done, running = wait(futures, timeout=REQUEUE_STALE_EVERY_SECONDS, return_when=FIRST_EXCEPTION)
+                for future in done:
+                    future.result()
+                if not running:
+                    break
+                try:
+                    requeue_stale_notifications()
+                except Exception:
+                    logger.exception("Requeueing stale notifications failed")
+                finally:
+                    close_old_connections()
+        except KeyboardInterrupt:
+            stop.set()
+            raise
+    totals = {status: sum(worker.stats[status] for worker in pool) for status in ("SENT", "PENDING", "FAILED")}
+    totals["elapsed_ms"] = int((time.monotonic() - started) * 1000)
+    return totals
@@ -1,3 +1,88 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from notifications.models import AdminRecipient, Notification, NotificationDelivery, NotificationTemplate
+from notifications.services import claim_due_notifications, deliver_notification, run_workers
+
+
+def _notification(**fields):
+    defaults = {
+        "event_type": "ORDER_CREATED",
+        "recipient_type": "CUSTOMER",
+        "channel": "TELEGRAM",
+        "context": {"chat_id": "42", "text": "hi"},
+    }
+    return Notification.objects.create(**{**defaults, **fields})
+
+
+class NotificationClaimTests(TestCase):
+    def test_claims_due_rows_by_priority_and_never_twice(self):
+        low = _notification(priority=9)
+        high = _notification(priority=1)
+        _notification(priority=1, scheduled_for=timezone.now() + timedelta(hours=1))
+
+        first = claim_due_notifications("worker-a", limit=1)
+        second = claim_due_notifications("worker-b", limit=5)
+
+        self.assertEqual([n.id for n in first], [high.id])
+        self.assertEqual([n.id for n in second], [low.id])
+        self.assertEqual(claim_due_notifications("worker-c", limit=5), [])
+        self.assertEqual(Notification.objects.get(pk=high.pk).claimed_by, "worker-a")
+
+    @override_settings(TELEGRAM_BOT_TOKEN="t", NOTIFICATION_MAX_ATTEMPTS=3)
+    @patch("integrations.services.telegram.send_message")
+    def test_retry_skips_recipients_already_sent(self, send_message):
+        admins = [
+            AdminRecipient.objects.create(name="a", telegram_chat_id="1"),
+            AdminRecipient.objects.create(name="b", telegram_chat_id="2"),
+        ]
+        notification = _notification(recipient_type="ADMIN", context={"text": "hi"})
+        send_message.side_effect = lambda chat_id, text: chat_id == "1"
+
+        first = deliver_notification(claim_due_notifications("w", now=timezone.now())[0], admins)
+        send_message.side_effect = lambda chat_id, text: True
+        second = deliver_notification(claim_due_notifications("w", now=timezone.now() + timedelta(hours=1))[0], admins)
+
+        self.assertEqual((first, second), ("PENDING", "SENT"))
+        self.assertEqual([call.kwargs["chat_id"] for call in send_message.call_args_list], ["1", "2", "2"])
+        self.assertEqual(notification.deliveries.filter(status="SENT").count(), 2)
+
+
+@override_settings(TELEGRAM_BOT_TOKEN="t", NOTIFICATION_MAX_ATTEMPTS=2, NOTIFICATION_RETRY_SECONDS=0)
+class NotificationWorkerTests(TransactionTestCase):
+    @skipUnless(connection.features.has_select_for_update_skip_locked, "needs SELECT ... FOR UPDATE SKIP LOCKED")
+    @patch("integrations.services.telegram.send_message", return_value=True)
+    def test_workers_send_each_notification_once_with_rendered_template(self, send_message):
+        template = NotificationTemplate.objects.create(
+            code="ORDER_CREATED_CUSTOMER", channel="TELEGRAM", body="سفارش {{ code }} ثبت شد"
+        )
+        notifications = [
+            _notification(template=template, context={"chat_id": str(100 + i), "code": f"A{i}"}) for i in range(12)
+        ]
+
+        stats = run_workers(workers=3, batch_size=2, once=True)
+
+        self.assertEqual(stats["SENT"], 12)
+        self.assertEqual(send_message.call_count, 12)
+        self.assertEqual(len({call.kwargs["chat_id"] for call in send_message.call_args_list}), 12)
+        self.assertEqual(Notification.objects.filter(status="SENT").count(), 12)
+        delivery = NotificationDelivery.objects.get(notification=notifications[0])
+        self.assertEqual((delivery.rendered_body, delivery.to_telegram_chat_id), ("سفارش A0 ثبت شد", "100"))
+
+    @patch("integrations.services.telegram.send_message", return_value=False)
+    def test_failed_attempts_are_rescheduled_then_marked_failed(self, send_message):
+        notification = _notification()
+
+        run_workers(workers=1, once=True)
+
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, "FAILED")
+        self.assertEqual(
+            list(notification.deliveries.order_by("attempt_no").values_list("attempt_no", "status")),
+            [(1, "FAILED"), (2, "FAILED")],
+        )
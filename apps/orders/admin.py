@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Order, OrderItem, OrderDelivery, OrderStatusHistory
+from .models import Order, OrderItem, OrderDelivery, OrderStatusHistory, UserProductStat, VendorProductPopularity
 
 
 class OrderItemInline(admin.TabularInline):
@@ -51,3 +51,15 @@ class OrderStatusHistoryAdmin(admin.ModelAdmin):
     list_filter = ("to_status", "changed_by_type", "created_at")
     search_fields = ("order__id", "reason")
 
+
+
+@admin.register(UserProductStat)
+class UserProductStatAdmin(admin.ModelAdmin):
+    list_display = ("user", "product", "order_count", "quantity_total", "last_ordered_at")
+    search_fields = ("user__phone", "product__name_fa")
+
+
+@admin.register(VendorProductPopularity)
+class VendorProductPopularityAdmin(admin.ModelAdmin):
+    list_display = ("vendor", "product", "order_count", "quantity_total", "last_ordered_at")
+    list_filter = ("vendor",)
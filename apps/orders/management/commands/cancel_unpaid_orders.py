@@ -1,14 +1,29 @@
 from datetime import timedelta
 
 from django.core.management.base import BaseCommand
+from django.db.models import Q
 from django.utils import timezone
 
 from orders.models import Order, OrderStatusHistory
+from orders.reconciliation import reconcile_pending_payments
 from orders.services import handle_order_status_change
 
 
 class Command(BaseCommand):
-    help = "Cancel unpaid orders that have been pending payment for more than 10 minutes."
+    help = (
+        "Cancel unpaid orders that have been pending payment for more than 10 minutes, "
+        "after checking the gateway so paid orders with a lost callback are confirmed instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Orders per gateway inquiry batch.")
+        parser.add_argument("--concurrency", type=int, default=None, help="Parallel gateway inquiries.")
+        parser.add_argument("--max-seconds", type=float, default=None, help="Time budget for the reconciliation.")
+        parser.add_argument(
+            "--skip-reconcile",
+            action="store_true",
+            help="Do not ask the gateway; only orders without a track id are cancelled.",
+        )
 
     def handle(self, *args, **options):
         threshold = timezone.now() - timedelta(minutes=10)
@@ -16,13 +31,34 @@ class Command(BaseCommand):
             status="PENDING_PAYMENT", payment_status="UNPAID", placed_at__lte=threshold
         )
 
+        # سفارش بدون trackId هرگز به درگاه نرفته و لغوش امن است؛ بقیه فقط اگر درگاه پرداخت‌نشده بگوید
+        safe_to_cancel = Q(meta__payment__trackId__isnull=True)
+        if not options["skip_reconcile"]:
+            report = reconcile_pending_payments(
+                older_than=timedelta(minutes=10),
+                batch_size=options["batch_size"],
+                concurrency=options["concurrency"],
+                max_seconds=options["max_seconds"],
+            )
+            safe_to_cancel |= Q(id__in=report["unpaid_ids"])
+            self.stdout.write(
+                f"Reconciled {report['checked']} order(s) in {report['batches']} batch(es) of {report['batch_size']} "
+                f"with concurrency {report['concurrency']} in {report['elapsed_s']}s: paid {report['paid']}, "
+                f"unpaid {report['unpaid']} (rejected by gateway {report['rejected']}), waiting {report['waiting']}, errors {report['errors']}"
+                + (" (time budget exhausted)" if report["budget_exhausted"] else "")
+            )
+
         cancelled_count = 0
-        for order in candidates:
+        for order in candidates.filter(safe_to_cancel):
             previous_status = order.status
-            order.status = "CANCELLED"
-            order.payment_status = "FAILED"
-            order.cancelled_at = timezone.now()
-            order.save(update_fields=["status", "payment_status", "cancelled_at"])
+            cancelled_at = timezone.now()
+            # UPDATE شرطی: اگر callback پرداخت در این فاصله سفارش را PAID کرده باشد، لغو نمی‌شود
+            updated = Order.objects.filter(pk=order.pk, status="PENDING_PAYMENT", payment_status="UNPAID").update(
+                status="CANCELLED", payment_status="FAILED", cancelled_at=cancelled_at
+            )
+            if not updated:
+                continue
+            order.status, order.payment_status, order.cancelled_at = "CANCELLED", "FAILED", cancelled_at
 
             OrderStatusHistory.objects.create(
                 order=order,
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from orders.services import rebuild_product_popularity
+
+
+class Command(BaseCommand):
+    help = "Rebuild per-user product stats and per-vendor product popularity from order history."
+
+    def handle(self, *args, **options):
+        user_rows, vendor_rows = rebuild_product_popularity()
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt {user_rows} user product stat(s) and {vendor_rows} vendor popularity row(s).")
+        )
@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from orders.reconciliation import reconcile_pending_payments
+
+
+class Command(BaseCommand):
+    help = (
+        "Ask the payment gateway about pending-payment orders with a track id and confirm the paid ones "
+        "(for callbacks that never arrived). Does not cancel anything."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=int, default=2, help="Only orders placed at least N minutes ago.")
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--concurrency", type=int, default=None)
+        parser.add_argument("--max-seconds", type=float, default=None)
+
+    def handle(self, *args, **options):
+        report = reconcile_pending_payments(
+            older_than=timedelta(minutes=options["older_than"]),
+            batch_size=options["batch_size"],
+            concurrency=options["concurrency"],
+            max_seconds=options["max_seconds"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Checked {report['checked']} order(s) in {report['batches']} batch(es) "
+                f"(batch size {report['batch_size']}, concurrency {report['concurrency']}) in {report['elapsed_s']}s: "
+                f"paid {report['paid']}, unpaid {report['unpaid']}, waiting {report['waiting']}, "
+                f"errors {report['errors']}" + ("; time budget exhausted" if report["budget_exhausted"] else "")
+            )
+        )
@@ -0,0 +1,67 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0002_telegramuser_state"),
+        ("catalog", "0002_productimage_media_asset"),
+        ("vendors", "0001_initial"),
+        ("orders", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserProductStat",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("order_count", models.PositiveIntegerField(default=0)),
+                ("quantity_total", models.PositiveIntegerField(default=0)),
+                ("last_ordered_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="user_stats", to="catalog.product"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="product_stats", to="accounts.user"
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["user", "-last_ordered_at"], name="orders_user_user_id_1694fa_idx")],
+                "constraints": [models.UniqueConstraint(fields=("user", "product"), name="uniq_user_product_stat")],
+            },
+        ),
+        migrations.CreateModel(
+            name="VendorProductPopularity",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("order_count", models.PositiveIntegerField(default=0)),
+                ("quantity_total", models.PositiveIntegerField(default=0)),
+                ("last_ordered_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="popularity", to="catalog.product"
+                    ),
+                ),
+                (
+                    "vendor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="product_popularity",
+                        to="vendors.vendor",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["vendor", "-order_count"], name="orders_vend_vendor__eb9a52_idx")],
+            },
+        ),
+    ]
@@ -222,3 +222,50 @@ class OrderStatusHistory(models.Model):
 
     def __str__(self):
         return f"{self.order_id}: {self.from_status}->{self.to_status}"
+
+
+class UserProductStat(models.Model):
+    """
+    جدول ازپیش‌محاسبه‌شده «محصولات اخیر و پرتکرار» هر کاربر.
+    با رسیدن سفارش به PLACED/CONFIRMED/DELIVERED یک بار (برای هر سفارش) افزایشی به‌روز می‌شود.
+    """
+
+    user = models.ForeignKey("accounts.User", on_delete=models.CASCADE, related_name="product_stats")
+    product = models.ForeignKey("catalog.Product", on_delete=models.CASCADE, related_name="user_stats")
+
+    order_count = models.PositiveIntegerField(default=0)
+    quantity_total = models.PositiveIntegerField(default=0)
+    last_ordered_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "product"], name="uniq_user_product_stat"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "-last_ordered_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}:{self.product_id} x{self.order_count}"
+
+
+class VendorProductPopularity(models.Model):
+    """
+    رتبه محبوبیت محصولات هر وندور (برای مرتب‌سازی منو و کیبورد تلگرام).
+    هر محصول فقط یک وندور دارد، پس یک ردیف به ازای هر محصول کافی است.
+    """
+
+    vendor = models.ForeignKey("vendors.Vendor", on_delete=models.CASCADE, related_name="product_popularity")
+    product = models.OneToOneField("catalog.Product", on_delete=models.CASCADE, related_name="popularity")
+
+    order_count = models.PositiveIntegerField(default=0)
+    quantity_total = models.PositiveIntegerField(default=0)
+    last_ordered_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["vendor", "-order_count"]),
+        ]
+
+    def __str__(self):
+        return f"{self.vendor_id}:{self.product_id} x{self.order_count}"
@@ -1,19 +1,29 @@
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from catalog.models import Product
+from django.db.models import Prefetch
+
+from catalog.models import OptionItem, Product, ProductOptionGroup
 
 
 NO_OPTION_ITEM_NAMES = {"بدون سس", "بدون نوشیدنی", "بدون نوشابه"}
 
 
-def build_option_group_payload(product: Product) -> List[dict]:
+def build_option_group_payloads(product_ids: Iterable[int]) -> Dict[int, List[dict]]:
+    """
+    گروه‌های گزینه چند محصول با دو کوئری (اتصال‌ها + آیتم‌های فعال)، به تفکیک product_id.
+    """
+    product_ids = list(product_ids)
+    payloads: Dict[int, List[dict]] = {product_id: [] for product_id in product_ids}
+    if not product_ids:
+        return payloads
     links = (
-        product.product_option_groups.filter(is_active=True, group__is_active=True)
+        ProductOptionGroup.objects.filter(product_id__in=product_ids, is_active=True, group__is_active=True)
         .select_related("group")
-        .prefetch_related("group__items")
+        .prefetch_related(
+            Prefetch("group__items", queryset=OptionItem.objects.filter(is_active=True).order_by("sort_order", "id"))
+        )
         .order_by("sort_order", "group__sort_order", "id")
     )
-    payload = []
     for link in links:
         group = link.group
         items = [
@@ -24,9 +34,9 @@ def build_option_group_payload(product: Product) -> List[dict]:
                 "price_delta_amount": item.price_delta_amount,
                 "sort_order": item.sort_order,
             }
-            for item in group.items.filter(is_active=True).order_by("sort_order", "id")
+            for item in group.items.all()
         ]
-        payload.append(
+        payloads[link.product_id].append(
             {
                 "id": group.id,
                 "name": group.name,
@@ -38,16 +48,27 @@ def build_option_group_payload(product: Product) -> List[dict]:
                 "items": items,
             }
         )
-    return payload
+    return payloads
+
+
+def build_option_group_payload(product: Product) -> List[dict]:
+    return build_option_group_payloads([product.id])[product.id]
 
 
-def normalize_modifiers(product: Product, modifiers_payload) -> Tuple[List[dict], int]:
+def normalize_modifiers(
+    product: Product, modifiers_payload, option_groups: Optional[List[dict]] = None
+) -> Tuple[List[dict], int]:
+    """
+    اعتبارسنجی و نرمال‌سازی سفارشی‌سازی‌های یک قلم. option_groups (از build_option_group_payloads)
+    اگر داده شود کوئری جدیدی زده نمی‌شود.
+    """
     if modifiers_payload in (None, ""):
         modifiers_payload = []
     if not isinstance(modifiers_payload, list):
         raise ValueError("فرمت سفارشی‌سازی‌ها نامعتبر است.")
 
-    option_groups = build_option_group_payload(product)
+    if option_groups is None:
+        option_groups = build_option_group_payload(product)
     group_config: Dict[int, dict] = {group["id"]: group for group in option_groups}
 
     normalized: List[dict] = []
@@ -0,0 +1,164 @@
+import hashlib
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.core.cache import cache
+
+from catalog.models import Product
+from catalog.services import get_catalog_version
+from orders.modifiers import build_option_group_payloads, normalize_modifiers
+
+CART_PRICE_KEY = "pricing:cart:{vendor_id}:{version}:{cart_hash}"
+CART_PRICE_TTL = 15 * 60
+
+
+class PricingError(ValueError):
+    """
+    خطای قیمت‌گذاری سبد (آیتم نامعتبر، گزینه نامعتبر، فروشنده ناهمخوان) با پیام قابل نمایش به کاربر.
+    """
+
+
+def _line_product_id(line: Dict[str, Any]) -> Optional[int]:
+    product = line.get("product", line.get("product_id"))
+    product = getattr(product, "pk", product)
+    try:
+        return int(product)
+    except (TypeError, ValueError):
+        return None
+
+
+def _canonical_modifiers(modifiers) -> Any:
+    """
+    فقط شناسه گروه/آیتم و تعداد در هش سبد می‌آیند؛ نام و قیمت ذخیره‌شده در سبد نادیده گرفته می‌شود.
+    """
+    if not isinstance(modifiers, list):
+        return modifiers
+    canonical = []
+    for group in modifiers:
+        if not isinstance(group, dict):
+            return modifiers
+        items = [
+            [item.get("id") or item.get("item_id") or item.get("item"), int(item.get("quantity") or 1)]
+            if isinstance(item, dict)
+            else item
+            for item in (group.get("items") or [])
+        ]
+        canonical.append([group.get("group_id") or group.get("group"), items])
+    return canonical
+
+
+def cart_hash(lines: List[Dict[str, Any]]) -> str:
+    canonical = [
+        [_line_product_id(line), int(line.get("quantity") or 1), _canonical_modifiers(line.get("modifiers"))]
+        for line in lines
+    ]
+    raw = json.dumps(canonical, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def _price_lines(vendor_id: int, lines: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    قیمت اقلام با یک کوئری محصولات و دو کوئری گروه‌های گزینه برای کل سبد.
+    """
+    product_ids = {_line_product_id(line) for line in lines}
+    if None in product_ids:
+        raise PricingError("آیتم سبد نامعتبر است.")
+    products = {product.id: product for product in Product.objects.filter(id__in=product_ids, is_active=True)}
+    option_groups = build_option_group_payloads(products.keys())
+
+    priced: List[Dict[str, Any]] = []
+    subtotal = 0
+    for line in lines:
+        product = products.get(_line_product_id(line))
+        if product is None:
+            raise PricingError("یکی از آیتم‌های سبد در دسترس نیست.")
+        if vendor_id is not None and product.vendor_id != int(vendor_id):
+            raise PricingError("تمام اقلام سفارش باید از یک فروشنده باشند.")
+        quantity = int(line.get("quantity") or 1)
+        if quantity < 1:
+            raise PricingError("تعداد آیتم معتبر نیست.")
+        try:
+            modifiers, modifier_unit_total = normalize_modifiers(
+                product, line.get("modifiers"), option_groups=option_groups[product.id]
+            )
+        except ValueError as exc:
+            raise PricingError(str(exc)) from exc
+
+        unit_price = product.base_price + modifier_unit_total
+        line_total = unit_price * quantity
+        subtotal += line_total
+        priced.append(
+            {
+                "product_id": product.id,
+                "title": product.name_fa,
+                "quantity": quantity,
+                "base_price": product.base_price,
+                "modifiers": modifiers,
+                "modifier_unit_total": modifier_unit_total,
+                "unit_price": unit_price,
+                "line_total": line_total,
+            }
+        )
+    return {"lines": priced, "subtotal": subtotal}
+
+
+def with_fees(
+    priced: Dict[str, Any],
+    delivery_fee: int = 0,
+    discount: int = 0,
+    service_fee: int = 0,
+) -> Dict[str, Any]:
+    """
+    اعمال هزینه‌ها و تخفیف روی خروجی price_cart بدون قیمت‌گذاری دوباره اقلام.
+    """
+    delivery_fee = int(delivery_fee or 0)
+    discount = int(discount or 0)
+    service_fee = int(service_fee or 0)
+    return {
+        **priced,
+        "delivery_fee": delivery_fee,
+        "discount": discount,
+        "service_fee": service_fee,
+        "total": priced["subtotal"] - discount + delivery_fee + service_fee,
+    }
+
+
+def price_cart(
+    vendor_id: int,
+    lines: Iterable[Dict[str, Any]],
+    delivery_fee: int = 0,
+    discount: int = 0,
+    service_fee: int = 0,
+    cached: bool = False,
+) -> Dict[str, Any]:
+    """
+    موتور مشترک قیمت‌گذاری سبد (ربات، checkout، quote وب و ثبت سفارش).
+    lines: [{"product"|"product_id", "quantity", "modifiers"}]. پیش‌فرض همیشه از پایگاه‌داده
+    قیمت می‌گذارد (ثبت سفارش و مبلغ پرداخت). cached=True فقط برای نمایش (quote وب، بازبینی سبد
+    در ربات) است: قیمت اقلام با کلید (وندور، نسخه کاتالوگ، هش سبد) کش می‌شود.
+    """
+    lines = list(lines)
+    if not lines:
+        raise PricingError("سبد خرید خالی است.")
+    version = None
+    if cached:
+        version = get_catalog_version(vendor_id)
+        key = CART_PRICE_KEY.format(vendor_id=vendor_id, version=version, cart_hash=cart_hash(lines))
+        priced = cache.get(key)
+        if priced is None:
+            priced = _price_lines(vendor_id, lines)
+            cache.set(key, priced, CART_PRICE_TTL)
+    else:
+        priced = _price_lines(vendor_id, lines)
+
+    return with_fees(
+        {
+            "vendor_id": int(vendor_id),
+            "catalog_version": version,
+            "lines": priced["lines"],
+            "subtotal": priced["subtotal"],
+        },
+        delivery_fee=delivery_fee,
+        discount=discount,
+        service_fee=service_fee,
+    )
@@ -0,0 +1,158 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from integrations.services import http_client, payments
+from orders.models import Order
+from orders.services import apply_payment_result
+
+logger = logging.getLogger(__name__)
+
+# وضعیت استعلام زیبال
+ZIBAL_PAID_VERIFIED = 1
+ZIBAL_PAID_UNVERIFIED = 2
+ZIBAL_WAITING = -1
+ZIBAL_OK_RESULTS = {100}
+# پاسخ قطعی درگاه برای خود تراکنش: 202 پرداخت‌نشده/ناموفق، 203 trackId نامعتبر.
+# خطاهای پذیرنده (102 تا 104) به پیکربندی مربوط‌اند و ERROR می‌مانند تا همه سفارش‌ها لغو نشوند.
+ZIBAL_UNPAID_RESULTS = {202, 203}
+ZIBAL_VERIFY_OK_RESULTS = {100, 101}
+
+
+def order_track_id(order: Order) -> Optional[str]:
+    payment = (order.meta or {}).get("payment") if isinstance(order.meta, dict) else None
+    track_id = payment.get("trackId") if isinstance(payment, dict) else None
+    return str(track_id) if track_id else None
+
+
+def check_payment(track_id: str) -> Dict[str, Any]:
+    """
+    وضعیت قطعی یک trackId: PAID، UNPAID، WAITING (هنوز در درگاه) یا ERROR (استعلام ناموفق).
+    result غیر 100 که درباره خود تراکنش قطعی است (ZIBAL_UNPAID_RESULTS) UNPAID با rejected=True است.
+    تراکنش پرداخت‌شده‌ای که تایید نشده همین‌جا verify می‌شود تا پول برگشت نخورد.
+    فقط HTTP است و به دیتابیس دست نمی‌زند (اجرا در thread pool).
+    """
+    inquiry = payments.inquire_payment(track_id)
+    if inquiry and inquiry.get("result") in ZIBAL_UNPAID_RESULTS:
+        return {"track_id": track_id, "state": "UNPAID", "inquiry": inquiry, "rejected": True}
+    if not inquiry or inquiry.get("result") not in ZIBAL_OK_RESULTS:
+        return {"track_id": track_id, "state": "ERROR", "inquiry": inquiry}
+    gateway_status = inquiry.get("status")
+    if gateway_status == ZIBAL_PAID_VERIFIED:
+        return {"track_id": track_id, "state": "PAID", "inquiry": inquiry}
+    if gateway_status == ZIBAL_PAID_UNVERIFIED:
+        verification = payments.verify_track_id(track_id)
+        if verification and verification.get("result") in ZIBAL_VERIFY_OK_RESULTS:
+            return {"track_id": track_id, "state": "PAID", "inquiry": inquiry, "verification": verification}
+        return {"track_id": track_id, "state": "ERROR", "inquiry": inquiry, "verification": verification}
+    if gateway_status == ZIBAL_WAITING:
+        return {"track_id": track_id, "state": "WAITING", "inquiry": inquiry}
+    return {"track_id": track_id, "state": "UNPAID", "inquiry": inquiry}
+
+
+def pending_payment_orders(older_than: timedelta):
+    return (
+        Order.objects.filter(
+            status="PENDING_PAYMENT",
+            payment_status="UNPAID",
+            placed_at__lte=timezone.now() - older_than,
+        )
+        .exclude(meta__payment__trackId__isnull=True)
+        .order_by("placed_at", "id")
+    )
+
+
+def _confirm_paid(order_id) -> bool:
+    # قفل ردیف تا callback هم‌زمان درگاه همین سفارش را دوباره تایید و اعلان نکند
+    with transaction.atomic():
+        order = Order.objects.select_for_update().filter(pk=order_id).first()
+        if order is None or order.payment_status == "PAID":
+            return False
+        return apply_payment_result(order, "PAID")
+
+
+def reconcile_pending_payments(
+    older_than: Optional[timedelta] = None,
+    batch_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    max_seconds: Optional[float] = None,
+    waiting_grace: Optional[timedelta] = None,
+) -> Dict[str, Any]:
+    """
+    استعلام سفارش‌های PENDING_PAYMENT دارای trackId در batchهای هم‌زمان و تایید پرداخت‌شده‌ها
+    از مسیر عادی (apply_payment_result). خروجی unpaid_ids فقط سفارش‌هایی است که درگاه قطعاً
+    پرداخت‌نشده گزارش کرده (یا بیش از waiting_grace در انتظار مانده‌اند) و لغو آن‌ها امن است.
+    سفارش‌های با خطای استعلام یا خارج از بودجه زمانی این دور دست نمی‌خورند.
+    """
+    older_than = older_than if older_than is not None else timedelta(minutes=2)
+    batch_size = batch_size or getattr(settings, "PAYMENT_RECONCILE_BATCH_SIZE", 50)
+    concurrency = concurrency or getattr(settings, "PAYMENT_RECONCILE_CONCURRENCY", 4)
+    max_seconds = max_seconds if max_seconds is not None else getattr(settings, "PAYMENT_RECONCILE_MAX_SECONDS", 60)
+    waiting_grace = waiting_grace if waiting_grace is not None else timedelta(minutes=30)
+
+    started = time.monotonic()
+    report: Dict[str, Any] = {
+        "batch_size": batch_size,
+        "concurrency": concurrency,
+        "max_seconds": max_seconds,
+        "batches": 0,
+        "checked": 0,
+        "paid": 0,
+        "unpaid": 0,
+        "rejected": 0,
+        "waiting": 0,
+        "errors": 0,
+        "budget_exhausted": False,
+        "unpaid_ids": [],
+    }
+    queryset = pending_payment_orders(older_than)
+    waiting_cutoff = timezone.now() - waiting_grace
+    last = None
+
+    def remaining():
+        # keyset روی (placed_at, id)؛ سفارش‌های تاییدشده خودشان از queryset خارج می‌شوند
+        if last is None:
+            return queryset
+        return queryset.filter(Q(placed_at__gt=last[0]) | Q(placed_at=last[0], id__gt=last[1]))
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        while True:
+            if time.monotonic() - started >= max_seconds:
+                report["budget_exhausted"] = remaining().exists()
+                break
+            batch: List[Order] = list(remaining().only("id", "placed_at", "meta")[:batch_size])
+            if not batch:
+                break
+            last = (batch[-1].placed_at, batch[-1].id)
+            report["batches"] += 1
+
+            check = http_client.pool_task(lambda order: check_payment(order_track_id(order)))
+            results = list(pool.map(check, batch))
+            for order, result in zip(batch, results):
+                report["checked"] += 1
+                state = result["state"]
+                if state == "PAID":
+                    if _confirm_paid(order.id):
+                        report["paid"] += 1
+                elif state == "UNPAID" or (state == "WAITING" and order.placed_at <= waiting_cutoff):
+                    report["unpaid"] += 1
+                    report["unpaid_ids"].append(order.id)
+                    if result.get("rejected"):
+                        # مثلاً trackId نامعتبر؛ جدا شمرده می‌شود تا خطای ساخت تراکنش دیده شود
+                        report["rejected"] += 1
+                        logger.info("Payment for order %s rejected by gateway: %s", order.id, result["inquiry"])
+                elif state == "WAITING":
+                    report["waiting"] += 1
+                else:
+                    report["errors"] += 1
+                    logger.warning("Payment reconciliation for order %s failed: %s", order.id, result)
+
+    report["elapsed_s"] = round(time.monotonic() - started, 3)
+    return report
@@ -1,13 +1,19 @@
 import math
+from collections import defaultdict
 from typing import Optional, Tuple
 
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 
 from addresses.models import Address
 from catalog.models import Product
 from core.models import AppSetting
-from integrations.services import sms, telegram
-from orders.models import Order
+from integrations.services import telegram
+from integrations.services.sms_batch import get_batcher
+from integrations.services.vendor_config import get_vendor_config
+from orders.models import Order, OrderItem, UserProductStat, VendorProductPopularity
 from vendors.models import Vendor, VendorLocation
 
 # وضعیت‌هایی که سفارش را فعال نگه می‌دارند و جلوی ویرایش آدرس را می‌گیرند.
@@ -21,6 +27,11 @@ ACTIVE_ORDER_STATUSES = {
     "OUT_FOR_DELIVERY",
 }
 
+# اولین رسیدن سفارش به یکی از این وضعیت‌ها آمار محبوبیت را به‌روز می‌کند.
+# CONFIRMED لازم است چون سفارش پرداخت‌شده مستقیم از PENDING_PAYMENT به CONFIRMED می‌رود.
+POPULARITY_STATUSES = {"PLACED", "CONFIRMED", "DELIVERED"}
+POPULARITY_META_KEY = "popularity_recorded"
+
 
 ORDER_STATUS_EVENTS = {
     "PENDING_PAYMENT": "ORDER_PENDING_PAYMENT",
@@ -46,34 +57,44 @@ def _order_tracking_reference(order: Order) -> str:
 
 
 def _send_order_creation_sms(order: Order) -> None:
+    """
+    پیامک‌های ثبت سفارش در صف batch می‌روند؛ پیامک‌های فروشنده داخل یک پنجره
+    به یک پیام با فهرست کد سفارش‌ها تبدیل می‌شوند.
+    """
     customer_body_id = getattr(settings, "SMS_CUSTOMER_ORDER_CREATED_BODY_ID", 412520)
     vendor_body_id = getattr(settings, "SMS_VENDOR_ORDER_CREATED_BODY_ID", 412519)
+    batcher = get_batcher()
 
     tracking_reference = _order_tracking_reference(order)
     customer_phone = getattr(order.user, "phone", "") or ""
     if customer_phone:
-        sms.send_pattern_sms(
+        batcher.enqueue(
             mobile=customer_phone,
             body_id=customer_body_id,
             params=[order.short_code, tracking_reference],
         )
 
-    vendor_phone = getattr(order.vendor, "primary_phone_number", "") or ""
+    # شماره و پترن اختصاصی وندور (VendorIntegrationConfig) از کش درون‌پروسه‌ای، بدون کوئری
+    vendor_config = get_vendor_config(order.vendor_id, "SMS")
+    vendor_phone = vendor_config.get("phone") or getattr(order.vendor, "primary_phone_number", "") or ""
     vendor_name = getattr(order.vendor, "name", "") or ""
-    if vendor_phone:
-        sms.send_pattern_sms(
+    if vendor_phone and vendor_config.get("enabled") is not False:
+        batcher.enqueue(
             mobile=vendor_phone,
-            body_id=vendor_body_id,
+            body_id=vendor_config.get("order_created_body_id") or vendor_body_id,
             params=[vendor_name, order.short_code],
+            coalesce_key=f"vendor-order:{order.vendor_id}:{vendor_phone}",
         )
 
 
 def notify_order_created(order: Order) -> None:
+    record_order_popularity(order)
     telegram.dispatch_order_event(order, event="ORDER_CREATED")
     _send_order_creation_sms(order)
 
 
 def handle_order_status_change(order: Order, changed_by_user=None) -> None:
+    record_order_popularity(order)
     event = ORDER_STATUS_EVENTS.get(order.status)
     telegram.dispatch_order_event(order, event=event)
 
@@ -82,6 +103,45 @@ def notify_payment_verified(order: Order) -> None:
     telegram.dispatch_order_event(order, event="ORDER_PAYMENT_VERIFIED")
 
 
+def apply_payment_result(order: Order, payment_status: str) -> bool:
+    """
+    اعمال نتیجه پرداخت (PAID یا ناموفق) روی سفارش با تاریخچه وضعیت و اعلان‌ها؛
+    مسیر مشترک callback درگاه و reconciliation. True یعنی پرداخت همین حالا تایید شد.
+    فراخواننده‌ها ردیف سفارش را با select_for_update قفل می‌کنند؛ اعلان‌ها (تلگرام/پیامک)
+    با on_commit بعد از آزاد شدن قفل ارسال می‌شوند.
+    """
+    from orders.models import OrderStatusHistory
+
+    previous_status = order.status
+    previous_payment_status = order.payment_status
+    payment_verified_now = payment_status == "PAID" and previous_payment_status != "PAID"
+    if payment_status == "PAID":
+        order.payment_status = "PAID"
+        if order.status in {"PENDING_PAYMENT", "FAILED"}:
+            order.status = "CONFIRMED"
+    else:
+        # Only downgrade if payment was not previously captured
+        if order.payment_status != "PAID":
+            order.payment_status = "FAILED"
+            if order.status == "PENDING_PAYMENT":
+                order.status = "FAILED"
+    if order.payment_status != previous_payment_status or order.status != previous_status:
+        order.save(update_fields=["payment_status", "status"])
+
+    if previous_status != order.status:
+        OrderStatusHistory.objects.create(
+            order=order,
+            from_status=previous_status,
+            to_status=order.status,
+            changed_by_type="SYSTEM",
+        )
+        transaction.on_commit(lambda: handle_order_status_change(order))
+
+    if payment_verified_now:
+        transaction.on_commit(lambda: notify_payment_verified(order))
+    return payment_verified_now
+
+
 def _haversine_distance_meters(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
     محاسبه فاصله تقریبی بین دو نقطه جغرافیایی بر حسب متر.
@@ -171,16 +231,123 @@ def pick_nearest_available_vendor(coords: Optional[dict]) -> Optional[Vendor]:
     return chosen
 
 
+def _increment_stat(model, lookup: dict, vendor_id: int, quantity: int, ordered_at) -> None:
+    updated = model.objects.filter(**lookup).update(
+        order_count=F("order_count") + 1,
+        quantity_total=F("quantity_total") + quantity,
+        last_ordered_at=Greatest(F("last_ordered_at"), ordered_at),
+    )
+    if updated:
+        return
+    defaults = {"order_count": 1, "quantity_total": quantity, "last_ordered_at": ordered_at}
+    if model is VendorProductPopularity:
+        defaults["vendor_id"] = vendor_id
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **defaults)
+    except IntegrityError:
+        # ردیف هم‌زمان توسط سفارش دیگری ساخته شده است
+        _increment_stat(model, lookup, vendor_id, quantity, ordered_at)
+
+
+def record_order_popularity(order: Order) -> bool:
+    """
+    به‌روزرسانی افزایشی UserProductStat و VendorProductPopularity برای یک سفارش.
+    هر سفارش فقط یک بار شمرده می‌شود (پرچم popularity_recorded در order.meta).
+    """
+    if order.status not in POPULARITY_STATUSES:
+        return False
+    if (order.meta or {}).get(POPULARITY_META_KEY):
+        return False
+
+    with transaction.atomic():
+        locked = Order.objects.select_for_update().only("id", "meta").get(pk=order.pk)
+        meta = locked.meta or {}
+        if meta.get(POPULARITY_META_KEY):
+            order.meta = meta
+            return False
+
+        quantities = defaultdict(int)
+        for product_id, quantity in order.items.values_list("product_id", "quantity"):
+            quantities[product_id] += quantity or 0
+
+        ordered_at = order.placed_at
+        for product_id, quantity in quantities.items():
+            _increment_stat(UserProductStat, {"user_id": order.user_id, "product_id": product_id}, order.vendor_id, quantity, ordered_at)
+            _increment_stat(VendorProductPopularity, {"product_id": product_id}, order.vendor_id, quantity, ordered_at)
+
+        meta[POPULARITY_META_KEY] = True
+        Order.objects.filter(pk=order.pk).update(meta=meta)
+        order.meta = meta
+    return True
+
+
+def rebuild_product_popularity() -> Tuple[int, int]:
+    """
+    ساخت دوباره جدول‌های محبوبیت از روی تاریخچه سفارش‌ها (برای داده‌های قدیمی یا اصلاح).
+    """
+    counted_statuses = POPULARITY_STATUSES | {"PREPARING", "READY", "OUT_FOR_DELIVERY"}
+    user_rows = {}
+    vendor_rows = {}
+    order_ids = set()
+    items = (
+        OrderItem.objects.filter(order__status__in=counted_statuses)
+        .values_list("order_id", "order__user_id", "order__vendor_id", "order__placed_at", "product_id", "quantity")
+        .iterator()
+    )
+    seen_pairs = set()
+    for order_id, user_id, vendor_id, placed_at, product_id, quantity in items:
+        order_ids.add(order_id)
+        first_in_order = (order_id, product_id) not in seen_pairs
+        seen_pairs.add((order_id, product_id))
+        for rows, key, extra in (
+            (user_rows, (user_id, product_id), {"user_id": user_id}),
+            (vendor_rows, product_id, {"vendor_id": vendor_id}),
+        ):
+            row = rows.setdefault(
+                key,
+                {**extra, "product_id": product_id, "order_count": 0, "quantity_total": 0, "last_ordered_at": placed_at},
+            )
+            row["order_count"] += 1 if first_in_order else 0
+            row["quantity_total"] += quantity or 0
+            row["last_ordered_at"] = max(row["last_ordered_at"], placed_at)
+
+    with transaction.atomic():
+        UserProductStat.objects.all().delete()
+        VendorProductPopularity.objects.all().delete()
+        UserProductStat.objects.bulk_create([UserProductStat(**row) for row in user_rows.values()], batch_size=1000)
+        VendorProductPopularity.objects.bulk_create(
+            [VendorProductPopularity(**row) for row in vendor_rows.values()], batch_size=1000
+        )
+        for order in Order.objects.filter(id__in=order_ids).only("id", "meta").iterator():
+            meta = order.meta or {}
+            if not meta.get(POPULARITY_META_KEY):
+                meta[POPULARITY_META_KEY] = True
+                Order.objects.filter(pk=order.pk).update(meta=meta)
+    return len(user_rows), len(vendor_rows)
+
+
 def suggest_products_for_user(user, limit: int = 4):
     """
     بر اساس سفارش‌های قبلی کاربر، چند محصول محبوب پیشنهاد می‌دهد.
+    از جدول ازپیش‌محاسبه‌شده UserProductStat با یک خواندن ایندکس‌دار.
     """
     if not user or not getattr(user, "is_authenticated", False):
         return []
     product_ids = (
-        Product.objects.filter(order_items__order__user=user)
-        .order_by("-order_items__order__placed_at")
-        .values_list("id", flat=True)
-        .distinct()[:limit]
+        UserProductStat.objects.filter(user=user)
+        .order_by("-last_ordered_at", "-order_count")
+        .values_list("product_id", flat=True)[:limit]
     )
     return list(product_ids)
+
+
+def menu_products_for_vendor(vendor):
+    """
+    محصولات قابل سفارش وندور، مرتب‌شده بر اساس محبوبیت و سپس sort_order (برای کیبورد منوی تلگرام).
+    """
+    return (
+        Product.objects.filter(vendor=vendor, is_active=True, is_available=True, is_available_today=True)
+        .select_related("popularity")
+        .order_by(F("popularity__order_count").desc(nulls_last=True), "sort_order", "id")
+    )
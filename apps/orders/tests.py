@@ -1,3 +1,215 @@
-from django.test import TestCase
+import io
+from datetime import timedelta
+from unittest.mock import patch
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from addresses.models import Address
+from catalog.models import OptionGroup, OptionItem, Product, ProductOptionGroup
+from orders.models import Order, OrderItem, UserProductStat, VendorProductPopularity
+from orders.pricing import PricingError, price_cart
+from orders.services import (
+    handle_order_status_change,
+    menu_products_for_vendor,
+    rebuild_product_popularity,
+    suggest_products_for_user,
+)
+from vendors.models import Vendor
+
+# شمارش کوئری‌ها فقط کوئری‌های کاتالوگ را بسنجد، نه خواندن از جدول کش
+LOCAL_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@patch("orders.services.telegram.dispatch_order_event")
+class ProductPopularityTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone="09120000000")
+        self.vendor = Vendor.objects.create(name="Kitchen", slug="kitchen")
+        self.address = Address.objects.create(user=self.user, full_text="Tehran")
+        self.kebab = Product.objects.create(vendor=self.vendor, name_fa="کباب", base_price=1000, sort_order=1)
+        self.pizza = Product.objects.create(vendor=self.vendor, name_fa="پیتزا", base_price=2000, sort_order=2)
+
+    def _order(self, *lines):
+        order = Order.objects.create(user=self.user, vendor=self.vendor, delivery_address=self.address)
+        for product, quantity in lines:
+            OrderItem.objects.create(
+                order=order,
+                product=product,
+                product_title_snapshot=product.name_fa,
+                unit_price_snapshot=product.base_price,
+                quantity=quantity,
+            )
+        return order
+
+    def _advance(self, order, *statuses):
+        for status in statuses:
+            order.status = status
+            order.save(update_fields=["status"])
+            handle_order_status_change(order)
+
+    def test_order_is_counted_once_across_status_changes(self, _dispatch):
+        order = self._order((self.pizza, 2), (self.pizza, 1))
+        self._advance(order, "PENDING_PAYMENT", "CONFIRMED", "PREPARING", "DELIVERED")
+
+        stat = UserProductStat.objects.get(user=self.user, product=self.pizza)
+        self.assertEqual((stat.order_count, stat.quantity_total), (1, 3))
+        popularity = VendorProductPopularity.objects.get(product=self.pizza)
+        self.assertEqual((popularity.vendor_id, popularity.order_count), (self.vendor.id, 1))
+        self.assertFalse(UserProductStat.objects.filter(product=self.kebab).exists())
+
+    def test_suggestions_and_menu_order_follow_precomputed_tables(self, _dispatch):
+        self._advance(self._order((self.kebab, 1)), "PLACED")
+        self._advance(self._order((self.pizza, 1)), "PLACED")
+        self._advance(self._order((self.pizza, 1)), "DELIVERED")
+
+        with self.assertNumQueries(1):
+            suggestions = suggest_products_for_user(self.user)
+        self.assertEqual(suggestions, [self.pizza.id, self.kebab.id])
+        self.assertEqual([p.id for p in menu_products_for_vendor(self.vendor)], [self.pizza.id, self.kebab.id])
+
+        UserProductStat.objects.all().delete()
+        VendorProductPopularity.objects.all().delete()
+        self.assertEqual(rebuild_product_popularity(), (2, 2))
+        self.assertEqual(VendorProductPopularity.objects.get(product=self.pizza).order_count, 2)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CartPricingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.vendor = Vendor.objects.create(name="Kitchen", slug="kitchen")
+        self.sandwich = Product.objects.create(vendor=self.vendor, name_fa="ساندویچ", base_price=100000)
+        self.cola = Product.objects.create(vendor=self.vendor, name_fa="نوشابه", base_price=20000)
+        sauce = OptionGroup.objects.create(vendor=self.vendor, name="سس", max_select=2)
+        self.ketchup = OptionItem.objects.create(group=sauce, name="کچاپ", price_delta_amount=5000)
+        ProductOptionGroup.objects.create(product=self.sandwich, group=sauce)
+        self.lines = [
+            {"product_id": self.sandwich.id, "quantity": 2, "modifiers": [{"group_id": sauce.id, "items": [{"id": self.ketchup.id}]}]},
+            {"product_id": self.cola.id, "quantity": 1},
+        ]
+
+    def test_prices_lines_in_fixed_queries_and_memoizes_per_catalog_version(self):
+        with self.assertNumQueries(3):
+            quote = price_cart(self.vendor.id, self.lines, delivery_fee=5000, cached=True)
+        self.assertEqual([line["line_total"] for line in quote["lines"]], [210000, 20000])
+        self.assertEqual((quote["subtotal"], quote["total"]), (230000, 235000))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(price_cart(self.vendor.id, self.lines, delivery_fee=5000, cached=True), quote)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ketchup.price_delta_amount = 7000
+            self.ketchup.save()
+        self.assertEqual(price_cart(self.vendor.id, self.lines, cached=True)["subtotal"], 234000)
+
+    def test_order_pricing_ignores_the_display_cache(self):
+        price_cart(self.vendor.id, self.lines, cached=True)
+        # تغییر قیمت بدون bump نسخه (مثلاً در پروسه دیگر پیش از رسیدن نسخه جدید)
+        OptionItem.objects.filter(pk=self.ketchup.pk).update(price_delta_amount=9000)
+
+        with self.assertNumQueries(3):
+            self.assertEqual(price_cart(self.vendor.id, self.lines)["subtotal"], 238000)
+        self.assertEqual(price_cart(self.vendor.id, self.lines, cached=True)["subtotal"], 230000)
+
+    def test_rejects_other_vendor_products(self):
+        other = Vendor.objects.create(name="Other", slug="other")
+        pizza = Product.objects.create(vendor=other, name_fa="پیتزا", base_price=1000)
+        with self.assertRaises(PricingError):
+            price_cart(self.vendor.id, [{"product_id": pizza.id, "quantity": 1}])
+
+    def test_quote_endpoint_uses_the_same_engine(self):
+        items = [{"product": line["product_id"], "quantity": line["quantity"], "modifiers": line.get("modifiers")} for line in self.lines]
+        response = self.client.post(
+            reverse("orders:cart-quote"), {"vendor": self.vendor.id, "items": items}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["total"], price_cart(self.vendor.id, self.lines, delivery_fee=response.json()["delivery_fee"])["total"])
+
+    @patch("orders.views.evaluate_vendor_serviceability", return_value=(True, "IN_ZONE", 5000, None, 100))
+    def test_quote_only_uses_the_callers_own_address(self, serviceability):
+        owner = User.objects.create_user(phone="09120000001")
+        other = User.objects.create_user(phone="09120000002")
+        address = Address.objects.create(user=owner, full_text="Tehran", latitude=35.7, longitude=51.4)
+        body = {"vendor": self.vendor.id, "items": [{"product": self.cola.id, "quantity": 1}], "address_id": address.id}
+
+        for caller in (None, other, owner):
+            client = APIClient()
+            client.force_authenticate(caller)
+            client.post(reverse("orders:cart-quote"), body, format="json")
+
+        coords = [call.args[1] for call in serviceability.call_args_list]
+        self.assertEqual(coords, [None, None, {"latitude": 35.7, "longitude": 51.4}])
+
+
+@patch("orders.services.telegram.dispatch_order_event")
+class PaymentReconciliationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone="09120000000")
+        self.vendor = Vendor.objects.create(name="Kitchen", slug="kitchen")
+        self.address = Address.objects.create(user=self.user, full_text="Tehran")
+
+    def _pending(self, track_id=None):
+        meta = {"payment": {"trackId": track_id}} if track_id else None
+        return Order.objects.create(
+            user=self.user,
+            vendor=self.vendor,
+            delivery_address=self.address,
+            placed_at=timezone.now() - timedelta(minutes=15),
+            meta=meta,
+        )
+
+    @patch("orders.reconciliation.payments.verify_track_id")
+    @patch("orders.reconciliation.payments.inquire_payment")
+    def test_confirms_paid_orders_before_cancelling_the_rest(self, inquire, verify, dispatch):
+        gateway = {"1": (100, 1), "2": (100, 2), "3": (100, 3), "4": None, "5": (203, None), "6": (102, None)}
+        inquire.side_effect = lambda track_id: (
+            {"result": gateway[track_id][0], "status": gateway[track_id][1]} if gateway[track_id] else None
+        )
+        verify.return_value = {"result": 100, "status": "PAID"}
+        paid, unverified, declined, unknown, no_track = (
+            self._pending("1"), self._pending("2"), self._pending("3"), self._pending("4"), self._pending()
+        )
+        invalid_track, merchant_error = self._pending("5"), self._pending("6")
+
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("cancel_unpaid_orders", "--batch-size", "2", "--concurrency", "2", stdout=out)
+
+        verify.assert_called_once_with("2")
+        statuses = {order.pk: Order.objects.get(pk=order.pk) for order in (paid, unverified, declined, unknown, no_track)}
+        self.assertEqual((statuses[paid.pk].status, statuses[paid.pk].payment_status), ("CONFIRMED", "PAID"))
+        self.assertEqual(statuses[unverified.pk].status, "CONFIRMED")
+        self.assertEqual(statuses[declined.pk].status, "CANCELLED")
+        self.assertEqual(statuses[no_track.pk].status, "CANCELLED")
+        # استعلام ناموفق: نه تایید، نه لغو؛ اجرای بعدی دوباره امتحان می‌کند
+        self.assertEqual(statuses[unknown.pk].status, "PENDING_PAYMENT")
+        # trackId نامعتبر قطعی است و لغو می‌شود؛ خطای پذیرنده نه
+        self.assertEqual(Order.objects.get(pk=invalid_track.pk).status, "CANCELLED")
+        self.assertEqual(Order.objects.get(pk=merchant_error.pk).status, "PENDING_PAYMENT")
+        self.assertIn("in 3 batch(es) of 2", out.getvalue())
+        self.assertIn("(rejected by gateway 1)", out.getvalue())
+        self.assertIn("Cancelled 3 unpaid orders.", out.getvalue())
+        events = [call.kwargs.get("event") for call in dispatch.call_args_list]
+        self.assertEqual(events.count("ORDER_PAYMENT_VERIFIED"), 2)
+
+    @patch("orders.management.commands.cancel_unpaid_orders.handle_order_status_change")
+    def test_does_not_cancel_an_order_paid_while_cancelling(self, status_change, dispatch):
+        orders = [self._pending(), self._pending()]
+
+        def pay_the_other(cancelled):
+            # callback درگاه سفارش دیگر وسط حلقه لغو می‌رسد
+            Order.objects.exclude(pk=cancelled.pk).update(status="CONFIRMED", payment_status="PAID")
+
+        status_change.side_effect = pay_the_other
+        out = io.StringIO()
+        call_command("cancel_unpaid_orders", "--skip-reconcile", stdout=out)
+
+        statuses = sorted(Order.objects.filter(pk__in=[o.pk for o in orders]).values_list("status", "payment_status"))
+        self.assertEqual(statuses, [("CANCELLED", "FAILED"), ("CONFIRMED", "PAID")])
+        self.assertIn("Cancelled 1 unpaid orders.", out.getvalue())
@@ -2,6 +2,7 @@ from rest_framework import routers
 
 from django.urls import path
 from orders.views import (
+    CartQuoteView,
     OrderDeliveryViewSet,
     OrderItemViewSet,
     OrderStatusHistoryViewSet,
@@ -20,4 +21,5 @@ router.register(r"order-status-history", OrderStatusHistoryViewSet)
 urlpatterns = router.urls
 urlpatterns += [
     path("serviceability/", ServiceabilityView.as_view(), name="serviceability"),
+    path("cart/quote/", CartQuoteView.as_view(), name="cart-quote"),
 ]
@@ -6,10 +6,12 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from addresses.models import Address
+from catalog.images import primary_image, variant_url
 from catalog.models import Product
 from integrations.services import payments
 from orders.models import Order, OrderDelivery, OrderItem, OrderStatusHistory
-from orders.modifiers import build_option_group_payload, normalize_modifiers
+from orders.modifiers import build_option_group_payload
+from orders.pricing import PricingError, price_cart, with_fees
 from orders.services import (
     ACTIVE_ORDER_STATUSES,
     evaluate_vendor_serviceability,
@@ -289,14 +291,10 @@ class OrderCreateSerializer(OrderSerializer):
         if not attrs.get("accept_terms"):
             raise serializers.ValidationError({"accept_terms": "پذیرش قوانین و شرایط الزامی است."})
 
-        for item in items:
-            product = item["product"]
-            try:
-                normalized_modifiers, modifier_unit_total = normalize_modifiers(product, item.get("modifiers"))
-            except ValueError as exc:
-                raise serializers.ValidationError({"items": str(exc)}) from exc
-            item["modifiers"] = normalized_modifiers
-            item["modifier_unit_total"] = modifier_unit_total
+        try:
+            attrs["pricing"] = price_cart(vendor.id, items)
+        except PricingError as exc:
+            raise serializers.ValidationError({"items": str(exc)}) from exc
 
         coords = attrs.get("customer_location")
         address = attrs.get("delivery_address")
@@ -318,7 +316,8 @@ class OrderCreateSerializer(OrderSerializer):
         return attrs
 
     def create(self, validated_data):
-        items = validated_data.pop("items", [])
+        validated_data.pop("items", [])
+        pricing = validated_data.pop("pricing")
         customer_location = validated_data.pop("customer_location", None)
         customer_phone = normalize_phone(validated_data.pop("customer_phone", ""))
         accept_terms = validated_data.pop("accept_terms", False)
@@ -371,30 +370,29 @@ class OrderCreateSerializer(OrderSerializer):
 
         order = Order.objects.create(**validated_data)
 
-        subtotal = 0
-        for item in items:
-            product = item["product"]
-            quantity = item.get("quantity") or 1
-            modifier_unit_total = item.get("modifier_unit_total") or 0
-            unit_price = product.base_price + modifier_unit_total
-            line_subtotal = unit_price * quantity
-            subtotal += line_subtotal
-
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                product_title_snapshot=product.name_fa,
-                unit_price_snapshot=unit_price,
-                quantity=quantity,
-                modifiers=item.get("modifiers"),
-                line_subtotal=line_subtotal,
-            )
+        OrderItem.objects.bulk_create(
+            [
+                OrderItem(
+                    order=order,
+                    product_id=line["product_id"],
+                    product_title_snapshot=line["title"],
+                    unit_price_snapshot=line["unit_price"],
+                    quantity=line["quantity"],
+                    modifiers=line["modifiers"],
+                    line_subtotal=line["line_total"],
+                )
+                for line in pricing["lines"]
+            ]
+        )
 
-        order.subtotal_amount = subtotal
-        discount_amount = order.discount_amount or 0
-        delivery_fee = order.delivery_fee_amount or 0
-        service_fee = order.service_fee_amount or 0
-        order.total_amount = subtotal - discount_amount + delivery_fee + service_fee
+        quote = with_fees(
+            pricing,
+            delivery_fee=order.delivery_fee_amount,
+            discount=order.discount_amount,
+            service_fee=order.service_fee_amount,
+        )
+        order.subtotal_amount = quote["subtotal"]
+        order.total_amount = quote["total"]
 
         meta = order.meta or {}
         meta = {**meta, "accept_terms": accept_terms, "delivery_type": delivery_type}
@@ -451,6 +449,7 @@ class VendorSummarySerializer(serializers.ModelSerializer):
 
 class ProductSummarySerializer(serializers.ModelSerializer):
     option_groups = serializers.SerializerMethodField()
+    image_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
@@ -464,6 +463,7 @@ class ProductSummarySerializer(serializers.ModelSerializer):
             "sort_order",
             "is_available",
             "is_available_today",
+            "image_url",
             "option_groups",
         ]
         read_only_fields = fields
@@ -471,6 +471,10 @@ class ProductSummarySerializer(serializers.ModelSerializer):
     def get_option_groups(self, obj):
         return build_option_group_payload(obj)
 
+    def get_image_url(self, obj):
+        # کارت منو فقط نسخه card را لازم دارد، نه تصویر اصلی
+        return variant_url(primary_image(obj), "card")
+
 
 class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.select_related("delivery").prefetch_related("items").order_by("-placed_at")
@@ -759,7 +763,7 @@ class ServiceabilityView(APIView):
 
         vendor_products = (
             Product.objects.filter(vendor=vendor, is_active=True, is_available=True, is_available_today=True)
-            .prefetch_related("product_option_groups__group__items")
+            .prefetch_related("product_option_groups__group__items", "images__media_asset")
             .order_by("sort_order", "id")
         )
 
@@ -793,3 +797,51 @@ class ServiceabilityView(APIView):
             }
 
         return Response(response, status=status.HTTP_200_OK)
+
+
+class CartQuoteItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+    modifiers = serializers.JSONField(required=False, allow_null=True)
+
+
+class CartQuoteSerializer(serializers.Serializer):
+    vendor = serializers.IntegerField()
+    items = CartQuoteItemSerializer(many=True, allow_empty=False)
+    location = CustomerLocationSerializer(required=False)
+    address_id = serializers.IntegerField(required=False)
+
+
+class CartQuoteView(APIView):
+    """
+    پیش‌فاکتور سبد با همان موتور قیمت‌گذاری ثبت سفارش (قیمت اقلام، هزینه ارسال و جمع کل).
+    """
+
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        serializer = CartQuoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        vendor = Vendor.objects.filter(id=data["vendor"], is_active=True, is_visible=True).first()
+        if not vendor:
+            return Response({"detail": "فروشنده یافت نشد."}, status=status.HTTP_404_NOT_FOUND)
+
+        coords = data.get("location")
+        # فقط آدرس‌های خود کاربر؛ مهمان نمی‌تواند با شناسه آدرس دیگران سرویس‌پذیری و هزینه ارسال را ببیند
+        if not coords and data.get("address_id") and request.user.is_authenticated:
+            address = Address.objects.filter(id=data["address_id"], user=request.user).first()
+            if address and address.latitude and address.longitude:
+                coords = {"latitude": float(address.latitude), "longitude": float(address.longitude)}
+
+        is_serviceable, delivery_type, delivery_fee, _, _ = evaluate_vendor_serviceability(vendor, coords)
+        try:
+            quote = price_cart(
+                vendor.id, data["items"], delivery_fee=delivery_fee if is_serviceable else 0, cached=True
+            )
+        except PricingError as exc:
+            return Response({"items": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        quote.update({"is_serviceable": bool(is_serviceable and delivery_type), "delivery_type": delivery_type})
+        return Response(quote, status=status.HTTP_200_OK)
@@ -109,6 +109,22 @@ DATABASES = {
         "PORT": os.getenv("POSTGRES_PORT", "5432"),
     }
 }
+
+# کش باید بین همه پروسه‌ها (workerهای وب، probe_providers، import کاتالوگ، ...) مشترک باشد:
+# نسخه کاتالوگ، قفل callback پرداخت، محدودکننده OTP و وضعیت ارائه‌دهنده‌ها در آن نگه داشته می‌شوند.
+# با REDIS_URL (نیازمند پکیج redis) از Redis و در غیر این صورت از جدول django_cache استفاده می‌شود
+# (یک بار manage.py createcachetable). کش درون‌پروسه‌ای (LocMem) در حالت غیر DEBUG خطای check می‌دهد.
+REDIS_URL = os.getenv("REDIS_URL", "")
+if REDIS_URL:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL}}
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": os.getenv("DJANGO_CACHE_TABLE", "django_cache"),
+        }
+    }
+
 AUTH_USER_MODEL = "accounts.User"
 
 
@@ -148,6 +164,9 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_URL = os.getenv("DJANGO_MEDIA_URL", "/media/")
+MEDIA_ROOT = os.getenv("DJANGO_MEDIA_ROOT", str(BASE_DIR / "media"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -165,6 +184,15 @@ REST_FRAMEWORK = {
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "8308528315:AAGlpyQCvHKgcmRX3KupA1Zr1dSFfTtNIDo")
 TELEGRAM_ADMIN_CHAT_ID = os.getenv("TELEGRAM_ADMIN_CHAT_ID", "316244055")
 TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "dfbdfok2-39gj238=g2h439g4jg=089jb")
+# آدرس Bot API؛ برای اجرا روی سرور محلی/fake قابل تغییر است
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org")
+# True: پردازش آپدیت داخل درخواست وبهوک (فقط توسعه). در غیر این صورت process_telegram_updates لازم است.
+TELEGRAM_WEBHOOK_INLINE = os.getenv("TELEGRAM_WEBHOOK_INLINE", "false").lower() == "true"
+TELEGRAM_UPDATE_WORKERS = int(os.getenv("TELEGRAM_UPDATE_WORKERS", "8"))
+TELEGRAM_UPDATE_DEDUP_TTL = int(os.getenv("TELEGRAM_UPDATE_DEDUP_TTL", str(24 * 3600)))  # ثانیه
+TELEGRAM_UPDATE_RETENTION_SECONDS = int(os.getenv("TELEGRAM_UPDATE_RETENTION_SECONDS", str(7 * 24 * 3600)))  # ثانیه
+# حداکثر ارسال هم‌زمان برای یک رویداد سفارش (فروشنده، ادمین، مشتری)
+TELEGRAM_ORDER_EVENT_FANOUT_WORKERS = int(os.getenv("TELEGRAM_ORDER_EVENT_FANOUT_WORKERS", "4"))
 SMS_REST_BASE_URL = os.getenv("SMS_REST_BASE_URL", "https://rest.payamak-panel.com")
 SMS_SOAP_BASE_URL = os.getenv("SMS_SOAP_BASE_URL", "https://api.payamak-panel.com")
 
@@ -182,6 +210,13 @@ PAYMENT_CALLBACK_SECRET = os.getenv("PAYMENT_CALLBACK_SECRET", "ascuinfbvw7vh-08
 PAYMENT_API_KEY = os.getenv("PAYMENT_API_KEY", "")
 PAYMENT_CALLBACK_URL = os.getenv("PAYMENT_CALLBACK_URL", "https://vaadeh.com/api/integrations/payments/callback/")
 PAYMENT_RETURN_URL = os.getenv("PAYMENT_RETURN_URL", "https://vaadeh.com/payment-result")
+# reconciliation پرداخت‌های معلق (قبل از cancel_unpaid_orders): اندازه batch، استعلام هم‌زمان و سقف زمان هر اجرا
+PAYMENT_RECONCILE_BATCH_SIZE = int(os.getenv("PAYMENT_RECONCILE_BATCH_SIZE", "50"))
+PAYMENT_RECONCILE_CONCURRENCY = int(os.getenv("PAYMENT_RECONCILE_CONCURRENCY", "4"))
+PAYMENT_RECONCILE_MAX_SECONDS = float(os.getenv("PAYMENT_RECONCILE_MAX_SECONDS", "60"))
+# ثبت همه درخواست‌های بیرونی (تلگرام، پیامک، پرداخت) در ExternalRequestLog؛ رکوردها بافر و هر چند ثانیه یکجا ذخیره می‌شوند
+EXTERNAL_REQUEST_LOG_ENABLED = os.getenv("EXTERNAL_REQUEST_LOG_ENABLED", "true").lower() == "true"
+EXTERNAL_REQUEST_LOG_FLUSH_SECONDS = float(os.getenv("EXTERNAL_REQUEST_LOG_FLUSH_SECONDS", "1"))
 
 
 
@@ -191,5 +226,33 @@ FRONTEND_BASE_URL = os.getenv("FRONTEND_BASE_URL", "")
 TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "https://vaadeh.com/api/integrations/telegram/webhook/dfbdfok2-39gj238=g2h439g4jg=089jb/")
 
 
+# تعداد worker ساخت نسخه‌های تصویر محصول (thumb/card/full) در build_image_variants؛ صفر یعنی پیش‌فرض ThreadPoolExecutor
+IMAGE_VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", "0")) or None
+
 SMS_OTP_BODY_ID = int("411750")
+# محدودکننده صدور OTP (token bucket): ظرفیت و ثانیه پر شدن هر توکن، به ازای شماره و به ازای IP
+OTP_PHONE_BURST = int(os.getenv("OTP_PHONE_BURST", "3"))
+OTP_PHONE_REFILL_SECONDS = int(os.getenv("OTP_PHONE_REFILL_SECONDS", "60"))
+OTP_IP_BURST = int(os.getenv("OTP_IP_BURST", "20"))
+OTP_IP_REFILL_SECONDS = int(os.getenv("OTP_IP_REFILL_SECONDS", "15"))
 SMS_MODE = "real"
+# مسیریاب پیامک: سقف کل زمان ارسال (با failover) و سقف هر تلاش، به ثانیه
+SMS_ROUTER_DEADLINE = float(os.getenv("SMS_ROUTER_DEADLINE", "8"))
+SMS_ROUTER_ATTEMPT_TIMEOUT = float(os.getenv("SMS_ROUTER_ATTEMPT_TIMEOUT", "3"))
+# صف پیامک اعلان سفارش: پنجره ادغام (ثانیه، صفر = ارسال فوری)، سقف اندازه batch و تعداد ارسال موازی
+SMS_BATCH_WINDOW_SECONDS = float(os.getenv("SMS_BATCH_WINDOW_SECONDS", "2"))
+SMS_BATCH_MAX_SIZE = int(os.getenv("SMS_BATCH_MAX_SIZE", "50"))
+SMS_BATCH_WORKERS = int(os.getenv("SMS_BATCH_WORKERS", "4"))
+# probe_providers: اعتبار پنل پیامک کمتر از این مقدار یعنی DEGRADED
+SMS_LOW_CREDIT_THRESHOLD = float(os.getenv("SMS_LOW_CREDIT_THRESHOLD", "0"))
+# کلاینت HTTP مشترک سرویس‌های بیرونی: اندازه pool هر میزبان، connect timeout، عمر کش IntegrationEndpoint
+# و قطع‌کننده مدار (تعداد خطای پشت سر هم و ثانیه تا درخواست آزمایشی)
+OUTBOUND_POOL_SIZE = int(os.getenv("OUTBOUND_POOL_SIZE", "32"))
+OUTBOUND_CONNECT_TIMEOUT = float(os.getenv("OUTBOUND_CONNECT_TIMEOUT", "3"))
+OUTBOUND_CONFIG_TTL_SECONDS = float(os.getenv("OUTBOUND_CONFIG_TTL_SECONDS", "60"))
+OUTBOUND_BREAKER_FAILURES = int(os.getenv("OUTBOUND_BREAKER_FAILURES", "5"))
+OUTBOUND_BREAKER_RESET_SECONDS = float(os.getenv("OUTBOUND_BREAKER_RESET_SECONDS", "30"))
+OUTBOUND_RETRY_BACKOFF = float(os.getenv("OUTBOUND_RETRY_BACKOFF", "0.3"))
+# run_notification_workers: تعداد کل تلاش هر اعلان و فاصله پایه تلاش مجدد (دو برابر در هر تلاش)، به ثانیه
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "3"))
+NOTIFICATION_RETRY_SECONDS = float(os.getenv("NOTIFICATION_RETRY_SECONDS", "30"))